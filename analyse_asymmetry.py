@@ -2,11 +2,11 @@
 analyse_asymmetry.py
 
 This code generetes 1D and 2D histograms representing the asymmetry distribution in the bins across the phase space.
-The year of interest and size of the data to be analysed must be specified using the required flags --year --size. The flag --raw is used to set whether the asymmetry being analysed is raw or not, so that the output can be formatted accordingly. There also are the flags --input and --path which are not required. These are used to specify the directory where the input data is located and where the output file should be written, respectively. By default it is set to be the current working directory.
+The year of interest and size of the data to be analysed must be specified using the required flags --year --size. The flag --raw is used to set whether the asymmetry being analysed is raw or not, so that the output can be formatted accordingly. There also are the flags --input --path and --bin_path which are not required. These are used to specify the directory where the input data is located, where the output file should be written and where the binning scheme can be found, respectively. By default it is set to be the current working directory.
 It outputs the .pdf files containing the plots generated.
 
 Author: Marc Oriol Pérez (marc.oriolperez@student.manchester.ac.uk)
-Last edited: 16th September 2023
+Last edited: 17th October 2026
 """
 
 import matplotlib.pyplot as plt
@@ -15,6 +15,7 @@ import os
 import argparse
 import numpy as np
 import seaborn as sns
+from binning_scheme import load_scheme, bin_names, scheme_grid
 
 def parse_arguments():
     '''
@@ -23,12 +24,15 @@ def parse_arguments():
     --year      Used to specify the year at which the data was taken the user is interested in.
                 The argument must be one of: [16, 17, 18]. These referr to 2016, 2017 & 2018, respectively.
     --size      Used to specify the amount of events the user is interested in analysing.
-                The argument must be one of: [large, small, medium, 1-8]. The integers specify the number of root
+                The argument must be one of: [large, small, medium, all, 1-8]. The integers specify the number of root
                 files to be read in. Large is equivalent to 8. Medium is equivalent to 4. Small takes 200000 events.
+                All takes every file available in the production directories.
     --path      Used to specify the directory in which the output files should be written. It is not required,
                 in the case it is not specified, the default path is the current working directory.
     --input     Used to specify the directory in which the input data should be found. It is not required,
                 in the case it is not specified, the default path is the current working directory.
+    --bin_path  Used to specify the directory in which the binning scheme should be found. It is not required,
+                in the case it is not specified, the default path is the current working directory.
     --raw       Used to specify wheteher the asymmetry values cores pond to the raw asymmetry or not.
                 Must be either y/Y or n/N
                 
@@ -45,7 +49,7 @@ def parse_arguments():
     parser.add_argument(
         "--size",
         type=str,
-        choices=["large", "medium", "small", "1", "2", "3", "4", "5", "6", "7", "8"],
+        choices=["large", "medium", "small", "all", "1", "2", "3", "4", "5", "6", "7", "8"],
         required=True,
         help="flag to set the data taking year."
     )
@@ -63,6 +67,13 @@ def parse_arguments():
         default=os.getcwd(),
         help="flag to set the path where the input data should be found"
     )
+    parser.add_argument(
+        "--bin_path",
+        type=dir_path,
+        required=False,
+        default=os.getcwd(),
+        help="flag to set the path where the binning scheme should be found"
+    )
     parser.add_argument(
         "--raw",
         type=str,
@@ -111,8 +122,7 @@ def integrated_asym(val, err):
     return weighted_mean, uncertainty
 
 def plot_2Dhistogram(val, text):
-    length = int(np.sqrt(len(val)))
-    data = np.asarray(val).reshape(length, length)
+    data = scheme_grid(scheme, val)
     sns.set()
     ax2 = sns.heatmap(data, vmax=0, vmin=-2.5, annot=True, annot_kws={'size': 8}, cmap ='YlOrBr_r')
     
@@ -128,6 +138,7 @@ def plot_2Dhistogram(val, text):
 # - - - - - - - MAIN BODY - - - - - - - #
 
 args = parse_arguments()
+scheme = load_scheme(args.bin_path, args.year, args.size)
 if args.raw=="y" or args.raw=="Y":
     text="Raw "
 else:
@@ -135,13 +146,11 @@ else:
     
 asym_val = np.empty(0)
 asym_err = np.empty(0)
-for j in range(0, 10):
-    for i in range(0, 10):
-        index = f"{j}" + f"{i}"
-        array = np.loadtxt(f"{args.input}/asymmetries_{args.year}_{args.size}_bin{index}.txt")
-        asym_val = np.append(asym_val, array[0])
-        asym_err = np.append(asym_err, array[1])
-        dataset = 0
+for index in bin_names(scheme):
+    array = np.loadtxt(f"{args.input}/asymmetries_{args.year}_{args.size}_bin{index}.txt")
+    asym_val = np.append(asym_val, array[0])
+    asym_err = np.append(asym_err, array[1])
+    dataset = 0
 
 integrated = integrated_asym(asym_val , asym_err)
 print(f"The integrated raw asymmetry is: {integrated[0]} +/- {integrated[1]}") 
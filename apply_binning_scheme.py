@@ -1,21 +1,24 @@
 """
 apply_binning_scheme.py
 
-This code applies the given binning scheme to a set of data, and generates root files cotaining the events in each bin.
-The year of interest, size of the data, polarity and meson to be analysed must be specified using the required flags --year --size --polarity --meson. There also are the flags --input --path and --bin_path, which are not required. These are used to specify the directory where the input data is located, where the binning scheme can be found and where the output file should be written, respectively. By default it is set to be the current working directory.
-It outputs the root files with the events in each individual bin, as well as a txt file with the number of events in each bin.
+This code applies the given binning scheme to a set of data, and generates a root file cotaining the events of all the bins, ordered by bin.
+The year of interest, size of the data, polarity and meson to be analysed must be specified using the required flags --year --size --polarity --meson. Several polarities and mesons can be given, in which case every combination of them is processed in a single run: the binning scheme is read once, the clean data of each polarity is read once for all the mesons, and each polarity is processed in its own process if the optional flag --workers is given. The output is the same as when each combination is processed in its own run. There also are the flags --input --path and --bin_path, which are not required. These are used to specify the directory where the input data is located, where the binning scheme can be found and where the output file should be written, respectively. By default it is set to be the current working directory.
+The bin of each event is found in a single pass over the data, and the events are then grouped by bin with a single sort (see assign_bins and group_bins in binning_scheme.py).
+It outputs a single file with the events ordered by bin, in the order of the bins in the binning scheme (see binning_scheme.py), together with a bin offsets index holding the range of entries of each bin, so that any bin can be read on its own as a contiguous range (see read_data in data_io.py). It also outputs a txt file with the number of events in each bin. The optional flags --format and --compression can be used to write Arrow or Parquet files instead (see data_io.py).
 
 Author: Marc Oriol Pérez (marc.oriolperez@student.manchester.ac.uk)
-Last edited: 15th September 2023
+Last edited: 17th October 2026
 """
 
 # - - - - - - IMPORT STATEMENTS - - - - - - #
 import os
 import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-import uproot
-import pandas as pd
-import awkward as ak
+from branches import stage_branches
+from data_io import EXTENSIONS, check_format, read_data, read_offsets, write_data
+from binning_scheme import load_scheme, assign_bins, group_bins
 
 
 # - - - - - - - FUNCTIONS - - - - - - - #
@@ -27,18 +30,29 @@ def parse_arguments():
     --year      Used to specify the year at which the data was taken the user is interested in.
                 The argument must be one of: [16, 17, 18]. These referr to 2016, 2017 & 2018, respectively.
     --size      Used to specify the amount of events the user is interested in analysing.
-                The argument must be one of: [large, small, medium, 1-8]. The integers specify the number of root
+                The argument must be one of: [large, small, medium, all, 1-8]. The integers specify the number of root
                 files to be read in. Large is equivalent to 8. Medium is equivalent to 4. Small takes 200000 events.
+                All takes every file available in the production directories.
     --polarity  Used to specify the polarity of the magnet the user is interested in.
-                The argument must be one of: [up, down].
+                The argument must be one or more of: [up, down].
     --meson     Used to specify the meson the user is interested in.
-                The argument must be one of: [D0, D0bar, both].
+                The argument must be one or more of: [D0, D0bar, both].
     --path      Used to specify the directory in which the output files should be written. It is not required,
                 in the case it is not specified, the default path is the current working directory.
     --input     Used to specify the directory in which the input data should be found. It is not required,
                 in the case it is not specified, the default path is the current working directory.
     --bin_path  Used to specify the directory in which the binning scheme should be found. It is not required,
                 in the case it is not specified, the default path is the current working directory.
+    --format    Used to specify the format of the output files. The argument must be one of: [root, arrow, parquet].
+                It is not required, in the case it is not specified, root files are written. Note that fit_global.py
+                and model_fitting.py can only read root files.
+    --compression
+                Used to specify the compression of the output files. It is not required, in the case it is not
+                specified, the default compression of the format is used. See COMPRESSIONS in data_io.py for the
+                compressions available in each format.
+    --workers   Used to specify the number of worker processes. If it is larger than 1, each polarity is read and
+                binned in a separate process. It is not required, in the case it is not specified, the
+                polarities are processed one after another.
     
     Returns the parsed arguments.
     '''
@@ -53,13 +67,14 @@ def parse_arguments():
     parser.add_argument(
         "--size",
         type=str,
-        choices=["large", "medium", "small", "1", "2", "3", "4", "5", "6", "7", "8"],
+        choices=["large", "medium", "small", "all", "1", "2", "3", "4", "5", "6", "7", "8"],
         required=True,
         help="flag to set the data taking year."
     )
     parser.add_argument(
         "--polarity",
         type=str,
+        nargs="+",
         choices=["up","down"],
         required=True,
         help="flag to set the data taking polarity."
@@ -67,6 +82,7 @@ def parse_arguments():
     parser.add_argument(
         "--meson",
         type=str,
+        nargs="+",
         choices=["D0","D0bar","both"],
         required=True,
         help="flag to set the D0 meson flavour."
@@ -92,6 +108,28 @@ def parse_arguments():
         default=os.getcwd(),
         help="flag to set the path where the binning scheme should be found"
     )
+    parser.add_argument(
+        "--format",
+        type=str,
+        choices=list(EXTENSIONS),
+        required=False,
+        default="root",
+        help="flag to set the format of the output files (root/arrow/parquet)"
+    )
+    parser.add_argument(
+        "--compression",
+        type=str,
+        required=False,
+        default=None,
+        help="flag to set the compression of the output files"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        required=False,
+        default=1,
+        help="flag to set the number of worker processes"
+    )
     return parser.parse_args()
 
 def dir_path(string):
@@ -103,46 +141,61 @@ def dir_path(string):
         return string
     else:
         raise NotADirectoryError(string)
-        
-# - - - - - - - MAIN BODY - - - - - - - #
 
-args = parse_arguments()
+def bin_polarity(polarity):
+    '''
+    Reads the clean data of the given polarity once, finds the bin of each event, and writes the binned data of
+    each of the mesons requested, with the number of events in each bin. If a single meson is requested, only
+    its events are read, as they are stored together in the clean data.
 
-# import data
-tree_name = "D02Kpi_Tuple/DecayTree"
-if args.meson=="both":
-    data = uproot.concatenate(f"{args.input}/{args.polarity}_data_{args.year}_{args.size}_clean.root:{tree_name}")
-else:
-    data = uproot.concatenate(f"{args.input}/{args.meson}_{args.polarity}_data_{args.year}_{args.size}_clean.root:{tree_name}")
+    Returns the polarity.
+    '''
+    filename = f"{args.input}/{polarity}_data_{args.year}_{args.size}_clean"
+    # the files written here are read by model_fitting.py, so its variables are kept as well
+    variables = stage_branches("apply_binning_scheme", "model_fitting")
+    if len(args.meson) == 1 and args.meson[0] != "both":
+        data = read_data(filename, expressions=variables, flavour=args.meson[0])
+        ranges = {args.meson[0]: [0, len(data)]}
+    else:
+        data = read_data(filename, expressions=variables)
+        ranges = {"both": [0, len(data)]}
+        if args.meson != ["both"]:
+            offsets = read_offsets(filename)
+            if offsets is None:
+                raise ValueError(f"{filename} has no offsets index, so the events of each meson cannot be found")
+            ranges.update(offsets)
+    bins = assign_bins(scheme, data["D0_PT"], data["D0_ETA"])
 
-bins = np.loadtxt(f"{args.bin_path}/{args.year}_{args.size}_bins.txt", delimiter=',')                          
-# select particles with pT below 10 GeV/c
-nevents=np.empty(0)
-length = len(data["D0_PT"])
+    for meson in args.meson:
+        start, stop = ranges[meson]
+        # order the events by bin, so that the events of each bin are contiguous
+        order, offsets = group_bins(bins[start:stop], len(scheme["bins"]))
+        bin_offsets = {scheme_bin["name"]: [int(offsets[index]), int(offsets[index+1])] for index, scheme_bin in enumerate(scheme["bins"])}
 
-# iterate through all bins
-for i in np.arange(0, 10):
-    pT_mask = np.ones(length)
-    pT_mask = np.logical_and(pT_mask, data["D0_PT"]>bins[0,i])
-    pT_mask = np.logical_and(pT_mask, data["D0_PT"]<=bins[0,i+1])
-    for j in np.arange(0,10):
-        eta_mask = pT_mask
-        eta_mask = np.logical_and(eta_mask, data["D0_ETA"]>bins[i+1,j])
-        eta_mask = np.logical_and(eta_mask, data["D0_ETA"]<=bins[i+1,j+1])
-        selected_data = data[eta_mask]
-        nevents = np.append(nevents, len(selected_data["D0_PT"]))
-        # Write out bin
-        if args.meson=="both":
-            out_file_name = f"{args.path}/{args.polarity}_{args.year}_{args.size}_bin{j}{i}.root"
+        # write out all the bins to a single file, with the range of entries of each of them
+        if meson=="both":
+            out_file_name = f"{args.path}/{polarity}_{args.year}_{args.size}_binned"
         else:
-            out_file_name = f"{args.path}/{args.meson}_{args.polarity}_{args.year}_{args.size}_bin{j}{i}.root"
-        out_tree = "D02Kpi_Tuple/DecayTree"
-        print(f"Writing to {out_file_name}...")
-        out_file = uproot.recreate(out_file_name)
-        branches = {column: ak.type(selected_data[column]) for column in selected_data.fields}
-        out_file.mktree(out_tree, branches)
-        out_file[out_tree].extend({branch: selected_data[branch] for branch in branches.keys()})
-        out_file.close()
+            out_file_name = f"{args.path}/{meson}_{polarity}_{args.year}_{args.size}_binned"
+        write_data(out_file_name, data[start:stop][order], args.format, args.compression, bin_offsets, "bin")
 
-# write out number of events in each bin
-np.savetxt(f"{args.bin_path}/number_of_events_{args.meson}_{args.polarity}_{args.year}_{args.size}.txt", nevents, delimiter=',')
\ No newline at end of file
+        # write out number of events in each bin
+        np.savetxt(f"{args.bin_path}/number_of_events_{meson}_{polarity}_{args.year}_{args.size}.txt", np.diff(offsets), delimiter=',')
+    
+    return polarity
+        
+# - - - - - - - MAIN BODY - - - - - - - #
+
+args = parse_arguments()
+check_format(args.format, args.compression)
+
+scheme = load_scheme(args.bin_path, args.year, args.size)
+
+if args.workers > 1:
+    # the workers are forked so that they inherit the parsed arguments and the binning scheme
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("fork")) as executor:
+        for polarity in executor.map(bin_polarity, args.polarity):
+            print(f"checkpoint: the {polarity} data has been binned")
+else:
+    for polarity in map(bin_polarity, args.polarity):
+        print(f"checkpoint: the {polarity} data has been binned")
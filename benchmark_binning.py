@@ -0,0 +1,157 @@
+"""
+benchmark_binning.py
+
+This code compares the time taken to split the events into the bins of the binning scheme by apply_binning_scheme.py, using a boolean mask for each set of transverse momentum and each bin (as it was done originally) and using a single pass over the events to find the bin of each of them followed by a single sort (see assign_bins and group_bins in binning_scheme.py). It does so on randomly generated events with the branches kept by apply_binning_scheme.py, so no input files are needed.
+The number of events, the number of sets of each variable in the binning scheme and the number of times each measurement is repeated can be specified using the flags --events --nbins --repeats, which are not required. By default 10 million events are generated, the binning scheme has 10 sets of each variable and each measurement is repeated 3 times.
+It outputs to the screen the best time obtained with each method and checks that both of them give exactly the same events in each bin. Nothing is written to disk.
+
+Author: Marc Oriol Pérez (marc.oriolperez@student.manchester.ac.uk)
+Last edited: 17th October 2026
+"""
+
+# - - - - - - IMPORT STATEMENTS - - - - - - #
+
+import argparse
+import time
+import numpy as np
+import awkward as ak
+from branches import stage_branches
+from binning_scheme import build_scheme, assign_bins, group_bins
+
+# - - - - - - - FUNCTIONS - - - - - - - #
+
+def parse_arguments():
+    '''
+    Parses the arguments needed along the code. Arguments:
+
+    --events    Used to specify the number of events to be generated. It is not required, in the case it is not
+                specified, 10000000 events are generated.
+    --nbins     Used to specify the number of sets of transverse momentum, and of pseudorapidity within each of
+                them, in the binning scheme. It is not required, in the case it is not specified, it is 10.
+    --repeats   Used to specify the number of times each measurement is repeated. It is not required, in the
+                case it is not specified, each measurement is repeated 3 times.
+
+    Returns the parsed arguments.
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--events",
+        type=int,
+        required=False,
+        default=10000000,
+        help="flag to set the number of events to be generated"
+    )
+    parser.add_argument(
+        "--nbins",
+        type=int,
+        required=False,
+        default=10,
+        help="flag to set the number of sets of each variable in the binning scheme"
+    )
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        required=False,
+        default=3,
+        help="flag to set the number of times each measurement is repeated"
+    )
+    return parser.parse_args()
+
+def generate_data(length):
+    '''
+    Generates random values for the branches kept by apply_binning_scheme.py.
+
+    Returns an awkward array of records.
+    '''
+    rng = np.random.default_rng(482022)
+    columns = {
+        "D0_PT": rng.gamma(3, 1200, length),
+        "D0_ETA": rng.uniform(2, 5, length),
+        "D0_MM": rng.normal(1865, 7, length),
+    }
+    return ak.zip({branch: columns[branch] for branch in stage_branches("apply_binning_scheme", "model_fitting")}, depth_limit=1)
+
+def generate_scheme(data, nbins):
+    '''
+    Builds a binning scheme with nbins sets of transverse momentum (below 10 GeV/c) and of pseudorapidity within
+    each of them, each with the same number of events, as done by create_binning_scheme.py.
+
+    Returns the scheme.
+    '''
+    pT = np.asarray(data["D0_PT"])
+    eta = np.asarray(data["D0_ETA"])
+    mask = pT < 10000
+    pT_edges = np.quantile(pT[mask], np.linspace(0, 1, nbins+1))
+    eta_edges = []
+    for i in range(nbins):
+        in_set = mask & (pT > pT_edges[i]) & (pT <= pT_edges[i+1])
+        eta_edges.append(np.quantile(eta[in_set], np.linspace(0, 1, nbins+1)))
+    return build_scheme(pT_edges, eta_edges)
+
+def mask_binning(data, scheme):
+    '''
+    Splits the events into bins as done originally in apply_binning_scheme.py, building a mask over all the
+    events for each set of transverse momentum and for each bin.
+
+    Returns the list of the events in each bin, and the number of events in each bin.
+    '''
+    bins = []
+    nevents = np.empty(0)
+    length = len(data["D0_PT"])
+    for i, eta_edges in enumerate(scheme["eta_edges"]):
+        pT_mask = np.ones(length)
+        pT_mask = np.logical_and(pT_mask, data["D0_PT"]>scheme["pT_edges"][i])
+        pT_mask = np.logical_and(pT_mask, data["D0_PT"]<=scheme["pT_edges"][i+1])
+        for j in range(len(eta_edges)-1):
+            eta_mask = pT_mask
+            eta_mask = np.logical_and(eta_mask, data["D0_ETA"]>eta_edges[j])
+            eta_mask = np.logical_and(eta_mask, data["D0_ETA"]<=eta_edges[j+1])
+            selected_data = data[eta_mask]
+            nevents = np.append(nevents, len(selected_data["D0_PT"]))
+            bins.append(selected_data)
+    return bins, nevents
+
+def sorted_binning(data, scheme):
+    '''
+    Splits the events into bins as done by apply_binning_scheme.py, finding the bin of each event in a single
+    pass and grouping them with a single sort.
+
+    Returns the list of the events in each bin, and the number of events in each bin.
+    '''
+    order, offsets = group_bins(assign_bins(scheme, data["D0_PT"], data["D0_ETA"]), len(scheme["bins"]))
+    data = data[order]
+    return [data[offsets[k]:offsets[k+1]] for k in range(len(scheme["bins"]))], np.diff(offsets)
+
+def measure(function, data, scheme, repeats):
+    '''
+    Runs the given binning function the given number of times.
+
+    Returns the best time and the result of the last run.
+    '''
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        result = function(data, scheme)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+# - - - - - - - MAIN BODY - - - - - - - #
+
+args = parse_arguments()
+
+data = generate_data(args.events)
+scheme = generate_scheme(data, args.nbins)
+print(f"Generated {args.events} events and a binning scheme with {len(scheme['bins'])} bins")
+
+mask_time, (mask_bins, mask_nevents) = measure(mask_binning, data, scheme, args.repeats)
+sorted_time, (sorted_bins, sorted_nevents) = measure(sorted_binning, data, scheme, args.repeats)
+
+same = np.array_equal(mask_nevents, sorted_nevents)
+for mask_bin, sorted_bin in zip(mask_bins, sorted_bins):
+    same = same and all(np.array_equal(np.asarray(mask_bin[branch]), np.asarray(sorted_bin[branch])) for branch in data.fields)
+
+print(f"{'method':>8} {'time [s]':>9} {'events/s':>12}")
+print(f"{'masks':>8} {mask_time:>9.3f} {args.events/mask_time:>12.3g}")
+print(f"{'sorted':>8} {sorted_time:>9.3f} {args.events/sorted_time:>12.3g}")
+print(f"Speed-up: {mask_time/sorted_time:.1f}x")
+print(f"Both methods give the same events in each bin: {same}")
@@ -0,0 +1,136 @@
+"""
+benchmark_fit_backends.py
+
+This code compares the ways in which the likelihood can be evaluated in the fits (see fit_backends.py) on the global unbinned fit. It runs fit_global.py once for each backend, with and without offsetting the likelihood, on the clean data written by select_and_clean.py, measuring the wall time of each run, and compares the parameters obtained with those of the first run.
+The year of interest and size of the data must be specified using the required flags --year --size. There also are the flags --input --backends --num_cpu, which are not required. These are used to specify the directory where the clean data is located, the backends to be compared and the number of processes used by the numcpu backend. By default the clean data is taken from the current working directory, all the backends are compared and the numcpu backend uses all the cores available.
+It outputs to the screen the time taken by each run of fit_global.py and the largest difference of the parameters with respect to the first run, relative to their value. Below each of them, it outputs each run of the fit as written to the fit log by fit_global.py: the backend actually used (as the codegen backend falls back to the cpu one if the model is not supported), how the gradient is obtained, the number of evaluations of the likelihood (only known with the codegen backend, which fit_global.py is asked to run both with its analytic gradient and with finite differences, so the time of its run includes both), the time taken by the fit itself and the minimum of the likelihood. The output of fit_global.py is written to a temporary directory, which is removed at the end.
+
+Author: Marc Oriol Pérez (marc.oriolperez@student.manchester.ac.uk)
+Last edited: 17th October 2026
+"""
+
+# - - - - - - IMPORT STATEMENTS - - - - - - #
+
+import os
+import sys
+import argparse
+import subprocess
+import tempfile
+import time
+import numpy as np
+from fit_backends import FIT_BACKENDS, read_fit_log
+
+# - - - - - - - CONSTANTS - - - - - - - #
+
+# parameters written by fit_global.py, in order
+PARAMETERS = ["mean", "sigma", "Csig", "aL", "nL", "aR", "nR", "a0", "frac_D0_down", "frac_D0_up", "frac_D0bar_down", "frac_D0bar_up", "Nsig_D0_down", "Nbkg_D0_down", "Nsig_D0_up", "Nbkg_D0_up", "Nsig_D0bar_down", "Nbkg_D0bar_down", "Nsig_D0bar_up", "Nbkg_D0bar_up"]
+
+# - - - - - - - FUNCTIONS - - - - - - - #
+
+def dir_path(string):
+    '''
+    Checks if a given string is the path to a directory.
+    If affirmative, returns the string. If negative, gives an error.
+    '''
+    if os.path.isdir(string):
+        return string
+    else:
+        raise NotADirectoryError(string)
+
+def parse_arguments():
+    '''
+    Parses the arguments needed along the code. Arguments:
+
+    --year      Used to specify the year at which the data was taken the user is interested in.
+                The argument must be one of: [16, 17, 18]. These referr to 2016, 2017 & 2018, respectively.
+    --size      Used to specify the amount of events the user is interested in analysing.
+                The argument must be one of: [large, small, medium, all, 1-8]. The integers specify the number of root
+                files to be read in. Large is equivalent to 8. Medium is equivalent to 4. Small takes 200000 events.
+                All takes every file available in the production directories.
+    --input     Used to specify the directory in which the clean data should be found. It is not required,
+                in the case it is not specified, the default path is the current working directory.
+    --backends  Used to specify the backends to be compared. The argument must be one or more of: [default, legacy,
+                cpu, numcpu, codegen]. It is not required, in the case it is not specified, all of them are compared.
+    --num_cpu   Used to specify the number of processes used by the numcpu backend. It is not required, in the case
+                it is not specified, the number of cores available is used.
+
+    Returns the parsed arguments.
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--year",
+        type=int,
+        choices=[16,17,18],
+        required=True,
+        help="flag to set the data taking year."
+    )
+    parser.add_argument(
+        "--size",
+        type=str,
+        choices=["large", "medium", "small", "all", "1", "2", "3", "4", "5", "6", "7", "8"],
+        required=True,
+        help="flag to set the data taking year."
+    )
+    parser.add_argument(
+        "--input",
+        type=dir_path,
+        required=False,
+        default=os.getcwd(),
+        help="flag to set the path where the clean data should be found"
+    )
+    parser.add_argument(
+        "--backends",
+        type=str,
+        nargs="+",
+        choices=FIT_BACKENDS,
+        required=False,
+        default=FIT_BACKENDS,
+        help="flag to set the backends to be compared"
+    )
+    parser.add_argument(
+        "--num_cpu",
+        type=int,
+        required=False,
+        default=None,
+        help="flag to set the number of processes used by the numcpu fit backend"
+    )
+    return parser.parse_args()
+
+def run_fit(backend, offset, directory):
+    '''
+    Runs the global unbinned fit with the given backend, offsetting the likelihood if offset is y, writing its
+    output to the given directory.
+
+    Returns the wall time taken, the parameters obtained and the runs of the fit in the fit log (see read_fit_log in
+    fit_backends.py).
+    '''
+    command = [sys.executable, "fit_global.py", "--year", str(args.year), "--size", args.size, "--input", args.input, "--path", directory, "--binned_fit", "n", "--fit_backend", backend, "--offset", offset]
+    if args.num_cpu is not None:
+        command += ["--num_cpu", str(args.num_cpu)]
+    if backend == "codegen":
+        command += ["--compare_gradient", "y"]
+    start = time.perf_counter()
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL, cwd=os.path.dirname(os.path.abspath(__file__)))
+    wall_time = time.perf_counter() - start
+    return wall_time, np.loadtxt(f"{directory}/fit_parameters.txt", delimiter=','), read_fit_log(f"{directory}/fit_log.txt")
+
+# - - - - - - - MAIN BODY - - - - - - - #
+
+args = parse_arguments()
+
+results = {}
+with tempfile.TemporaryDirectory() as directory:
+    for backend in args.backends:
+        for offset in ["n", "y"]:
+            results[(backend, offset)] = run_fit(backend, offset, directory)
+            print(f"checkpoint: the fit with the {backend} backend (offset {offset}) has been completed")
+
+reference = next(iter(results.values()))[1]
+print(f"{'backend':>8} {'offset':>6} {'time [s]':>9} {'max rel. diff':>14} {'parameter':>16}")
+print(f"{'':>8} {'used':>8} {'gradient':>10} {'fit [s]':>8} {'NLL calls':>10} {'min NLL':>16}")
+for (backend, offset), (wall_time, parameters, runs) in results.items():
+    differences = np.abs(parameters - reference)/np.maximum(np.abs(reference), 1e-12)
+    print(f"{backend:>8} {offset:>6} {wall_time:>9.2f} {differences.max():>14.2e} {PARAMETERS[np.argmax(differences)]:>16}")
+    for run in runs:
+        nll_calls = "n/a" if run["nll_calls"] is None else run["nll_calls"]
+        print(f"{'':>8} {run['backend']:>8} {run['gradient']:>10} {run['wall_time']:>8.2f} {nll_calls:>10} {run['min_nll']:>16.6f}")
@@ -0,0 +1,166 @@
+"""
+benchmark_fit_engines.py
+
+This code checks that the local fits performed with NumPy and iminuit (see mass_fit.py) give the same result as the ones performed with RooFit. It runs model_fitting.py once with each engine on the events of a single bin of the binning scheme, measuring the wall time of each run, and compares the yields of the signal and background and their errors.
+The year of interest, size of the data, meson, polarity and bin to be fitted must be specified using the required flags --year --size --meson --polarity --bin. There also are the flags --input --parameters_path --binned_fit --tolerance, which are not required. These are used to specify the directory where the binned data is located, where the global best-fit parameters can be found, whether the fit is binned and the largest relative difference allowed between the results of both engines. By default the data and parameters are taken from the current working directory, an unbinned fit is performed and the results must agree to 0.5%.
+It outputs to the screen the time taken by each run and the relative difference of each result, and gives an error if any of them is larger than the tolerance. The output of model_fitting.py is written to a temporary directory, which is removed at the end.
+
+Author: Marc Oriol Pérez (marc.oriolperez@student.manchester.ac.uk)
+Last edited: 17th October 2026
+"""
+
+# - - - - - - IMPORT STATEMENTS - - - - - - #
+
+import os
+import sys
+import argparse
+import subprocess
+import tempfile
+import time
+import numpy as np
+
+# - - - - - - - CONSTANTS - - - - - - - #
+
+# results written by model_fitting.py which are compared, in order
+RESULTS = ["Nsig", "Nsig_error", "Nbkg", "Nbkg_error"]
+
+# - - - - - - - FUNCTIONS - - - - - - - #
+
+def dir_path(string):
+    '''
+    Checks if a given string is the path to a directory.
+    If affirmative, returns the string. If negative, gives an error.
+    '''
+    if os.path.isdir(string):
+        return string
+    else:
+        raise NotADirectoryError(string)
+
+def parse_arguments():
+    '''
+    Parses the arguments needed along the code. Arguments:
+
+    --year      Used to specify the year at which the data was taken the user is interested in.
+                The argument must be one of: [16, 17, 18]. These referr to 2016, 2017 & 2018, respectively.
+    --size      Used to specify the amount of events the user is interested in analysing.
+                The argument must be one of: [large, small, medium, all, 1-8]. The integers specify the number of root
+                files to be read in. Large is equivalent to 8. Medium is equivalent to 4. Small takes 200000 events.
+                All takes every file available in the production directories.
+    --meson     Used to specify the meson the user is interested in.
+                The argument must be one of: [D0, D0bar].
+    --polarity  Used to specify the polarity of the magnet the user is interested in.
+                The argument must be one of: [up, down].
+    --bin       Used to specify the bin of the binning scheme to be fitted.
+    --input     Used to specify the directory in which the binned data should be found. It is not required,
+                in the case it is not specified, the default path is the current working directory.
+    --parameters_path
+                Used to specify the directory in which the global best-fit parameters should be found. It is not
+                required, in the case it is not specified, the default path is the current working directory.
+    --binned_fit
+                Used to specify if the fit should be binned. Type either y or Y for a binned fit. Type n or N for an
+                unbinned fit. It is not required, in the case it is not specified, an unbinned fit is performed.
+    --tolerance Used to specify the largest relative difference allowed between the results of both engines. It
+                is not required, in the case it is not specified, it is 0.005.
+
+    Returns the parsed arguments.
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--year",
+        type=int,
+        choices=[16,17,18],
+        required=True,
+        help="flag to set the data taking year."
+    )
+    parser.add_argument(
+        "--size",
+        type=str,
+        choices=["large", "medium", "small", "all", "1", "2", "3", "4", "5", "6", "7", "8"],
+        required=True,
+        help="flag to set the data taking year."
+    )
+    parser.add_argument(
+        "--meson",
+        type=str,
+        choices=["D0","D0bar"],
+        required=True,
+        help="flag to set the D0 meson flavour."
+    )
+    parser.add_argument(
+        "--polarity",
+        type=str,
+        choices=["up","down"],
+        required=True,
+        help="flag to set the data taking polarity."
+    )
+    parser.add_argument(
+        "--bin",
+        type=str,
+        required=True,
+        help="flag to set the bin of the binning scheme to be fitted"
+    )
+    parser.add_argument(
+        "--input",
+        type=dir_path,
+        required=False,
+        default=os.getcwd(),
+        help="flag to set the path where the binned data should be found"
+    )
+    parser.add_argument(
+        "--parameters_path",
+        type=dir_path,
+        required=False,
+        default=os.getcwd(),
+        help="flag to set the path where the global best fit parameters are found"
+    )
+    parser.add_argument(
+        "--binned_fit",
+        type=str,
+        choices=["y", "Y", "n", "N"],
+        required=False,
+        default="n",
+        help="flag to set whether a binned or an unbinned should be performed (y/n)"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        required=False,
+        default=0.005,
+        help="flag to set the largest relative difference allowed between the engines"
+    )
+    return parser.parse_args()
+
+def run_fit(engine, directory):
+    '''
+    Runs the local fit of the bin with the given engine, writing its output to the given directory.
+
+    Returns the wall time taken and the results written (see RESULTS).
+    '''
+    os.makedirs(f"{directory}/{args.meson}_{args.polarity}_{args.year}_{args.size}", exist_ok=True)
+    command = [sys.executable, "model_fitting.py", "--year", str(args.year), "--size", args.size, "--meson", args.meson, "--polarity", args.polarity, "--bin", args.bin, "--input", os.path.abspath(args.input), "--parameters_path", os.path.abspath(args.parameters_path), "--path", directory, "--binned_fit", args.binned_fit, "--engine", engine]
+    start = time.perf_counter()
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL, cwd=os.path.dirname(os.path.abspath(__file__)))
+    wall_time = time.perf_counter() - start
+    results = np.loadtxt(f"{directory}/yields_{args.meson}_{args.polarity}_{args.year}_{args.size}_bin{args.bin}.txt", delimiter=',')
+    return wall_time, results[:len(RESULTS)]
+
+# - - - - - - - MAIN BODY - - - - - - - #
+
+args = parse_arguments()
+
+results = {}
+for engine in ["roofit", "numpy"]:
+    with tempfile.TemporaryDirectory() as directory:
+        results[engine] = run_fit(engine, directory)
+    print(f"checkpoint: the fit with the {engine} engine has been completed")
+
+print(f"{'engine':>8} {'time [s]':>9} " + " ".join(f"{result:>12}" for result in RESULTS))
+for engine, (wall_time, values) in results.items():
+    print(f"{engine:>8} {wall_time:>9.2f} " + " ".join(f"{value:>12.6g}" for value in values))
+
+reference = results["roofit"][1]
+differences = np.abs(results["numpy"][1] - reference)/np.maximum(np.abs(reference), 1e-12)
+print(f"{'rel. diff':>18} " + " ".join(f"{difference:>12.2e}" for difference in differences))
+if np.any(differences > args.tolerance):
+    raise ValueError(f"The engines do not agree within {args.tolerance}: {dict(zip(RESULTS, differences))}")
+print(f"Both engines agree within {args.tolerance}")
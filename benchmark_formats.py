@@ -0,0 +1,138 @@
+"""
+benchmark_formats.py
+
+This code compares the write and read throughput of the formats that can be used for the datasets passed between the stages of the analysis (see data_io.py). It does so on randomly generated events with the branches kept by the selection, so no input files are needed.
+The number of events, the number of times each measurement is repeated and the directory where the files are written can be specified using the flags --events --repeats --path, which are not required. By default 5 million events are generated, each measurement is repeated 3 times and the files are written to the current working directory.
+It outputs to the screen the size of the file, and the best write and read times and throughputs obtained with each format and compression. The files written are removed at the end.
+
+Author: Marc Oriol Pérez (marc.oriolperez@student.manchester.ac.uk)
+Last edited: 17th October 2026
+"""
+
+# - - - - - - IMPORT STATEMENTS - - - - - - #
+
+import os
+import argparse
+import time
+import numpy as np
+import awkward as ak
+from branches import pipeline_branches
+from data_io import write_data, read_data
+
+# - - - - - - - FUNCTIONS - - - - - - - #
+
+def parse_arguments():
+    '''
+    Parses the arguments needed along the code. Arguments:
+
+    --events    Used to specify the number of events to be generated. It is not required, in the case it
+                is not specified, 5000000 events are generated.
+    --repeats   Used to specify the number of times each measurement is repeated. It is not required, in the
+                case it is not specified, each measurement is repeated 3 times.
+    --path      Used to specify the directory in which the files should be written. It is not required,
+                in the case it is not specified, the default path is the current working directory.
+
+    Returns the parsed arguments.
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--events",
+        type=int,
+        required=False,
+        default=5000000,
+        help="flag to set the number of events to be generated"
+    )
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        required=False,
+        default=3,
+        help="flag to set the number of times each measurement is repeated"
+    )
+    parser.add_argument(
+        "--path",
+        type=dir_path,
+        required=False,
+        default=os.getcwd(),
+        help="flag to set the path where the files should be written to"
+    )
+    return parser.parse_args()
+
+def dir_path(string):
+    '''
+    Checks if a given string is the path to a directory.
+    If affirmative, returns the string. If negative, gives an error.
+    '''
+    if os.path.isdir(string):
+        return string
+    else:
+        raise NotADirectoryError(string)
+
+def generate_data(length):
+    '''
+    Generates random values for the branches kept by the selection.
+
+    Returns an awkward array of records.
+    '''
+    rng = np.random.default_rng(482022)
+    columns = {
+        "eventNumber": rng.integers(0, 2**32, length, dtype=np.uint64),
+        "runNumber": rng.integers(170000, 200000, length, dtype=np.uint32),
+        "D0_ID": rng.choice(np.array([-421, 421], dtype=np.int32), length),
+        "D0_PT": rng.exponential(4000, length),
+        "D0_ETA": rng.uniform(2, 5, length),
+        "D0_MM": rng.normal(1865, 7, length),
+    }
+    return ak.zip({branch: columns[branch] for branch in pipeline_branches()}, depth_limit=1)
+
+def measure(data, filename, fmt, compression, repeats):
+    '''
+    Writes and reads data in the given format and compression the given number of times. All the columns
+    are summed after reading, so that formats which read lazily are also charged for getting the values.
+
+    Returns the best write time, the best read time and the size of the file in bytes.
+    '''
+    write_times = []
+    read_times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        path = write_data(filename, data, fmt, compression)
+        write_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        read = read_data(filename, fmt=fmt)
+        for column in read.fields:
+            np.sum(np.asarray(read[column]))
+        read_times.append(time.perf_counter() - start)
+
+    size = os.path.getsize(path)
+    os.remove(path)
+    return min(write_times), min(read_times), size
+
+# - - - - - - - MAIN BODY - - - - - - - #
+
+args = parse_arguments()
+
+data = generate_data(args.events)
+nbytes = sum(np.asarray(data[column]).nbytes for column in data.fields)
+print(f"Generated {args.events} events ({nbytes/1e6:.1f} MB in memory)")
+
+configurations = [
+    ("root", None),
+    ("root", "lz4"),
+    ("arrow", "none"),
+    ("arrow", "lz4"),
+    ("arrow", "zstd"),
+    ("parquet", "none"),
+    ("parquet", "snappy"),
+    ("parquet", "zstd"),
+]
+
+print(f"{'format':>8} {'compression':>12} {'size [MB]':>10} {'write [s]':>10} {'write [MB/s]':>13} {'read [s]':>9} {'read [MB/s]':>12}")
+for fmt, compression in configurations:
+    try:
+        write_time, read_time, size = measure(data, f"{args.path}/benchmark_formats", fmt, compression, args.repeats)
+    except ImportError as error:
+        print(f"{fmt:>8} {str(compression):>12} skipped: {error}")
+        continue
+    print(f"{fmt:>8} {str(compression):>12} {size/1e6:>10.1f} {write_time:>10.3f} {nbytes/1e6/write_time:>13.1f} {read_time:>9.3f} {nbytes/1e6/read_time:>12.1f}")
@@ -0,0 +1,163 @@
+"""
+benchmark_histograms.py
+
+This code compares the time taken to fill the histograms of the invariant mass used in the binned fits of fit_global.py, by reading the D0_MM column and filling the histograms of both mesons in a single pass (see mass_histograms.py), by doing the same with a separate read for each meson, and, if ROOT is available, with TTree.Draw on a copy of the entries of each meson (as it was done originally). It does so on a randomly generated dataset written in the same way as the clean data of a polarity, with the events of each meson stored together and an offsets index, so no input files are needed.
+The number of events, the format of the dataset and the number of times each measurement is repeated can be specified using the flags --events --format --repeats, which are not required. By default 10 million events are generated, they are written to a root file and each measurement is repeated 3 times.
+It outputs to the screen the best time obtained with each method and checks that all of them give exactly the same histograms. The dataset is written to a temporary directory, which is removed at the end.
+
+Author: Marc Oriol Pérez (marc.oriolperez@student.manchester.ac.uk)
+Last edited: 17th October 2026
+"""
+
+# - - - - - - IMPORT STATEMENTS - - - - - - #
+
+import argparse
+import tempfile
+import time
+import numpy as np
+import awkward as ak
+from data_io import EXTENSIONS, FLAVOURS, sort_by_flavour, write_data, read_offsets
+from mass_histograms import fill_histograms
+
+try:
+    import ROOT
+except ImportError:
+    ROOT = None
+
+# - - - - - - - CONSTANTS - - - - - - - #
+
+numbins = 100
+lower_boundary = 1820
+upper_boundary = 1910
+
+# - - - - - - - FUNCTIONS - - - - - - - #
+
+def parse_arguments():
+    '''
+    Parses the arguments needed along the code. Arguments:
+
+    --events    Used to specify the number of events to be generated. It is not required, in the case it is not
+                specified, 10000000 events are generated.
+    --format    Used to specify the format of the generated dataset. The argument must be one of: [root, arrow,
+                parquet]. It is not required, in the case it is not specified, a root file is written. TTree.Draw
+                is only measured with root files.
+    --repeats   Used to specify the number of times each measurement is repeated. It is not required, in the
+                case it is not specified, each measurement is repeated 3 times.
+
+    Returns the parsed arguments.
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--events",
+        type=int,
+        required=False,
+        default=10000000,
+        help="flag to set the number of events to be generated"
+    )
+    parser.add_argument(
+        "--format",
+        type=str,
+        choices=list(EXTENSIONS),
+        required=False,
+        default="root",
+        help="flag to set the format of the generated dataset (root/arrow/parquet)"
+    )
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        required=False,
+        default=3,
+        help="flag to set the number of times each measurement is repeated"
+    )
+    return parser.parse_args()
+
+def generate_data(length):
+    '''
+    Generates random values for some of the branches of the clean data, with a peak in the invariant mass over
+    an exponential background, and orders them by flavour.
+
+    Returns the data and its offsets index.
+    '''
+    rng = np.random.default_rng(482022)
+    signal = rng.random(length) < 0.8
+    columns = {
+        "D0_MM": np.where(signal, rng.normal(1865, 7, length), 1810 + rng.exponential(120, length)),
+        "D0_PT": rng.gamma(3, 1200, length),
+        "D0_ETA": rng.uniform(2, 5, length),
+        "D0_ID": rng.choice(list(FLAVOURS.values()), length).astype(np.int32),
+    }
+    return sort_by_flavour(ak.zip(columns, depth_limit=1))
+
+def single_pass(filename):
+    '''
+    Fills the histograms of both mesons with a single read of the D0_MM column.
+
+    Returns the array of histograms.
+    '''
+    return fill_histograms(filename, list(FLAVOURS), numbins, lower_boundary, upper_boundary)
+
+def separate_reads(filename):
+    '''
+    Fills the histogram of each meson with its own read of the D0_MM column.
+
+    Returns the array of histograms.
+    '''
+    return np.concatenate([fill_histograms(filename, [flavour], numbins, lower_boundary, upper_boundary) for flavour in FLAVOURS])
+
+def tree_draw(filename):
+    '''
+    Fills the histogram of each meson by copying its entries into a tree and drawing it, as done originally in
+    fit_global.py.
+
+    Returns the array of histograms.
+    '''
+    histograms = []
+    for flavour, (start, stop) in read_offsets(filename, "root").items():
+        chain = ROOT.TChain("D02Kpi_Tuple/DecayTree")
+        chain.Add(f"{filename}.root")
+        chain.SetBranchStatus("*", 0)
+        chain.SetBranchStatus("D0_MM", 1)
+        tree = chain.CopyTree("", "", stop - start, start)
+        tree.Draw(f"D0_MM>>{flavour}_Hist({numbins},{lower_boundary},{upper_boundary})")
+        hist = ROOT.gPad.GetPrimitive(f"{flavour}_Hist")
+        histograms.append([hist.GetBinContent(i) for i in range(numbins+2)])
+    return np.array(histograms)
+
+def measure(function, filename, repeats):
+    '''
+    Runs the given function the given number of times.
+
+    Returns the best time and the result of the last run.
+    '''
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        result = function(filename)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+# - - - - - - - MAIN BODY - - - - - - - #
+
+args = parse_arguments()
+
+methods = {"single": single_pass, "separate": separate_reads}
+if ROOT is not None and args.format == "root":
+    ROOT.gROOT.SetBatch(True)
+    methods["draw"] = tree_draw
+else:
+    print("TTree.Draw is not measured, as it needs ROOT and a root file")
+
+with tempfile.TemporaryDirectory() as directory:
+    filename = f"{directory}/up_data_benchmark_clean"
+    data, offsets = generate_data(args.events)
+    write_data(filename, data, args.format, offsets=offsets)
+    del data
+    print(f"Generated {args.events} events")
+
+    results = {method: measure(function, filename, args.repeats) for method, function in methods.items()}
+
+reference = results["single"][1]
+print(f"{'method':>8} {'time [s]':>9} {'events/s':>12}")
+for method, (best, result) in results.items():
+    print(f"{method:>8} {best:>9.3f} {args.events/best:>12.3g}")
+print(f"All methods give the same histograms: {all(np.array_equal(result, reference) for best, result in results.values())}")
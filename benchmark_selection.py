@@ -0,0 +1,125 @@
+"""
+benchmark_selection.py
+
+This code compares the time taken to build the selection mask used in selection_of_events.py with the fused evaluation in selection_cuts.py and with the original chain of np.logical_and calls. It does so on randomly generated events, so no input files are needed.
+The number of events and the number of times each method is repeated can be specified using the flags --events --repeats, which are not required. By default 5 million events are generated and each method is repeated 5 times.
+It outputs to the screen the best time taken by each method and checks that both give the same mask.
+
+Author: Marc Oriol Pérez (marc.oriolperez@student.manchester.ac.uk)
+Last edited: 17th October 2026
+"""
+
+# - - - - - - IMPORT STATEMENTS - - - - - - #
+
+import argparse
+import time
+import numpy as np
+from selection_cuts import selection_mask, numba
+
+# - - - - - - - FUNCTIONS - - - - - - - #
+
+def parse_arguments():
+    '''
+    Parses the arguments needed along the code. Arguments:
+
+    --events    Used to specify the number of events to be generated. It is not required, in the case it
+                is not specified, 5000000 events are generated.
+    --repeats   Used to specify the number of times each method is timed. It is not required, in the case it
+                is not specified, each method is timed 5 times.
+
+    Returns the parsed arguments.
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--events",
+        type=int,
+        required=False,
+        default=5000000,
+        help="flag to set the number of events to be generated"
+    )
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        required=False,
+        default=5,
+        help="flag to set the number of times each method is timed"
+    )
+    return parser.parse_args()
+
+def generate_data(length):
+    '''
+    Generates random values for the branches used in the selection, with ranges chosen so that every
+    cut removes a fraction of the events.
+
+    Returns a dictionary of branch name : numpy array.
+    '''
+    rng = np.random.default_rng(482022)
+    data = {}
+    for particle in ["P1", "P2"]:
+        data[f"{particle}_PZ"] = rng.normal(50000, 30000, length)
+        data[f"{particle}_ETA"] = rng.uniform(-1, 7, length)
+        data[f"{particle}_PT"] = rng.exponential(3000, length) - 100
+        data[f"{particle}_isMuon"] = rng.random(length) < 0.02
+        data[f"{particle}_PIDK"] = rng.normal(0, 20, length)
+    data["D0_IPCHI2_OWNPV"] = rng.exponential(3, length)
+    return data
+
+def chained_mask(data):
+    '''
+    Builds the selection mask as selection_of_events.py used to, with one np.logical_and per cut.
+
+    Returns the boolean mask.
+    '''
+    length = len(data["P1_PZ"])
+    mask = np.ones(length)
+    mask = np.logical_and(mask, data["P1_PZ"]>0)
+    mask = np.logical_and(mask, data["P2_PZ"]>0)
+    mask = np.logical_and(mask, data["P1_ETA"]>0)
+    mask = np.logical_and(mask, data["P2_ETA"]>0)
+    mask = np.logical_and(mask, data["P1_ETA"]<6)
+    mask = np.logical_and(mask, data["P2_ETA"]<6)
+    mask = np.logical_and(mask, data["P1_PT"]>0)
+    mask = np.logical_and(mask, data["P2_PT"]>0)
+    mask = np.logical_and(mask, data["P1_PT"]<10000)
+    mask = np.logical_and(mask, data["P2_PT"]<10000)
+    mask = np.logical_and(mask, data["P1_isMuon"]==0)
+    mask = np.logical_and(mask, data["P2_isMuon"]==0)
+    mask = np.logical_and(mask, data["P1_PIDK"] > 5)
+    mask = np.logical_and(mask, data["P2_PIDK"] < 0)
+    mask = np.logical_and(mask, np.log(data["D0_IPCHI2_OWNPV"]) < 1)
+    return mask
+
+def time_method(method, data, repeats):
+    '''
+    Runs method on data the given number of times.
+
+    Returns the best time taken and the mask obtained.
+    '''
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        mask = method(data)
+        times.append(time.perf_counter() - start)
+    return min(times), mask
+
+# - - - - - - - MAIN BODY - - - - - - - #
+
+args = parse_arguments()
+
+data = generate_data(args.events)
+print(f"Generated {args.events} events")
+
+# compile the fused selection before timing it
+selection_mask({name: values[:1] for name, values in data.items()})
+
+chained_time, chained = time_method(chained_mask, data, args.repeats)
+fused_time, fused = time_method(selection_mask, data, args.repeats)
+
+engine = "numba" if numba is not None else "numpy (numba not installed)"
+print(f"Chained np.logical_and: {chained_time:.4f} s")
+print(f"Fused selection ({engine}): {fused_time:.4f} s")
+print(f"Speed-up: {chained_time/fused_time:.2f}")
+print(f"Selected events: {np.sum(fused)} out of {args.events}")
+
+if not np.array_equal(chained, fused):
+    raise RuntimeError("The fused selection does not give the same mask as the chained selection")
@@ -0,0 +1,206 @@
+"""
+binning_scheme.py
+
+This code reads and writes the binning scheme of the phase space, which is created by create_binning_scheme.py and read by every later stage of the analysis. The scheme is stored in a json file, {year}_{size}_bins.json, holding the boundaries of the sets of transverse momentum, the boundaries of pseudorapidity within each of these sets (their number can be different in each set) and the list of bins. Each bin has a name, used to find its events in the binned data and in the names of its output files, the indices of its transverse momentum set and pseudorapidity set, and its boundaries.
+The name of a bin is the index of its pseudorapidity set followed by the index of its transverse momentum set, so that a scheme with 10 sets of each gives the names 00 to 99. If there are more than 10 sets, each index is written with two digits.
+The functions in this file are meant to be imported by the scripts of the analysis. When run on its own, it prints the names of the bins of a scheme, one per line, which is used by main.sh. The year of interest and size of the data must be specified using the required flags --year --size, and the directory where the scheme can be found using the flag --bin_path, which is not required. By default it is set to be the current working directory.
+
+Author: Marc Oriol Pérez (marc.oriolperez@student.manchester.ac.uk)
+Last edited: 17th October 2026
+"""
+
+# - - - - - - IMPORT STATEMENTS - - - - - - #
+
+import os
+import json
+import argparse
+import numpy as np
+
+# - - - - - - - FUNCTIONS - - - - - - - #
+
+def scheme_path(bin_path, year, size):
+    '''
+    Returns the path of the binning scheme of the given year and size, in the directory bin_path.
+    '''
+    return f"{bin_path}/{year}_{size}_bins.json"
+
+def bin_name(pT_bin, eta_bin, width=1):
+    '''
+    Returns the name of the bin with the given indices of transverse momentum and pseudorapidity sets, writing
+    each index with the given number of digits.
+    '''
+    return f"{eta_bin:0{width}d}{pT_bin:0{width}d}"
+
+def build_scheme(pT_edges, eta_edges, **metadata):
+    '''
+    Builds the binning scheme from the boundaries of the transverse momentum sets and the list of boundaries of
+    pseudorapidity within each of them. Any other information given (e.g. the number of signal candidates in
+    each bin) is stored in the scheme as it is.
+
+    Returns the scheme as a dictionary. The bins are listed in order of transverse momentum set, and then of
+    pseudorapidity set.
+    '''
+    width = 1 if max([len(pT_edges)-1] + [len(edges)-1 for edges in eta_edges]) <= 10 else 2
+    bins = []
+    for i in range(len(pT_edges)-1):
+        for j in range(len(eta_edges[i])-1):
+            bins.append({
+                "name": bin_name(i, j, width),
+                "pT_bin": i,
+                "eta_bin": j,
+                "pT": [float(pT_edges[i]), float(pT_edges[i+1])],
+                "eta": [float(eta_edges[i][j]), float(eta_edges[i][j+1])],
+            })
+    scheme = {
+        "pT_edges": [float(edge) for edge in pT_edges],
+        "eta_edges": [[float(edge) for edge in edges] for edges in eta_edges],
+        "bins": bins,
+    }
+    scheme.update(metadata)
+    return scheme
+
+def save_scheme(filename, scheme):
+    '''
+    Writes the binning scheme to filename.
+    '''
+    with open(filename, "w") as f:
+        json.dump(scheme, f, indent=4, default=lambda value: value.item()) # numpy scalars are written as numbers
+
+    return print(f"Saved binning scheme {filename}")
+
+def load_scheme(bin_path, year, size):
+    '''
+    Reads the binning scheme of the given year and size from the directory bin_path.
+
+    Returns the scheme as a dictionary (see build_scheme).
+    '''
+    with open(scheme_path(bin_path, year, size)) as f:
+        return json.load(f)
+
+def bin_names(scheme):
+    '''
+    Returns the list of the names of the bins in the scheme.
+    '''
+    return [entry["name"] for entry in scheme["bins"]]
+
+def bin_mask(scheme_bin, pT, eta):
+    '''
+    Returns a boolean mask which is True for the events inside the given bin of the scheme. As in the original
+    binning, the lower boundaries are not included and the upper ones are.
+    '''
+    pT_low, pT_high = scheme_bin["pT"]
+    eta_low, eta_high = scheme_bin["eta"]
+    return (pT > pT_low) & (pT <= pT_high) & (eta > eta_low) & (eta <= eta_high)
+
+def assign_bins(scheme, pT, eta):
+    '''
+    Finds the bin of the scheme in which each event falls, with the same boundaries as bin_mask, in a single pass
+    over the events instead of one pass per bin. The set of transverse momentum of each event is found with a
+    binary search over the pT boundaries, the events are grouped by set with a single stable sort, and the set of
+    pseudorapidity is then found with a binary search over the eta boundaries of each set.
+
+    Returns the index (in the list of bins of the scheme) of the bin of each event, or -1 for the events outside
+    all the bins.
+    '''
+    pT = np.asarray(pT, dtype=np.float64)
+    eta = np.asarray(eta, dtype=np.float64)
+    pT_edges = np.asarray(scheme["pT_edges"])
+    nrows = len(pT_edges) - 1
+
+    # the events outside the pT boundaries are put in an extra set after the last one
+    rows = np.searchsorted(pT_edges, pT, side="left") - 1
+    rows[(rows < 0) | (rows >= nrows)] = nrows
+    rows = rows.astype(np.min_scalar_type(nrows)) # small integers are sorted with a radix sort
+    order = np.argsort(rows, kind="stable")
+    bounds = np.r_[0, np.cumsum(np.bincount(rows, minlength=nrows+1))]
+    first_bin = np.r_[0, np.cumsum([len(edges)-1 for edges in scheme["eta_edges"]])]
+
+    bins = np.full(len(pT), -1, dtype=np.int64)
+    for row, edges in enumerate(scheme["eta_edges"]):
+        events = order[bounds[row]:bounds[row+1]]
+        column = np.searchsorted(edges, eta[events], side="left") - 1
+        inside = (column >= 0) & (column < len(edges)-1)
+        bins[events[inside]] = first_bin[row] + column[inside]
+    return bins
+
+def group_bins(bins, nbins):
+    '''
+    Groups the events by bin with a single stable sort, given the bin of each event (see assign_bins) and the
+    number of bins. Within each bin the events keep their original order.
+
+    Returns the indices of the events inside the bins ordered by bin, and the offsets of each bin in them, so
+    that the events of the kth bin are order[offsets[k]:offsets[k+1]].
+    '''
+    counts = np.bincount(np.asarray(bins) + 1, minlength=nbins+1)
+    order = np.argsort(np.asarray(bins).astype(np.min_scalar_type(-nbins)), kind="stable") # small integers are sorted with a radix sort
+    return order[counts[0]:], np.r_[0, np.cumsum(counts[1:])]
+
+def scheme_grid(scheme, values):
+    '''
+    Arranges one value per bin (given in the order of the bins in the scheme) in a 2D array, with one row per
+    pseudorapidity set and one column per transverse momentum set, which can be plotted as a heatmap. The
+    positions that do not correspond to a bin, as there are fewer pseudorapidity sets in some transverse momentum
+    sets, are NaN.
+
+    Returns the 2D array.
+    '''
+    grid = np.full((max(len(edges)-1 for edges in scheme["eta_edges"]), len(scheme["pT_edges"])-1), np.nan)
+    for entry, value in zip(scheme["bins"], values):
+        grid[entry["eta_bin"], entry["pT_bin"]] = value
+    return grid
+
+def dir_path(string):
+    '''
+    Checks if a given string is the path to a directory.
+    If affirmative, returns the string. If negative, gives an error.
+    '''
+    if os.path.isdir(string):
+        return string
+    else:
+        raise NotADirectoryError(string)
+
+def parse_arguments():
+    '''
+    Parses the arguments needed along the code. Arguments:
+
+    --year      Used to specify the year at which the data was taken the user is interested in.
+                The argument must be one of: [16, 17, 18]. These referr to 2016, 2017 & 2018, respectively.
+    --size      Used to specify the amount of events the user is interested in analysing.
+                The argument must be one of: [large, small, medium, all, 1-8]. The integers specify the number of root
+                files to be read in. Large is equivalent to 8. Medium is equivalent to 4. Small takes 200000 events.
+                All takes every file available in the production directories.
+    --bin_path  Used to specify the directory in which the binning scheme should be found. It is not required,
+                in the case it is not specified, the default path is the current working directory.
+
+    Returns the parsed arguments.
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--year",
+        type=int,
+        choices=[16,17,18],
+        required=True,
+        help="flag to set the data taking year."
+    )
+    parser.add_argument(
+        "--size",
+        type=str,
+        choices=["large", "medium", "small", "all", "1", "2", "3", "4", "5", "6", "7", "8"],
+        required=True,
+        help="flag to set the data taking year."
+    )
+    parser.add_argument(
+        "--bin_path",
+        type=dir_path,
+        required=False,
+        default=os.getcwd(),
+        help="flag to set the path where the binning scheme should be found"
+    )
+    return parser.parse_args()
+
+# - - - - - - - MAIN BODY - - - - - - - #
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    for name in bin_names(load_scheme(args.bin_path, args.year, args.size)):
+        print(name)
@@ -0,0 +1,42 @@
+"""
+branches.py
+
+This code contains the registry of the branches used by each stage of the analysis after the selection. Each stage reads its branches from here, and selection_of_events.py only reads and writes the union of them (plus the branches needed to apply the selection), so that no unused data is carried through the analysis.
+If a stage starts using a new branch, it must be added to its entry here, otherwise it will not be found in the selected data.
+It is not meant to be run on its own, but imported by the scripts of each stage.
+
+Author: Marc Oriol Pérez (marc.oriolperez@student.manchester.ac.uk)
+Last edited: 17th October 2026
+"""
+
+# - - - - - - - BRANCH REGISTRY - - - - - - - #
+
+STAGE_BRANCHES = {
+    "multiple_candidates": ["eventNumber", "runNumber", "D0_ID", "P1_ProbNNk", "P2_ProbNNpi", "D0_IPCHI2_OWNPV", "D0_MM"],
+    "create_binning_scheme": ["D0_PT", "D0_ETA", "D0_ID", "D0_MM"],
+    "apply_binning_scheme": ["D0_PT", "D0_ETA"],
+    "fit_global": ["D0_MM"],
+    "model_fitting": ["D0_MM"],
+    "plot_phase_space": ["D0_PT", "D0_ETA"],
+}
+
+# - - - - - - - FUNCTIONS - - - - - - - #
+
+def stage_branches(*stages):
+    '''
+    Returns the branches used by the given stages, without repetitions and in the order in which they
+    first appear in the registry.
+    '''
+    branches = []
+    for stage in stages:
+        for branch in STAGE_BRANCHES[stage]:
+            if branch not in branches:
+                branches.append(branch)
+    return branches
+
+def pipeline_branches():
+    '''
+    Returns the branches used by any of the stages after the selection, which are the ones that must be
+    kept in the selected data.
+    '''
+    return stage_branches(*STAGE_BRANCHES)
@@ -2,11 +2,11 @@
 calculate_asymmetry.py
 
 This code is used to process the signal normalization yields and obtain the raw asymmetries. It also uses the input from using another signal model to obtain the systematic uncertainty due to the fit model. It finally outputs the results obtained both to the secreen and to a .txt file.
-The year of interest and size of the data to be analysed must be specified using the required flags --year --size.There also are the flags --input and --path which are not required. These are used to specify the directory where the input data is located and where the output file should be written, respectively. By default it is set to be the current working directory.
+The year of interest and size of the data to be analysed must be specified using the required flags --year --size.There also are the flags --input --path and --bin_path which are not required. These are used to specify the directory where the input data is located, where the output file should be written and where the binning scheme can be found, respectively. By default it is set to be the current working directory.
 This code is  inspired on the work of Camille Jarvis-Stiggants and Michael England. The code has been completely rewritten and reorganised, and some features have been added to add flexibility to the code, but some of the original functions have been used here as well.
 
 Author: Marc Oriol Pérez (marc.oriolperez@student.manchester.ac.uk)
-Last edited: 16th September 2023
+Last edited: 17th October 2026
 """
 
 # - - - - - - IMPORT STATEMENTS - - - - - - #
@@ -15,6 +15,7 @@ import random
 import os
 import argparse
 import numpy as np
+from binning_scheme import load_scheme, bin_names
 
 
 # - - - - - - - FUNCTIONS - - - - - - - #
@@ -26,12 +27,15 @@ def parse_arguments():
     --year  Used to specify the year at which the data was taken the user is interested in.
             The argument must be one of: [16, 17, 18]. These referr to 2016, 2017 & 2018, respectively.
     --size  Used to specify the amount of events the user is interested in analysing.
-            The argument must be one of: [large, small, medium, 1-8]. The integers specify the number of root
+            The argument must be one of: [large, small, medium, all, 1-8]. The integers specify the number of root
             files to be read in. Large is equivalent to 8. Medium is equivalent to 4. Small takes 200000 events.
+            All takes every file available in the production directories.
     --path  Used to specify the directory in which the output files should be written. It is not required,
             in the case it is not specified, the default path is the current working directory.
     --input     Used to specify the directory in which the input data should be found. It is not required,
                 in the case it is not specified, the default path is the current working directory. 
+    --bin_path  Used to specify the directory in which the binning scheme should be found. It is not required,
+                in the case it is not specified, the default path is the current working directory.
     
     Returns the parsed arguments.
     '''
@@ -46,7 +50,7 @@ def parse_arguments():
     parser.add_argument(
         "--size",
         type=str,
-        choices=["large", "medium", "small", "1", "2", "3", "4", "5", "6", "7", "8"],
+        choices=["large", "medium", "small", "all", "1", "2", "3", "4", "5", "6", "7", "8"],
         required=True,
         help="flag to set the data taking year."
     )
@@ -64,6 +68,13 @@ def parse_arguments():
         default=os.getcwd(),
         help="flag to set the path where the input data should be found"
     )
+    parser.add_argument(
+        "--bin_path",
+        type=dir_path,
+        required=False,
+        default=os.getcwd(),
+        help="flag to set the path where the binning scheme should be found"
+    )
     
     return parser.parse_args()
 
@@ -143,18 +154,16 @@ def output_results(A_raw, A_raw_err, A_raw_up, A_raw_up_err, A_raw_down, A_raw_d
 
 options = parse_arguments()
 
-for j in range(0,10):
-    for i in range (0,10):
-        bin_num = str(j)+str(i)
-        # get normalization yield from desired model 
-        N_D0_up, N_D0_up_err, N_D0bar_up, N_D0bar_up_err, N_D0_down, N_D0_down_err, N_D0bar_down, N_D0bar_down_err = get_yield(bin_num)
+for bin_num in bin_names(load_scheme(options.bin_path, options.year, options.size)):
+    # get normalization yield from desired model 
+    N_D0_up, N_D0_up_err, N_D0bar_up, N_D0bar_up_err, N_D0_down, N_D0_down_err, N_D0bar_down, N_D0bar_down_err = get_yield(bin_num)
 
-        # get raw asymmetries for main model
-        A_raw_up, A_raw_up_err = calculate_raw_asymmetry(N_D0_up, N_D0bar_up, 1, N_D0_up_err, N_D0bar_up_err)
-        A_raw_down, A_raw_down_err = calculate_raw_asymmetry(N_D0_down, N_D0bar_down, 1, N_D0_down_err, N_D0bar_down_err)
-        A_raw = (A_raw_up + A_raw_down) / 2
-        A_raw_err = ((A_raw_up_err**2 + A_raw_down_err**2)**0.5) /2
+    # get raw asymmetries for main model
+    A_raw_up, A_raw_up_err = calculate_raw_asymmetry(N_D0_up, N_D0bar_up, 1, N_D0_up_err, N_D0bar_up_err)
+    A_raw_down, A_raw_down_err = calculate_raw_asymmetry(N_D0_down, N_D0bar_down, 1, N_D0_down_err, N_D0bar_down_err)
+    A_raw = (A_raw_up + A_raw_down) / 2
+    A_raw_err = ((A_raw_up_err**2 + A_raw_down_err**2)**0.5) /2
 
-        # output results
-        output_results(A_raw, A_raw_err, A_raw_up, A_raw_up_err, A_raw_down, A_raw_down_err, bin_num)
+    # output results
+    output_results(A_raw, A_raw_err, A_raw_up, A_raw_up_err, A_raw_down, A_raw_down_err, bin_num)
         
\ No newline at end of file
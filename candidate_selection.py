@@ -0,0 +1,217 @@
+"""
+candidate_selection.py
+
+This code is used to choose which candidate is kept in events with multiple candidates. Each candidate is identified by a single 64-bit key built from its run and event numbers, and the candidate kept in each event is picked using a counter-based hash of the key and a seed.
+As the choice only depends on the key, the seed and the order of the candidates within their event, it is random but reproducible, and it does not change when the data is split in chunks or processed by several workers, as long as all the candidates of an event are kept together and in their original order. No shuffle or sort of the whole dataset is needed: a single counting pass over the hashes of the keys rules out most of the events with a single candidate, the rest are grouped with a hash table, and only the candidates of events with more than one candidate are ever sorted.
+Instead of choosing at random, the candidate kept can also be the best one according to a ranking policy (see POLICIES), such as the candidate with the highest P1_ProbNNk*P2_ProbNNpi or the one with D0_MM closest to the mass of the D0. The best candidate of each event is found with a single sort of the candidates of events with more than one candidate, by event and score, so there is no loop over the events.
+It is not meant to be run on its own, but imported by the scripts that remove multiple candidates.
+
+Author: Marc Oriol Pérez (marc.oriolperez@student.manchester.ac.uk)
+Last edited: 17th October 2026
+"""
+
+# - - - - - - IMPORT STATEMENTS - - - - - - #
+
+import numpy as np
+import pandas as pd
+
+# - - - - - - - RANKING POLICIES - - - - - - - #
+
+D0_PDG_MASS = 1864.84 # MeV
+
+def probnn_score(data):
+    '''
+    Returns the product of the kaon and pion probabilities of the daughters, larger for better candidates.
+    '''
+    return np.asarray(data["P1_ProbNNk"], dtype=np.float64)*np.asarray(data["P2_ProbNNpi"], dtype=np.float64)
+
+def ipchi2_score(data):
+    '''
+    Returns the impact parameter chi2 of the D0 with respect to its own primary vertex, smaller for better candidates.
+    '''
+    return np.asarray(data["D0_IPCHI2_OWNPV"], dtype=np.float64)
+
+def mass_score(data):
+    '''
+    Returns the distance between the reconstructed mass of the D0 and its PDG mass, smaller for better candidates.
+    '''
+    return np.abs(np.asarray(data["D0_MM"], dtype=np.float64) - D0_PDG_MASS)
+
+# Each policy gives the branches it needs, the function computing the score of each candidate from them and
+# whether the candidate kept is the one with the largest ("max") or the smallest ("min") score. The random
+# policy has no score, and keeps a candidate chosen with the hash of its key and the seed (see keep_keys).
+POLICIES = {
+    "random": {"branches": [], "score": None, "best": None},
+    "probnn": {"branches": ["P1_ProbNNk", "P2_ProbNNpi"], "score": probnn_score, "best": "max"},
+    "ipchi2": {"branches": ["D0_IPCHI2_OWNPV"], "score": ipchi2_score, "best": "min"},
+    "mass": {"branches": ["D0_MM"], "score": mass_score, "best": "min"},
+}
+
+# - - - - - - - FUNCTIONS - - - - - - - #
+
+def event_keys(run_numbers, event_numbers):
+    '''
+    Packs the run and event numbers of each candidate into a single unsigned 64-bit key, with the run number
+    in the upper 32 bits and the event number in the lower 32 bits.
+
+    Returns the array of keys.
+    '''
+    run_numbers = np.asarray(run_numbers).astype(np.uint64)
+    event_numbers = np.asarray(event_numbers).astype(np.uint64)
+    if len(event_numbers) > 0 and (event_numbers.max() >= 2**32 or run_numbers.max() >= 2**32):
+        raise ValueError("The run and event numbers must be smaller than 2^32 to be packed into a single key")
+
+    return (run_numbers << np.uint64(32)) | event_numbers
+
+def hash_keys(keys, seed):
+    '''
+    Hashes each key together with the seed using the splitmix64 finaliser. The same key and seed always give
+    the same value, so the hash can be used as a reproducible random number attached to each event.
+
+    Returns the array of hashes as unsigned 64-bit integers.
+    '''
+    with np.errstate(over="ignore"):
+        x = np.asarray(keys, dtype=np.uint64) ^ (np.uint64(seed) * np.uint64(0x9E3779B97F4A7C15))
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+
+def shared_buckets(keys):
+    '''
+    Spreads the keys over a table of buckets using their hash, and counts the keys in each bucket. A key alone
+    in its bucket cannot belong to an event with multiple candidates, so most candidates are ruled out with a
+    single pass over the data. The table has about twice as many buckets as keys, up to 2^25 buckets.
+
+    Returns a boolean mask which is True for the candidates that share their bucket with another candidate.
+    '''
+    bits = int(np.clip(np.ceil(np.log2(max(len(keys), 1))) + 1, 10, 25))
+    buckets = (hash_keys(keys, 0) >> np.uint64(64 - bits)).astype(np.intp)
+    return np.bincount(buckets, minlength=2**bits)[buckets] > 1
+
+def group_events(keys):
+    '''
+    Groups the candidates by event using a hash table, without sorting them.
+
+    Returns the index of the event of each candidate (in order of first appearance) and the number of
+    candidates in each event.
+    '''
+    codes, uniques = pd.factorize(keys, sort=False)
+    return codes, np.bincount(codes, minlength=len(uniques))
+
+def occurrence_rank(codes):
+    '''
+    Computes the position of each candidate within its event, following the order in which they are given
+    (0 for the first candidate of an event, 1 for the second one, etc.). Only the candidates given are
+    sorted, so this should only be used on the candidates of events with more than one candidate.
+
+    Returns the array of positions.
+    '''
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    lengths = np.diff(np.r_[starts, len(codes)])
+    rank = np.empty(len(codes), dtype=np.int64)
+    rank[order] = np.arange(len(codes)) - np.repeat(starts, lengths)
+    return rank
+
+def partition_keys(keys, partitions):
+    '''
+    Assigns each key to one of the given number of partitions using its hash, so that all the candidates of
+    an event end up in the same partition. The key is hashed twice, so that the partition is independent of
+    the hashes used to choose the candidate kept.
+
+    Returns the partition of each key.
+    '''
+    return (hash_keys(hash_keys(keys, 0), 0) % np.uint64(partitions)).astype(np.intp)
+
+def keep_mask(run_numbers, event_numbers, seed):
+    '''
+    Chooses the candidate kept in each event. In events with a single candidate it is always kept. In events
+    with n candidates, the one kept is the k-th candidate of the event, where k is the hash of its key and the
+    seed modulo n.
+
+    Returns a boolean mask which is True for the candidates kept.
+    '''
+    return keep_keys(event_keys(run_numbers, event_numbers), seed)
+
+def keep_keys(keys, seed):
+    '''
+    Same as keep_mask, but taking the keys already built by event_keys.
+
+    Returns a boolean mask which is True for the candidates kept.
+    '''
+    # only the candidates sharing a bucket can have the same key, so only those need to be grouped
+    keep = np.ones(len(keys), dtype=bool)
+    shared = np.flatnonzero(shared_buckets(keys))
+    codes, multiplicity = group_events(keys[shared])
+
+    multiple = multiplicity[codes] > 1
+    candidates = shared[multiple]
+    if len(candidates) == 0:
+        return keep
+
+    codes = codes[multiple]
+    chosen = hash_keys(keys[candidates], seed) % multiplicity[codes].astype(np.uint64)
+    keep[candidates] = occurrence_rank(codes) == chosen.astype(np.int64)
+    return keep
+
+def policy_scores(data, policy):
+    '''
+    Computes the score of each candidate in data (which must contain the branches of the policy) with the
+    given ranking policy. The scores are oriented so that the best candidate always has the largest one, and
+    missing values (NaN) are ranked below any other.
+
+    Returns the array of scores, or None for the random policy.
+    '''
+    if POLICIES[policy]["score"] is None:
+        return None
+    scores = POLICIES[policy]["score"](data)
+    if POLICIES[policy]["best"] == "min":
+        scores = -scores
+    return np.where(np.isnan(scores), -np.inf, scores)
+
+def best_keys(keys, scores):
+    '''
+    Keeps the candidate with the largest score in each event (a segmented argmax). The candidates of events
+    with more than one candidate are sorted by event and then by decreasing score, and the first candidate of
+    each event is kept. The sort is stable, so ties are won by the candidate that comes first.
+
+    Returns a boolean mask which is True for the candidates kept.
+    '''
+    keep = np.ones(len(keys), dtype=bool)
+    shared = np.flatnonzero(shared_buckets(keys))
+    codes, multiplicity = group_events(keys[shared])
+
+    multiple = multiplicity[codes] > 1
+    candidates = shared[multiple]
+    if len(candidates) == 0:
+        return keep
+
+    codes = codes[multiple]
+    order = np.lexsort((-scores[candidates], codes))
+    sorted_codes = codes[order]
+    first = np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]
+    keep[candidates] = False
+    keep[candidates[order[first]]] = True
+    return keep
+
+def choose_keys(keys, seed, policy="random", scores=None):
+    '''
+    Chooses the candidate kept in each event with the given policy, taking the keys already built by
+    event_keys and, for the ranking policies, the scores given by policy_scores.
+
+    Returns a boolean mask which is True for the candidates kept.
+    '''
+    if POLICIES[policy]["score"] is None:
+        return keep_keys(keys, seed)
+    return best_keys(keys, scores)
+
+def choose_candidates(data, seed, policy="random"):
+    '''
+    Chooses the candidate kept in each event of data with the given policy. Data must contain the run and
+    event numbers, and the branches of the policy.
+
+    Returns a boolean mask which is True for the candidates kept.
+    '''
+    keys = event_keys(data["runNumber"], data["eventNumber"])
+    return choose_keys(keys, seed, policy, policy_scores(data, policy))
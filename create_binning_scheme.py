@@ -1,21 +1,27 @@
 """
 create_binning_scheme.py
 
-This code calculates the best boundary positions in  order to generete the bins. It first splits the data in 10 sets according using the transverse momentum of each event, and makes sure the number of events in each set is the same. This exact same procedure is then repeated for each of these sets butnow using the pseudorapidity. Therefore, the result are 100 sets of data with an equal number of events. The boundaries calculated by this code are naturally calculated using data from both mesons and both polarities.
+This code calculates the best boundary positions in  order to generete the bins. It first splits the data in 10 sets according using the transverse momentum of each event, and makes sure the number of events in each set is the same. This exact same procedure is then repeated for each of these sets butnow using the pseudorapidity. Therefore, the result are 100 sets of data with an equal number of events. The number of sets can be changed with the optional flag --nbins.
+If the optional flag --min_signal is given, the number of sets is instead adapted to the data, so that each bin has at least that number of signal candidates of each meson and polarity, and the local fits are not run on bins with too few events to converge. The number of signal candidates is estimated as the number of events in a window of 20 MeV around the mass of the D0 minus the number of events in the sidebands next to it, which have the same total width. The number of sets of transverse momentum is first chosen from the number of signal candidates of the smallest sample, up to --nbins, and then the number of sets of pseudorapidity within each of them. Sets with too few signal candidates are then merged with their smallest neighbour. The result is a scheme with a different number of bins of pseudorapidity in each set of transverse momentum. The boundaries calculated by this code are naturally calculated using data from both mesons and both polarities, after the multiple candidates have been removed.
 The year of interest and size of the data to be analysed must be specified using the required flags --year --size. There also are the flags --input and --path, which are not required. These are used to specify the directory where the input data is located and where the output file should be written, respectively. By default it is set to be the current working directory.
-It outputs the values of transverse momentum and pseudorapidity at each of the boundaries of the bins.
+It outputs the binning scheme, with the values of transverse momentum and pseudorapidity at each of the boundaries of the bins and the estimated number of signal candidates in each bin, to a json file which is read by all the later stages (see binning_scheme.py).
+The data is read in chunks in a single pass, and the boundaries are found with mergeable quantile sketches (see quantile_sketch.py) instead of sorting all the events, so the whole dataset never needs to be held in memory. The transverse momentum is sketched directly. For the pseudorapidity, the transverse momentum range is split into fine cells (set with the optional flag --cells), each with its own sketch of the pseudorapidity, and the sketches of the cells in each set are merged once the boundaries of the sets are known. The error bound of each boundary is printed: the rank error of the sketches, plus for the pseudorapidity the events of the cells shared with the neighbouring sets. Each polarity is sketched in its own process if the optional flag --workers is given, and the sketches are merged at the end. The optional flags --capacity and --step_size set the capacity of the sketches and the size of the chunks read.
 
 Author: Marc Oriol Pérez (marc.oriolperez@student.manchester.ac.uk)
-Last edited: 15th September 2023
+Last edited: 17th October 2026
 """
 
 # - - - - - - IMPORT STATEMENTS - - - - - - #
 import os
 import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-import uproot
-import pandas as pd
-import awkward as ak
+from branches import STAGE_BRANCHES
+from data_io import FLAVOURS, iterate_data
+from quantile_sketch import QuantileSketch
+from binning_scheme import build_scheme, save_scheme, scheme_path
+from candidate_selection import D0_PDG_MASS
 
 
 # - - - - - - - FUNCTIONS - - - - - - - #
@@ -27,12 +33,32 @@ def parse_arguments():
     --year      Used to specify the year at which the data was taken the user is interested in.
                 The argument must be one of: [16, 17, 18]. These referr to 2016, 2017 & 2018, respectively.
     --size      Used to specify the amount of events the user is interested in analysing.
-                The argument must be one of: [large, small, medium, 1-8]. The integers specify the number of root
+                The argument must be one of: [large, small, medium, all, 1-8]. The integers specify the number of root
                 files to be read in. Large is equivalent to 8. Medium is equivalent to 4. Small takes 200000 events.
+                All takes every file available in the production directories.
     --path      Used to specify the directory in which the output files should be written. It is not required,
                 in the case it is not specified, the default path is the current working directory.
     --input     Used to specify the directory in which the input data should be found. It is not required,
                 in the case it is not specified, the default path is the current working directory.
+    --workers   Used to specify the number of worker processes. If it is larger than 1, each polarity is read and
+                sketched in a separate process. It is not required, in the case it is not specified, the
+                polarities are processed one after another.
+    --cells     Used to specify the number of cells of equal width in which the transverse momentum range is split
+                to find the boundaries of the pseudorapidity. More cells give a smaller error, as fewer events are
+                shared between neighbouring sets. It is not required, in the case it is not specified, it is 1000.
+    --capacity  Used to specify the number of values held in each level of the quantile sketches before they are
+                compacted (see quantile_sketch.py). A larger capacity gives a smaller error and uses more memory.
+                It is not required, in the case it is not specified, it is 32768.
+    --step_size Used to specify the size of the chunks in which the input files are read (either a number of
+                events, e.g. 500000, or a memory size, e.g. "100 MB"). It is not required, in the case it is not
+                specified, it is 100 MB.
+    --nbins     Used to specify the number of sets of transverse momentum, and of pseudorapidity within each of
+                them. If --min_signal is given, it is the maximum number of sets. It is not required, in the case it
+                is not specified, it is 10.
+    --min_signal
+                Used to specify the minimum number of signal candidates of each meson and polarity in each bin. The
+                number of sets is then adapted to the data, and can be different in each set of transverse momentum.
+                It is not required, in the case it is not specified, the number of sets is given by --nbins.
     
     Returns the parsed arguments.
     '''
@@ -47,7 +73,7 @@ def parse_arguments():
     parser.add_argument(
         "--size",
         type=str,
-        choices=["large", "medium", "small", "1", "2", "3", "4", "5", "6", "7", "8"],
+        choices=["large", "medium", "small", "all", "1", "2", "3", "4", "5", "6", "7", "8"],
         required=True,
         help="flag to set the data taking year."
     )
@@ -65,6 +91,48 @@ def parse_arguments():
         default=os.getcwd(),
         help="flag to set the path where the output files should be written to"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        required=False,
+        default=1,
+        help="flag to set the number of worker processes"
+    )
+    parser.add_argument(
+        "--cells",
+        type=int,
+        required=False,
+        default=1000,
+        help="flag to set the number of transverse momentum cells used to find the pseudorapidity boundaries"
+    )
+    parser.add_argument(
+        "--capacity",
+        type=int,
+        required=False,
+        default=32768,
+        help="flag to set the capacity of the quantile sketches"
+    )
+    parser.add_argument(
+        "--step_size",
+        type=step_size,
+        required=False,
+        default="100 MB",
+        help="flag to set the size of the chunks read from the input files"
+    )
+    parser.add_argument(
+        "--nbins",
+        type=int,
+        required=False,
+        default=10,
+        help="flag to set the number of sets of each variable (the maximum number if --min_signal is given)"
+    )
+    parser.add_argument(
+        "--min_signal",
+        type=float,
+        required=False,
+        default=None,
+        help="flag to set the minimum number of signal candidates of each meson and polarity in each bin"
+    )
     return parser.parse_args()
 
 def dir_path(string):
@@ -76,42 +144,215 @@ def dir_path(string):
         return string
     else:
         raise NotADirectoryError(string)
+
+def step_size(string):
+    '''
+    Checks if a given string is a valid step size for uproot.iterate.
+    If it is an integer, returns it as a number of events. Otherwise it is returned as a memory size (e.g. "100 MB").
+    '''
+    if string.isdigit():
+        return int(string)
+    else:
+        return string
+
+def sketch_dataset(filename):
+    '''
+    Reads the transverse momentum and pseudorapidity of the events in filename in chunks, keeping only the
+    events with pT below PT_MAX. The transverse momentum is added to a single sketch, and the pseudorapidity to
+    the sketch of the cell of transverse momentum of each event. The signal candidates of each meson are counted
+    in a fine grid of transverse momentum cells and pseudorapidity cells, adding the events in the signal window
+    and subtracting those in the sidebands.
+
+    Returns the sketch of the transverse momentum, the list of sketches of the pseudorapidity in each cell, the
+    number of events in each cell, and the number of signal candidates of each meson in each cell of the grid.
+    '''
+    pT_sketch = QuantileSketch(args.capacity)
+    eta_sketches = [QuantileSketch(args.capacity) for cell in range(args.cells)]
+    counts = np.zeros(args.cells, dtype=np.int64)
+    signal = np.zeros((len(FLAVOURS), args.cells, ETA_CELLS))
+    for chunk in iterate_data(filename, expressions=STAGE_BRANCHES["create_binning_scheme"], step_size=args.step_size):
+        pT = np.asarray(chunk["D0_PT"], dtype=np.float64)
+        eta = np.asarray(chunk["D0_ETA"], dtype=np.float64)
+        mask = pT < PT_MAX
+        pT, eta = pT[mask], eta[mask]
+        pT_sketch.update(pT)
         
+        distance = np.abs(np.asarray(chunk["D0_MM"], dtype=np.float64)[mask] - D0_PDG_MASS)
+        weights = np.where(distance < SIGNAL_WINDOW, 1.0, np.where(distance < 2*SIGNAL_WINDOW, -1.0, 0.0))
+        grid = eta_cell(eta) + ETA_CELLS*np.clip((pT*args.cells/PT_MAX).astype(np.intp), 0, args.cells-1)
+        flavours = np.asarray(chunk["D0_ID"])[mask]
+        for index, flavour in enumerate(FLAVOURS):
+            is_flavour = flavours==FLAVOURS[flavour]
+            signal[index] += np.bincount(grid[is_flavour], weights=weights[is_flavour], minlength=args.cells*ETA_CELLS).reshape(args.cells, ETA_CELLS)
         
+        cells = np.clip((pT*args.cells/PT_MAX).astype(np.intp), 0, args.cells-1)
+        order = np.argsort(cells, kind="stable")
+        chunk_counts = np.bincount(cells, minlength=args.cells)
+        for cell, values in enumerate(np.split(eta[order], np.cumsum(chunk_counts)[:-1])):
+            if len(values) > 0:
+                eta_sketches[cell].update(values)
+        counts += chunk_counts
+    print(f"checkpoint: {filename} has been sketched")
+    
+    return pT_sketch, eta_sketches, counts, signal
+
+def merge_sketches(results):
+    '''
+    Merges the sketches of several datasets (see sketch_dataset) into the sketches of all of them.
+
+    Returns the merged sketch of the transverse momentum, sketches of the pseudorapidity and cell counts.
+    '''
+    pT_sketch, eta_sketches, counts = results[0][:3]
+    for other_pT, other_eta, other_counts in [result[:3] for result in results[1:]]:
+        pT_sketch.merge(other_pT)
+        for sketch, other in zip(eta_sketches, other_eta):
+            sketch.merge(other)
+        counts = counts + other_counts
+    
+    return pT_sketch, eta_sketches, counts
+
+def eta_cell(eta):
+    '''
+    Returns the index of the cell of the grid of pseudorapidity in which each value of eta falls. Values
+    outside ETA_RANGE are put in the first or last cell.
+    '''
+    return np.clip(((eta - ETA_RANGE[0])*ETA_CELLS/(ETA_RANGE[1] - ETA_RANGE[0])).astype(np.intp), 0, ETA_CELLS-1)
+
+def signal_in_bins(signal, start, stop, eta_bins):
+    '''
+    Estimates the number of signal candidates of each sample in the bins given by the cells of transverse
+    momentum from start to stop (not included) and the boundaries of pseudorapidity eta_bins. Within each cell
+    of pseudorapidity the candidates are taken to be evenly spread.
+
+    Returns an array with one row per sample and one column per bin.
+    '''
+    profile = signal[:, start:stop].sum(axis=1)
+    cumulative = np.concatenate([np.zeros((len(profile), 1)), np.cumsum(profile, axis=1)], axis=1)
+    positions = np.clip((np.asarray(eta_bins) - ETA_RANGE[0])*ETA_CELLS/(ETA_RANGE[1] - ETA_RANGE[0]), 0, ETA_CELLS)
+    return np.diff([np.interp(positions, np.arange(ETA_CELLS+1), sample) for sample in cumulative], axis=1)
+
+def merge_boundary(signal):
+    '''
+    Finds the set with the fewest signal candidates (the smallest number among all samples is given for each set)
+    and, if it has fewer than the minimum requested, the boundary to remove to merge it with its neighbour with
+    the fewest signal candidates.
+
+    Returns the index of the boundary to remove, or None if no set needs to be merged.
+    '''
+    weakest = int(np.argmin(signal))
+    if len(signal) == 1 or signal[weakest] >= args.min_signal:
+        return None
+    if weakest == 0:
+        return 1
+    if weakest == len(signal)-1 or signal[weakest-1] <= signal[weakest+1]:
+        return weakest
+    return weakest + 1
+
+def sets_for(signal):
+    '''
+    Returns the number of sets into which the given number of signal candidates of the smallest sample can be
+    split, keeping at least the minimum number requested in each of them and at most --nbins sets.
+    '''
+    return int(np.clip(signal//args.min_signal, 1, args.nbins))
+
+def slice_cells(pT_bins, probabilities, counts, total):
+    '''
+    Finds the cells of transverse momentum making up each set between consecutive pT boundaries. The cell
+    holding a boundary is given to the set in which most of its events are, using the number of events below
+    the boundary (a fraction probabilities[i] of the total for the ith boundary).
+
+    Returns the first and last (not included) cell of each set, and the number of events of the cells at its
+    edges which belong to the neighbouring sets (at most).
+    '''
+    nbins = len(pT_bins) - 1
+    cells = np.clip((pT_bins*len(counts)/PT_MAX).astype(np.intp), 0, len(counts)-1)
+    before = np.r_[0, np.cumsum(counts)]
+    
+    starts = np.empty(nbins, dtype=np.intp)
+    stops = np.empty(nbins, dtype=np.intp)
+    shared = np.zeros(nbins, dtype=np.int64)
+    starts[0] = cells[0]
+    stops[-1] = cells[-1] + 1
+    for i in np.arange(1, nbins):
+        cell = cells[i]
+        below = int(np.clip(total*probabilities[i] - before[cell], 0, counts[cell]))
+        if 2*below >= counts[cell]:
+            stops[i-1], starts[i] = cell + 1, cell + 1
+            shared[i-1] += counts[cell] - below
+        else:
+            stops[i-1], starts[i] = cell, cell
+            shared[i] += below
+    # a set narrower than a cell keeps the cell of its lower boundary
+    stops = np.maximum(stops, starts + 1)
+    
+    return starts, stops, shared
+
 # - - - - - - - MAIN BODY - - - - - - - #
-NBINS = 10
+PT_MAX = 10000 # select particles with pT below 10 GeV/c
+SIGNAL_WINDOW = 20 # MeV, half width of the signal window around the mass of the D0
+ETA_RANGE = (1.5, 5.5)
+ETA_CELLS = 200
 args = parse_arguments()
 
-# import data
-tree_name = "D02Kpi_Tuple/DecayTree"
-data = uproot.concatenate((f"{args.input}/{polarity}_data_{args.year}_{args.size}.root:{tree_name}" for polarity in ["up", "down"]))
+# sketch data
+files = [f"{args.input}/{polarity}_data_{args.year}_{args.size}_clean" for polarity in ["up", "down"]]
+if args.workers > 1:
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("fork")) as executor:
+        results = list(executor.map(sketch_dataset, files))
+else:
+    results = list(map(sketch_dataset, files))
+pT_sketch, eta_sketches, counts = merge_sketches(results)
+# one sample per meson and polarity, as each of them is fitted on its own
+samples = [f"{flavour}_{polarity}" for polarity in ["up", "down"] for flavour in FLAVOURS]
+signal = np.concatenate([result[3] for result in results])
 
-# select particles with pT below 10 GeV/c
-
-length = len(data["D0_PT"])
+length = pT_sketch.count
 print(length)
-mask = np.ones(length)
-mask = np.logical_and(mask, data["D0_PT"]<10000)
-length = np.sum(mask)
-data = data[mask]
 
 # create bins
-bins = np.empty((NBINS+1, NBINS+1))
-pT_frame = pd.DataFrame({'Values': data["D0_PT"]})
-pT_res, pT_bins = pd.qcut(pT_frame['Values'], q=NBINS, retbins=True)
-bins[0] = pT_bins
-
-length = len(data["D0_PT"])
-for i in np.arange(0, NBINS):
-    bin_mask = np.ones(length)
-    bin_mask = np.logical_and(bin_mask, pT_bins[i]<data["D0_PT"])
-    bin_mask = np.logical_and(bin_mask, pT_bins[i+1]>=data["D0_PT"])
-    selected_data = data[bin_mask]
-    eta_frame = pd.DataFrame({'Values': selected_data["D0_ETA"]})
-    eta_frame['TimeBins'], eta_bins = pd.qcut(eta_frame['Values'], q=NBINS, retbins=True)
-    timeCounts = eta_frame['TimeBins'].value_counts()
-    print(timeCounts)
-    bins[i+1] = eta_bins
-
-# outputbin edges 
-np.savetxt(f"{args.path}/{args.year}_{args.size}_bins.txt", bins, delimiter=',')
+if args.min_signal is None:
+    nbins = args.nbins
+else:
+    nbins = sets_for(signal.sum(axis=(1, 2)).min())
+probabilities = np.linspace(0, 1, nbins+1)
+pT_bins = pT_sketch.quantiles(probabilities)
+print(f"pT boundaries found with a rank error of at most {pT_sketch.error} events ({100*pT_sketch.relative_error():.3g}% of the events)")
+
+starts, stops, shared = slice_cells(pT_bins, probabilities, counts, length)
+if args.min_signal is not None:
+    # merge the sets of transverse momentum with too few signal candidates
+    boundary = merge_boundary(np.array([signal_in_bins(signal, starts[i], stops[i], ETA_RANGE).min() for i in range(len(starts))]))
+    while boundary is not None:
+        pT_bins = np.delete(pT_bins, boundary)
+        probabilities = np.delete(probabilities, boundary)
+        starts, stops, shared = slice_cells(pT_bins, probabilities, counts, length)
+        boundary = merge_boundary(np.array([signal_in_bins(signal, starts[i], stops[i], ETA_RANGE).min() for i in range(len(starts))]))
+
+eta_edges = []
+bin_signal = []
+for i in np.arange(0, len(pT_bins)-1):
+    eta_sketch = QuantileSketch(args.capacity)
+    for cell in np.arange(starts[i], stops[i]):
+        eta_sketch.merge(eta_sketches[cell])
+    if args.min_signal is None:
+        eta_bins = eta_sketch.quantiles(np.linspace(0, 1, args.nbins+1))
+    else:
+        eta_bins = eta_sketch.quantiles(np.linspace(0, 1, sets_for(signal_in_bins(signal, starts[i], stops[i], ETA_RANGE).min())+1))
+        # merge the bins of pseudorapidity with too few signal candidates
+        boundary = merge_boundary(signal_in_bins(signal, starts[i], stops[i], eta_bins).min(axis=0))
+        while boundary is not None:
+            eta_bins = np.delete(eta_bins, boundary)
+            boundary = merge_boundary(signal_in_bins(signal, starts[i], stops[i], eta_bins).min(axis=0))
+    eta_edges.append(eta_bins)
+    bin_signal.extend(signal_in_bins(signal, starts[i], stops[i], eta_bins).T)
+    error = eta_sketch.error + shared[i] + pT_sketch.error
+    print(f"pT bin {i}: {eta_sketch.count} events in {len(eta_bins)-1} bins, eta boundaries found with a rank error of at most {error} events ({100*error/max(eta_sketch.count, 1):.3g}% of the events)")
+
+# output binning scheme
+scheme = build_scheme(pT_bins, eta_edges, year=args.year, size=args.size, pT_max=PT_MAX, min_signal=args.min_signal)
+for entry, estimate in zip(scheme["bins"], bin_signal):
+    entry["signal"] = {sample: round(float(value), 1) for sample, value in zip(samples, estimate)}
+    if args.min_signal is not None and min(estimate) < args.min_signal:
+        print(f"WARNING: bin {entry['name']} has only {min(estimate):.0f} signal candidates in its smallest sample, as there is not enough data to reach {args.min_signal}")
+print(f"The binning scheme has {len(scheme['bins'])} bins")
+save_scheme(scheme_path(args.path, args.year, args.size), scheme)
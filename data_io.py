@@ -0,0 +1,331 @@
+"""
+data_io.py
+
+This code is used to write and read the datasets passed between the stages of the analysis. Besides root files, the datasets can be written in the Arrow IPC (.arrow) or Parquet (.parquet) formats, with a selectable compression.
+Arrow and Parquet files are read memory-mapped, so the columns are not copied into memory until they are used. An uncompressed Arrow file can be read without any deserialisation at all.
+The functions take the name of the file without its extension. When reading, the format is found from the file that exists, so the stages reading a dataset do not need to know which format it was written in. When a dataset is written, any copy of it left in another format by an earlier run is removed, so that it is not read instead of the new one.
+Datasets which do not fit in memory can be written in chunks using DataWriter, and read in chunks using iterate_data.
+A dataset can store an offsets index with the range of entries of each group of events stored together, so that each group can be read on its own as a contiguous range. Two indices are used: the flavour index of the clean data, with the D0 and D0bar events (see sort_by_flavour), and the bin index of the binned data, with the events of each bin of the binning scheme (see apply_binning_scheme.py).
+It is not meant to be run on its own, but imported by the scripts that write or read datasets.
+
+Author: Marc Oriol Pérez (marc.oriolperez@student.manchester.ac.uk)
+Last edited: 17th October 2026
+"""
+
+# - - - - - - IMPORT STATEMENTS - - - - - - #
+
+import os
+import json
+import numpy as np
+import uproot
+import awkward as ak
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pa = None
+
+# - - - - - - - FORMATS - - - - - - - #
+
+TREE_NAME = "D02Kpi_Tuple/DecayTree"
+
+# tree (in root files) and prefix of the branches in which each offsets index is stored
+INDICES = {
+    "flavour": {"tree": "FlavourOffsets", "prefix": ""},
+    "bin": {"tree": "BinOffsets", "prefix": "bin"},
+}
+
+FLAVOURS = {
+    "D0": 421,
+    "D0bar": -421,
+}
+
+EXTENSIONS = {
+    "root": ".root",
+    "arrow": ".arrow",
+    "parquet": ".parquet",
+}
+
+COMPRESSIONS = {
+    "root": ["none", "zlib", "lzma", "lz4", "zstd"],
+    "arrow": ["none", "lz4", "zstd"],
+    "parquet": ["none", "snappy", "gzip", "brotli", "lz4", "zstd"],
+}
+
+ROOT_COMPRESSIONS = {
+    "zlib": uproot.ZLIB(1),
+    "lzma": uproot.LZMA(9),
+    "lz4": uproot.LZ4(4),
+    "zstd": uproot.ZSTD(5),
+}
+
+# - - - - - - - FUNCTIONS - - - - - - - #
+
+def check_format(fmt, compression=None):
+    '''
+    Checks that the given format and compression can be used, raising an error otherwise.
+    '''
+    if fmt not in EXTENSIONS:
+        raise ValueError(f"Unknown format {fmt}, it must be one of: {list(EXTENSIONS)}")
+    if compression is not None and compression not in COMPRESSIONS[fmt]:
+        raise ValueError(f"Compression {compression} cannot be used with {fmt}, it must be one of: {COMPRESSIONS[fmt]}")
+    if fmt != "root" and pa is None:
+        raise ImportError(f"pyarrow is needed to use the {fmt} format")
+
+def find_format(filename):
+    '''
+    Finds the format of the dataset with the given name (without extension) from the file that exists. If it
+    exists in more than one format, it is not known which one is up to date, so an error is given.
+
+    Returns the format.
+    '''
+    found = [fmt for fmt, extension in EXTENSIONS.items() if os.path.exists(f"{filename}{extension}")]
+    if len(found) > 1:
+        raise ValueError(f"The dataset {filename} exists in more than one format ({found}), remove the ones not up to date")
+    if len(found) == 0:
+        raise FileNotFoundError(f"No dataset {filename} found with any of the extensions {list(EXTENSIONS.values())}")
+    return found[0]
+
+def remove_other_formats(filename, fmt):
+    '''
+    Removes the copies of the dataset with the given name (without extension) in formats other than the given one.
+    '''
+    for other, extension in EXTENSIONS.items():
+        if other != fmt and os.path.exists(f"{filename}{extension}"):
+            print(f"Removing {filename}{extension}, written in another format by an earlier run")
+            os.remove(f"{filename}{extension}")
+
+def to_table(data):
+    '''
+    Converts an awkward array of flat records into an Arrow table, one column per field.
+    '''
+    return pa.table({column: np.asarray(data[column]) for column in data.fields})
+
+def from_table(table):
+    '''
+    Converts an Arrow table into an awkward array of records. Columns stored in a single chunk without
+    missing values are viewed rather than copied.
+    '''
+    return ak.zip({column: table.column(column).to_numpy() for column in table.column_names}, depth_limit=1)
+
+def split_by_flavour(data):
+    '''
+    Splits the events in data by the flavour of the D0 meson, keeping their order within each flavour. The
+    events whose D0_ID is not one of FLAVOURS are kept together after them, so no events are lost.
+
+    Returns a list with the events of each flavour, in the order of FLAVOURS, followed by the other events.
+    '''
+    masks = [data["D0_ID"]==FLAVOURS[flavour] for flavour in FLAVOURS]
+    return [data[mask] for mask in masks] + [data[~np.logical_or.reduce(masks)]]
+
+def sort_by_flavour(data):
+    '''
+    Orders the events in data by the flavour of the D0 meson (all the D0 first, then all the D0bar, then any
+    others), keeping their order within each flavour. No sort is needed, the events of each flavour are simply
+    gathered together.
+
+    Returns the ordered data and the offsets index, a dictionary with the first and last (not included) entry
+    of each flavour.
+    '''
+    parts = split_by_flavour(data)
+
+    offsets = {}
+    start = 0
+    for flavour, part in zip(FLAVOURS, parts):
+        offsets[flavour] = [start, start + len(part)]
+        start += len(part)
+
+    return ak.concatenate(parts), offsets
+
+class DataWriter:
+    '''
+    Writes a dataset in chunks to filename (without extension) in the given format, so that the whole dataset
+    never needs to be held in memory. If compression is None, the default compression of the format is used.
+    The file is created with the fields of the first chunk given to extend, and finished by close.
+    If offsets (a dictionary with the first and last, not included, entry of each group, e.g. the one given by
+    sort_by_flavour) is given, it is stored in the file as the given index (flavour or bin, see INDICES), so that
+    each group can be read on its own with read_data. In root files it is stored in its own tree, and in Arrow
+    and Parquet files in the metadata of the schema. Once the file is finished, the copies of the dataset in other
+    formats are removed (see remove_other_formats).
+    '''
+    def __init__(self, filename, fmt="root", compression=None, offsets=None, index="flavour"):
+        check_format(fmt, compression)
+        self.filename = filename
+        self.path = f"{filename}{EXTENSIONS[fmt]}"
+        self.fmt = fmt
+        self.compression = compression
+        self.offsets = offsets
+        self.index = index
+        self.outfile = None
+        self.schema = None
+        self.sink = None
+        print(f"Writing to {self.path}...")
+
+    def open(self, data):
+        '''
+        Creates the file, using the fields and types of data.
+        '''
+        if self.fmt == "root":
+            if self.compression is None:
+                self.outfile = uproot.recreate(self.path)
+            else:
+                self.outfile = uproot.recreate(self.path, compression=None if self.compression == "none" else ROOT_COMPRESSIONS[self.compression])
+            self.outfile.mktree(TREE_NAME, {column: ak.type(data[column]) for column in data.fields})
+            if self.offsets is not None:
+                prefix = INDICES[self.index]["prefix"]
+                self.outfile[INDICES[self.index]["tree"]] = {f"{prefix}{name}_{edge}": np.array([offset], dtype=np.int64) for name, offsets in self.offsets.items() for edge, offset in zip(["start", "stop"], offsets)}
+            return
+
+        self.schema = to_table(data).schema
+        if self.offsets is not None:
+            self.schema = self.schema.with_metadata({f"{self.index}_offsets": json.dumps(self.offsets)})
+        if self.fmt == "arrow":
+            options = pa.ipc.IpcWriteOptions(compression=None if self.compression in [None, "none"] else self.compression)
+            self.sink = pa.OSFile(self.path, "wb")
+            self.outfile = pa.ipc.new_file(self.sink, self.schema, options=options)
+        elif self.fmt == "parquet":
+            self.outfile = pa.parquet.ParquetWriter(self.path, self.schema, compression="snappy" if self.compression is None else self.compression)
+
+    def extend(self, data):
+        '''
+        Appends the events in data to the file, creating it if needed.
+        '''
+        if self.outfile is None:
+            self.open(data)
+        if len(data) == 0:
+            return
+        if self.fmt == "root":
+            self.outfile[TREE_NAME].extend({branch: data[branch] for branch in data.fields})
+        else:
+            self.outfile.write_table(to_table(data).replace_schema_metadata(self.schema.metadata))
+
+    def close(self):
+        '''
+        Finishes the file. If no data was ever given to extend, no file is written.
+
+        Returns the name of the file written, or None if no file was written.
+        '''
+        if self.outfile is None:
+            print(f"WARNING: no data was given, {self.path} has not been written")
+            return None
+        self.outfile.close()
+        if self.sink is not None:
+            self.sink.close()
+        remove_other_formats(self.filename, self.fmt)
+        return self.path
+
+def write_data(filename, data, fmt="root", compression=None, offsets=None, index="flavour"):
+    '''
+    Writes data to filename (without extension) in the given format. If compression is None, the default
+    compression of the format is used. If offsets is given, it is stored in the file as the given index (see
+    DataWriter).
+
+    Returns the name of the file written.
+    '''
+    writer = DataWriter(filename, fmt, compression, offsets, index)
+    writer.extend(data)
+    return writer.close()
+
+def read_offsets(filename, fmt=None, index="flavour"):
+    '''
+    Reads the given offsets index (flavour or bin, see INDICES) stored in the dataset with the given name
+    (without extension). If fmt is None, the format is found from the file that exists.
+
+    Returns a dictionary with the first and last (not included) entry of each group (flavour or bin), or None
+    if the dataset has no such index.
+    '''
+    if fmt is None:
+        fmt = find_format(filename)
+    check_format(fmt)
+    path = f"{filename}{EXTENSIONS[fmt]}"
+
+    if fmt == "root":
+        tree = INDICES[index]["tree"]
+        prefix = INDICES[index]["prefix"]
+        with uproot.open(path) as infile:
+            if tree not in infile:
+                return None
+            offsets = infile[tree].arrays(library="np")
+        names = [branch[len(prefix):-len("_start")] for branch in offsets if branch.endswith("_start")]
+        return {name: [int(offsets[f"{prefix}{name}_start"][0]), int(offsets[f"{prefix}{name}_stop"][0])] for name in names}
+    if fmt == "arrow":
+        metadata = pa.ipc.open_file(pa.memory_map(path, "r")).schema.metadata
+    else:
+        metadata = pa.parquet.read_schema(path).metadata
+    key = f"{index}_offsets".encode()
+    if metadata is None or key not in metadata:
+        return None
+    return json.loads(metadata[key])
+
+def iterate_data(filename, expressions=None, fmt=None, step_size="100 MB"):
+    '''
+    Reads the dataset with the given name (without extension) in chunks, so that it never needs to be held in
+    memory as a whole. If fmt is None, the format is found from the file that exists. If expressions is given,
+    only those branches are read. The step size is used as in uproot.iterate for root files (a number of
+    events or a memory size). Arrow files are read in the record batches in which they were written, which are
+    views of the memory-mapped file, and Parquet files in batches of step_size events (if it is a number).
+
+    Yields the chunks as awkward arrays of records.
+    '''
+    if fmt is None:
+        fmt = find_format(filename)
+    check_format(fmt)
+    path = f"{filename}{EXTENSIONS[fmt]}"
+
+    if fmt == "root":
+        yield from uproot.iterate(f"{path}:{TREE_NAME}", expressions=expressions, step_size=step_size)
+    elif fmt == "arrow":
+        reader = pa.ipc.open_file(pa.memory_map(path, "r"))
+        for i in range(reader.num_record_batches):
+            table = pa.Table.from_batches([reader.get_batch(i)])
+            yield from_table(table if expressions is None else table.select(expressions))
+    else:
+        batch_size = step_size if isinstance(step_size, int) else 1000000
+        for batch in pa.parquet.ParquetFile(path, memory_map=True).iter_batches(batch_size=batch_size, columns=expressions):
+            yield from_table(pa.Table.from_batches([batch]))
+
+def read_data(filename, expressions=None, fmt=None, flavour=None, bin=None):
+    '''
+    Reads the dataset with the given name (without extension). If fmt is None, the format is found from the
+    file that exists. If expressions is given, only those branches are read. If flavour is given (D0 or
+    D0bar), only the events of that flavour are read, using the flavour offsets index stored in the file (see
+    sort_by_flavour). In the same way, if bin is given (the name of a bin of the binning scheme), only the
+    events of that bin are read, using the bin offsets index. With Arrow files this is a view of the
+    memory-mapped file, and with root files only the entries of that flavour or bin are read.
+
+    Returns the data as an awkward array of records.
+    '''
+    if fmt is None:
+        fmt = find_format(filename)
+    check_format(fmt)
+    path = f"{filename}{EXTENSIONS[fmt]}"
+
+    if flavour is not None and bin is not None:
+        raise ValueError("Only one of flavour and bin can be given")
+    index, group = ("flavour", flavour) if bin is None else ("bin", bin)
+
+    start, stop = None, None
+    if group is not None:
+        offsets = read_offsets(filename, fmt, index)
+        if offsets is None:
+            raise ValueError(f"{path} has no {index} offsets index, so the events of {index} {group} cannot be read on their own")
+        if group not in offsets:
+            raise ValueError(f"{path} has no {index} {group}, it must be one of: {list(offsets)}")
+        start, stop = offsets[group]
+
+    if fmt == "root":
+        if group is None:
+            return uproot.concatenate(f"{path}:{TREE_NAME}", expressions=expressions)
+        with uproot.open(path) as infile:
+            return infile[TREE_NAME].arrays(expressions, entry_start=start, entry_stop=stop)
+    if fmt == "arrow":
+        table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+    else:
+        table = pa.parquet.read_table(path, columns=expressions, memory_map=True)
+    if expressions is not None:
+        table = table.select(expressions)
+    if group is not None:
+        table = table.slice(start, stop - start)
+    return from_table(table)
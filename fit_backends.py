@@ -0,0 +1,152 @@
+"""
+fit_backends.py
+
+This code chooses how the likelihood is evaluated in the fits done with RooFit by fit_global.py and model_fitting.py. The backends available are:
+    default     The likelihood is evaluated as RooFit does by default, which depends on the version of ROOT.
+    legacy      The likelihood is evaluated one event at a time, on a single core.
+    cpu         The likelihood is evaluated with the vectorised CPU backend of RooFit, which computes each part of the model for all the events at once. In versions of ROOT older than 6.30 this is the batch mode.
+    numcpu      The likelihood is split into several parts evaluated in parallel by separate processes (NumCPU). The number of processes can be chosen, by default it is the number of cores available.
+    codegen     The code of the likelihood is generated and compiled, and differentiated automatically, so that the minimiser is given its analytic gradient instead of estimating it by finite differences, which takes two evaluations of the likelihood per free parameter. It needs ROOT 6.32 or newer, and if the code of any part of the model cannot be generated the cpu backend is used instead.
+Independently of the backend, the likelihood can be offset, so that the minimiser works with the difference to its value at the start of the fit. This avoids the loss of precision in the sum of the likelihood of a large number of events, and usually makes the fit converge in fewer steps.
+The fits are performed by fit_pdf. With every backend but codegen the pdf is fitted with fitTo, as without a choice of backend, and Minuit does not report the number of evaluations of the likelihood. With the codegen backend the likelihood is built and minimised in the same way as fitTo does (MIGRAD followed by HESSE), counting its evaluations. So that the analytic gradient can be compared with finite differences, the fit can optionally be done first from the same starting values on the same generated code without its gradient (codegen_no_grad), which takes as long as a fit with finite differences. Each run is described by the backend used, how the gradient is obtained, the number of evaluations of the likelihood, the time taken and the minimum of the likelihood, which are written to the fit log, with a row of column labels, by write_fit_log.
+ROOT is only imported when a fit is done, so that this file can be imported by the scripts that can also fit without ROOT.
+It is not meant to be run on its own, but imported by the scripts that perform fits.
+
+Author: Marc Oriol Pérez (marc.oriolperez@student.manchester.ac.uk)
+Last edited: 17th October 2026
+"""
+
+# - - - - - - IMPORT STATEMENTS - - - - - - #
+
+import os
+import time
+
+# - - - - - - - BACKENDS - - - - - - - #
+
+FIT_BACKENDS = ["default", "legacy", "cpu", "numcpu", "codegen"]
+
+# columns of the fit log, with a row for each run of a fit
+FIT_LOG_COLUMNS = ["backend", "gradient", "nll_calls", "wall_time", "min_nll"]
+
+# - - - - - - - FUNCTIONS - - - - - - - #
+
+def fit_options(backend="default", num_cpu=None, offset=False, gradient=True):
+    '''
+    Builds the options to be given to fitTo to evaluate the likelihood with the given backend (see the
+    description of this file). The number of processes is only used by the numcpu backend, and if it is None
+    the number of cores available is used. If gradient is False, the codegen backend does not give the minimiser
+    the analytic gradient. If offset is True, the likelihood is offset.
+
+    Returns the list of options (RooCmdArg).
+    '''
+    if backend not in FIT_BACKENDS:
+        raise ValueError(f"Unknown fit backend {backend}, it must be one of: {FIT_BACKENDS}")
+    import ROOT
+
+    # EvalBackend was added in ROOT 6.30, before it the vectorised evaluation was called the batch mode
+    new_backends = hasattr(ROOT.RooFit, "EvalBackend")
+    options = []
+    if backend == "legacy" and new_backends:
+        options.append(ROOT.RooFit.EvalBackend("legacy"))
+    elif backend == "cpu":
+        options.append(ROOT.RooFit.EvalBackend("cpu") if new_backends else ROOT.RooFit.BatchMode(True))
+    elif backend == "numcpu":
+        if new_backends:
+            # the processes are only used by the legacy evaluation, which is not the default in recent versions
+            options.append(ROOT.RooFit.EvalBackend("legacy"))
+        options.append(ROOT.RooFit.NumCPU(os.cpu_count() if num_cpu is None else num_cpu))
+    elif backend == "codegen":
+        if not new_backends:
+            raise RuntimeError("The codegen backend is not available in this version of ROOT")
+        options.append(ROOT.RooFit.EvalBackend("codegen" if gradient else "codegen_no_grad"))
+    if offset:
+        options.append(ROOT.RooFit.Offset(True))
+    return options
+
+def minimise(nll, print_level=None):
+    '''
+    Minimises the given likelihood as done by fitTo: with MIGRAD, followed by HESSE to compute the errors. The print
+    level of Minuit can be given.
+
+    Returns the fit result (RooFitResult) and the number of evaluations of the likelihood.
+    '''
+    import ROOT
+
+    minimizer = ROOT.RooMinimizer(nll)
+    if print_level is not None:
+        minimizer.setPrintLevel(print_level)
+    minimizer.migrad()
+    minimizer.hesse()
+    return minimizer.save(), minimizer.evalCounter()
+
+def fit_pdf(pdf, data, backend="default", num_cpu=None, offset=False, print_level=None, options=(), reference=False):
+    '''
+    Performs an extended fit of the given pdf to the given data, with the likelihood evaluated by the given backend
+    (see fit_options). The print level of Minuit and other options of fitTo (RooCmdArg) can be given. With every
+    backend but codegen the fit is done by fitTo. With the codegen backend the likelihood is built first, and if
+    this fails, because the code of some part of the model cannot be generated, the fit is done by fitTo with the
+    cpu backend instead. Otherwise it is minimised by minimise, and if reference is True it is first minimised from
+    the same starting values without the analytic gradient, so that both can be compared.
+
+    Returns the fit result (RooFitResult) of the last run, and a list with a dictionary describing each run (see
+    FIT_LOG_COLUMNS). The number of evaluations of the likelihood is None when the fit is done by fitTo.
+    '''
+    import ROOT
+
+    runs = []
+    if backend == "codegen":
+        try:
+            nll = pdf.createNLL(data, ROOT.RooFit.Extended(True), *fit_options(backend, num_cpu, offset))
+        except Exception as error:
+            print(f"WARNING: the likelihood cannot be differentiated automatically ({error}), the cpu backend is used instead")
+            backend = "cpu"
+
+    if backend == "codegen":
+        if reference:
+            parameters = pdf.getParameters(data)
+            initial = parameters.snapshot()
+            start = time.perf_counter()
+            result, nll_calls = minimise(pdf.createNLL(data, ROOT.RooFit.Extended(True), *fit_options(backend, num_cpu, offset, gradient=False)), print_level)
+            runs.append({"backend": backend, "gradient": "numerical", "nll_calls": nll_calls, "wall_time": time.perf_counter() - start, "min_nll": result.minNll()})
+            # the fit with the analytic gradient starts from the same values
+            parameters.assign(initial)
+        start = time.perf_counter()
+        result, nll_calls = minimise(nll, print_level)
+        runs.append({"backend": backend, "gradient": "automatic", "nll_calls": nll_calls, "wall_time": time.perf_counter() - start, "min_nll": result.minNll()})
+    else:
+        if print_level is not None:
+            options = [*options, ROOT.RooFit.PrintLevel(print_level)]
+        start = time.perf_counter()
+        result = pdf.fitTo(data, ROOT.RooFit.Save(True), ROOT.RooFit.Extended(True), *options, *fit_options(backend, num_cpu, offset))
+        runs.append({"backend": backend, "gradient": "numerical", "nll_calls": None, "wall_time": time.perf_counter() - start, "min_nll": result.minNll()})
+
+    for run in runs:
+        nll_calls = "an unknown number of" if run["nll_calls"] is None else run["nll_calls"]
+        print(f"The fit with the {run['backend']} backend and a {run['gradient']} gradient took {run['wall_time']:.2f} s and {nll_calls} evaluations of the likelihood")
+    return result, runs
+
+def write_fit_log(path, runs):
+    '''
+    Writes the description of each run of a fit given by fit_pdf to the fit log in the given path, one row per run
+    after a row of column labels (see FIT_LOG_COLUMNS). Unknown numbers of evaluations are written as n/a.
+    '''
+    with open(path, "w") as file:
+        file.write(", ".join(FIT_LOG_COLUMNS) + "\n")
+        for run in runs:
+            file.write(", ".join("n/a" if run[column] is None else str(run[column]) for column in FIT_LOG_COLUMNS) + "\n")
+
+def read_fit_log(path):
+    '''
+    Reads the fit log written by write_fit_log.
+
+    Returns a list with a dictionary for each run, with the number of evaluations as an integer (None if unknown)
+    and the wall time and minimum of the likelihood as floats.
+    '''
+    with open(path) as file:
+        columns = file.readline().strip().split(", ")
+        runs = [dict(zip(columns, line.strip().split(", "))) for line in file if line.strip()]
+    for run in runs:
+        run["nll_calls"] = None if run["nll_calls"] == "n/a" else int(run["nll_calls"])
+        run["wall_time"] = float(run["wall_time"])
+        run["min_nll"] = float(run["min_nll"])
+    return runs
@@ -0,0 +1,108 @@
+"""
+fit_cache.py
+
+This code implements a cache of the results of the fits done by fit_global.py and model_fitting.py, so that a fit is not repeated when nothing it depends on has changed. Each result is stored in a small json file in the cache directory, named after a hash of everything that determines it: the data fitted (the checksum of the input files, or the contents of the array of masses or of the histogram), the definition of the model (the checksum of the source files in which it is built), the fixed parameters taken from the global fit and the options of the fit.
+As the name of each result depends on its contents, a result is never used once any of these has changed, and is simply left unused. When the number of results in the cache goes over the given limit, the least recently used ones are removed.
+It is not meant to be run on its own, but imported by the scripts that perform fits.
+
+Author: Marc Oriol Pérez (marc.oriolperez@student.manchester.ac.uk)
+Last edited: 17th October 2026
+"""
+
+# - - - - - - IMPORT STATEMENTS - - - - - - #
+
+import os
+import json
+import hashlib
+import numpy as np
+
+# - - - - - - - FUNCTIONS - - - - - - - #
+
+def file_checksum(path, chunk_size=16*1024*1024):
+    '''
+    Computes the checksum of the contents of a file, reading it in chunks of chunk_size bytes.
+
+    Returns the checksum as a hexadecimal string.
+    '''
+    checksum = hashlib.sha1()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+def array_checksum(array):
+    '''
+    Computes the checksum of the contents of an array, together with its type and shape.
+
+    Returns the checksum as a hexadecimal string.
+    '''
+    array = np.ascontiguousarray(array)
+    checksum = hashlib.sha1(f"{array.dtype.str}|{array.shape}|".encode())
+    checksum.update(array.tobytes())
+    return checksum.hexdigest()
+
+def fit_key(files=(), arrays=(), configuration=None):
+    '''
+    Builds the name of the result of a fit from the checksums of the given files (the input data and the source
+    files defining the model) and arrays (the data fitted and the fixed parameters), and the given configuration
+    (a dictionary with the options of the fit, which must be serialisable to json).
+
+    Returns the key as a hexadecimal string.
+    '''
+    description = {
+        "files": [file_checksum(path) for path in files],
+        "arrays": [array_checksum(array) for array in arrays],
+        "configuration": configuration or {},
+    }
+    return hashlib.sha1(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+def evict(cache_dir, max_entries, keep=None):
+    '''
+    Removes the least recently used results in cache_dir until there are at most max_entries of them. The result
+    named keep is never removed. The time of last use of each result is given by its modification time, which is
+    updated every time the result is used.
+    '''
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".json") or name == keep:
+            continue
+        try:
+            entries.append((os.stat(f"{cache_dir}/{name}").st_mtime, name))
+        except FileNotFoundError:
+            continue
+
+    excess = len(entries) + (keep is not None) - max_entries
+    for last_used, name in sorted(entries)[:max(excess, 0)]:
+        try:
+            os.remove(f"{cache_dir}/{name}")
+        except FileNotFoundError:
+            pass
+
+def load_result(cache_dir, key):
+    '''
+    Reads the result of the fit with the given key from cache_dir, marking it as recently used.
+
+    Returns the result, or None if it is not in the cache.
+    '''
+    path = f"{cache_dir}/{key}.json"
+    try:
+        with open(path) as file:
+            result = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    os.utime(path) # mark the result as recently used
+    return result
+
+def store_result(cache_dir, key, result, max_entries=10000):
+    '''
+    Writes the result of the fit with the given key (which must be serialisable to json) to cache_dir, and removes
+    the least recently used results if there are more than max_entries.
+    '''
+    name = f"{key}.json"
+    temporary = f"{cache_dir}/{name}.{os.getpid()}.tmp"
+    with open(temporary, "w") as file:
+        json.dump(result, file)
+    # the result only becomes visible once it is complete, so an interrupted write is never used
+    os.replace(temporary, f"{cache_dir}/{name}")
+
+    evict(cache_dir, max_entries, keep=name)
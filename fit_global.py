@@ -2,19 +2,24 @@
 fit_global.py
 
 This code is used to perform a global fit on the selected data. In order to do so a simulatenous fit is done on the four datasets (with different mesons and polarities). This simulatenous fit keeps all variables constant across the four fits except for the normalisation constants which are allowed to vary independently. The model used consists of a Crystal Ball function and a Gaussian distribution to model the signal and an Exponential decay to model the background.
-The year of interest and size of the data to be analysed must be specified using the required flags --year --size. It is necessary to specify if the fit should be performed on the binned data or the unbinned data using the flag --binned_fit. There is a flag --path, which is not required. This one is used to specify the directory where the input data is located, and where the output file should be written. By default it is set to be the current working directory.
+The year of interest and size of the data to be analysed must be specified using the required flags --year --size. It is necessary to specify if the fit should be performed on the binned data or the unbinned data using the flag --binned_fit. There also are the flags --input and --path, which are not required. These are used to specify the directory where the input data is located, and where the output file should be written, respectively. By default it is set to be the current working directory.
+In the binned fit, the histograms of the invariant mass are filled from the columns of the clean data of each polarity in a single pass (see mass_histograms.py), without drawing them, so the input data can be in any of the formats written by select_and_clean.py.
+The optional flags --fit_backend --num_cpu --offset set how the likelihood is evaluated (see fit_backends.py). With the codegen backend Minuit is given the analytic gradient of the likelihood. If the optional flag --compare_gradient is given, the fit is first done from the same starting values with the gradient estimated by finite differences, so that both can be compared. For each run of the fit, the backend used, how the gradient is obtained, the number of evaluations of the likelihood (when known), the time taken and the minimum of the likelihood are written to a log file next to the parameters, under a row of column labels, so that they can be compared between backends.
+The optional flag --cache sets a directory in which the results of the fit are kept (see fit_cache.py), identified by the masses or histograms fitted, the source of the model, of the histograms and of the fit backends and the options of the fit. If the same fit has already been done, its parameters are written out at once, without importing ROOT.
 It outputs the value of the constants shared in the simultaneous fit to a text file. This code is heavily inspired by Marc Oriol Pérez (marc.oriolperez@student.manchester.ac.uk), however it has been redesigned so that the binned fit is succesfully performed.
 
 Author: Sam Taylor (samuel.taylor-9@student.manchester.ac.uk) and Laxman Seelan (laxman.seelan@student.manchester.ac.uk)
-Last edited: 5th November 2023
+Last edited: 17th October 2026
 """
 
-import ROOT
 import numpy as np
-import uproot
 import argparse
 import os
-from ROOT import TChain, RooRealVar, RooDataSet, RooGaussian, RooCrystalBall, RooAddPdf, RooArgList, RooFit, RooArgSet, RooDataHist, RooExponential
+import sys
+from data_io import read_offsets
+from mass_histograms import read_masses, fill_histograms, histogram
+from fit_backends import FIT_BACKENDS, fit_pdf, write_fit_log
+from fit_cache import fit_key, load_result, store_result
 import time 
 start_time = time.time()
 def dir_path(string):
@@ -27,6 +32,24 @@ def dir_path(string):
     else:
         raise NotADirectoryError(string)
         
+def flavour_tree(polarity, meson):
+    '''
+    Reads the invariant mass (D0_MM) of the events of the given meson from the clean data of the given
+    polarity. The events of each meson are stored together in that file, so only their range of entries (as
+    given by the offsets index, see data_io.py) is copied into the tree.
+
+    Returns the chain reading the file, which must be kept alive while the tree is used, and the tree.
+    '''
+    filename = f"{args.input}/{polarity}_data_{args.year}_{args.size}_clean"
+    start, stop = read_offsets(filename, "root")[meson]
+
+    chain = TChain("D02Kpi_Tuple/DecayTree")
+    chain.Add(f"{filename}.root")
+    chain.SetBranchStatus("*", 0)
+    chain.SetBranchStatus("D0_MM", 1)
+
+    return chain, chain.CopyTree("", "", stop - start, start)
+
 def parse_arguments():
     '''
     Parses the arguments needed along the code. Arguments:
@@ -34,14 +57,35 @@ def parse_arguments():
     --year      Used to specify the year at which the data was taken the user is interested in.
                 The argument must be one of: [16, 17, 18]. These referr to 2016, 2017 & 2018, respectively.
     --size      Used to specify the amount of events the user is interested in analysing.
-                The argument must be one of: [large, small, medium, 1-8]. The integers specify the number of root
+                The argument must be one of: [large, small, medium, all, 1-8]. The integers specify the number of root
                 files to be read in. Large is equivalent to 8. Medium is equivalent to 4. Small takes 200000 events.
-    --polarity  Used to specify the polarity of the magnet the user is interested in.
-                The argument must be one of: [up, down].
+                All takes every file available in the production directories.
+    --input     Used to specify the directory in which the input data should be found. It is not required,
+                in the case it is not specified, the default path is the current working directory.
+    --path      Used to specify the directory in which the output files should be written. It is not required,
                 in the case it is not specified, the default path is the current working directory.
     --binned_fit
                 Used to specify if the data should be binned before performing the fit or an unbinned fit should be performed.
                 Type either y or Y for a binned fit. Type n or N for an unbinned fit.
+    --fit_backend
+                Used to specify how the likelihood is evaluated in the fit. The argument must be one of: [default, legacy,
+                cpu, numcpu, codegen] (see fit_backends.py). It is not required, in the case it is not specified, the default
+                evaluation of RooFit is used.
+    --num_cpu   Used to specify the number of processes used to evaluate the likelihood with the numcpu backend. It is
+                not required, in the case it is not specified, the number of cores available is used.
+    --offset    Used to specify if the likelihood should be offset. Type either y or Y to offset it. Type n or N not to
+                offset it. It is not required, in the case it is not specified, the likelihood is not offset.
+    --compare_gradient
+                Used to specify if, with the codegen backend, the fit should first be done with the gradient estimated by
+                finite differences, so that both runs are written to the fit log. Type either y or Y to do it. Type n or N
+                not to do it. It is not required, in the case it is not specified, only the fit with the analytic gradient
+                is done.
+    --cache     Used to specify a directory in which the results of the fits are kept. If the same fit has already been
+                done, its results are taken from it. It is not required, in the case it is not specified, the fit is
+                always performed.
+    --cache_entries
+                Used to specify the maximum number of results kept in the cache. When it is exceeded, the least
+                recently used results are removed. It is not required, in the case it is not specified, it is 10000.
     
     Returns the parsed arguments.
     '''
@@ -56,7 +100,7 @@ def parse_arguments():
     parser.add_argument(
         "--size",
         type=str,
-        choices=["large", "medium", "small", "1", "2", "3", "4", "5", "6", "7", "8"],
+        choices=["large", "medium", "small", "all", "1", "2", "3", "4", "5", "6", "7", "8"],
         required=True,
         help="flag to set the data taking year."
     )   
@@ -67,6 +111,13 @@ def parse_arguments():
         default=os.getcwd(),
         help="flag to set the path where the output files should be written to"
     )
+    parser.add_argument(
+        "--input",
+        type=dir_path,
+        required=False,
+        default=os.getcwd(),
+        help="flag to set the path where the input files should be taken from"
+    )
     parser.add_argument(
         "--binned_fit",
         type=str,
@@ -74,6 +125,51 @@ def parse_arguments():
         required=True,
         help="flag to set whether a binned or an unbinned should be performed (y/n)"
     )
+    parser.add_argument(
+        "--fit_backend",
+        type=str,
+        choices=FIT_BACKENDS,
+        required=False,
+        default="default",
+        help="flag to set how the likelihood is evaluated in the fit"
+    )
+    parser.add_argument(
+        "--num_cpu",
+        type=int,
+        required=False,
+        default=None,
+        help="flag to set the number of processes used by the numcpu fit backend"
+    )
+    parser.add_argument(
+        "--offset",
+        type=str,
+        choices=["y", "Y", "n", "N"],
+        required=False,
+        default="n",
+        help="flag to set whether the likelihood should be offset (y/n)"
+    )
+    parser.add_argument(
+        "--compare_gradient",
+        type=str,
+        choices=["y", "Y", "n", "N"],
+        required=False,
+        default="n",
+        help="flag to set whether the codegen fit is also done with finite differences (y/n)"
+    )
+    parser.add_argument(
+        "--cache",
+        type=dir_path,
+        required=False,
+        default=None,
+        help="flag to set the directory where the results of the fits are cached"
+    )
+    parser.add_argument(
+        "--cache_entries",
+        type=int,
+        required=False,
+        default=10000,
+        help="flag to set the maximum number of results in the cache"
+    )
     
     return parser.parse_args()
 
@@ -88,31 +184,52 @@ if args.binned_fit=="y" or args.binned_fit=="Y":
     binned = True
 else:
     binned = False
-ROOT.RooMsgService.instance().setGlobalKillBelow(ROOT.RooFit.ERROR) # mute RooFit warnings
 
-# Selects invariant mass (D0_MM) of DO for MagUp
-ttree_D0_up = TChain("D02Kpi_Tuple/DecayTree")
-ttree_D0_up.Add(f"{args.path}/D0_up_data_{args.year}_{args.size}_clean.root")
-ttree_D0_up.SetBranchStatus("*", 0)
-ttree_D0_up.SetBranchStatus("D0_MM", 1)
-
-# Selects invariant mass (D0_MM) of DO for MagDown
-ttree_D0_down = TChain("D02Kpi_Tuple/DecayTree")
-ttree_D0_down.Add(f"{args.path}/D0_down_data_{args.year}_{args.size}_clean.root")
-ttree_D0_down.SetBranchStatus("*", 0)
-ttree_D0_down.SetBranchStatus("D0_MM", 1)
-
-# Selects invariant mass (D0_MM) of DObar for MagDown
-ttree_D0bar_up = TChain("D02Kpi_Tuple/DecayTree")
-ttree_D0bar_up.Add(f"{args.path}/D0bar_up_data_{args.year}_{args.size}_clean.root")
-ttree_D0bar_up.SetBranchStatus("*", 0)
-ttree_D0bar_up.SetBranchStatus("D0_MM", 1)
-
-# Selects invariant mass (D0_MM) of DObar for MagDown
-ttree_D0bar_down = TChain("D02Kpi_Tuple/DecayTree")
-ttree_D0bar_down.Add(f"{args.path}/D0bar_down_data_{args.year}_{args.size}_clean.root")
-ttree_D0bar_down.SetBranchStatus("*", 0)
-ttree_D0bar_down.SetBranchStatus("D0_MM", 1)
+# Number of events of D0 and D0bar for MagUp and MagDown, as given by the offsets index of the clean data
+entries = {}
+for polarity in ["up", "down"]:
+    for meson, (start, stop) in read_offsets(f"{args.input}/{polarity}_data_{args.year}_{args.size}_clean").items():
+        entries[f"{meson}_{polarity}"] = stop - start
+
+if binned:
+    # Filling the histograms of both mesons of each polarity in a single pass over its D0_MM column
+    D0_Up_Counts, D0bar_Up_Counts = fill_histograms(f"{args.input}/up_data_{args.year}_{args.size}_clean", ["D0", "D0bar"], numbins, lower_boundary, upper_boundary)
+    D0_Down_Counts, D0bar_Down_Counts = fill_histograms(f"{args.input}/down_data_{args.year}_{args.size}_clean", ["D0", "D0bar"], numbins, lower_boundary, upper_boundary)
+
+# Takes the parameters from the cache if the same fit has already been done
+if args.cache is not None:
+    if binned:
+        data = [D0_Up_Counts, D0bar_Up_Counts, D0_Down_Counts, D0bar_Down_Counts]
+    else:
+        # the events of each meson are found from the number of events of each sample
+        data = [read_masses(f"{args.input}/{polarity}_data_{args.year}_{args.size}_clean") for polarity in ["up", "down"]]
+    configuration = {
+        "binned": binned,
+        "entries": entries,
+        "range": [numbins, lower_boundary, upper_boundary],
+        "fit_backend": args.fit_backend,
+        "num_cpu": args.num_cpu,
+        "offset": args.offset in ["y", "Y"],
+    }
+    sources = [os.path.abspath(__file__)] + [f"{os.path.dirname(os.path.abspath(__file__))}/{source}" for source in ["mass_histograms.py", "fit_backends.py"]]
+    key = fit_key(sources, data, configuration)
+    cached = load_result(args.cache, key)
+    if cached is not None:
+        print("The results of the fit have been taken from the cache")
+        for name, (value, error) in cached["fit_result"].items():
+            print(f"{name:>16} = {value:.6g} +/- {error:.2g}")
+        np.savetxt(f"{args.path}/fit_parameters.txt", np.array(cached["parameters"]), delimiter=',')
+        print("My program took", time.time() - start_time, "to run")
+        sys.exit()
+
+# ROOT is only imported when the fit is performed, as it takes a few seconds
+import ROOT
+from ROOT import TChain, RooRealVar, RooDataSet, RooGaussian, RooCrystalBall, RooAddPdf, RooArgList, RooFit, RooArgSet, RooDataHist, RooExponential
+
+ROOT.RooMsgService.instance().setGlobalKillBelow(ROOT.RooFit.ERROR) # mute RooFit warnings
+# Options setting how the likelihood is evaluated, given to both fits
+backend_settings = {"backend": args.fit_backend, "num_cpu": args.num_cpu, "offset": args.offset in ["y", "Y"]}
+compare_gradient = args.compare_gradient in ["y", "Y"]
 
 D0_M = ROOT.RooRealVar("D0_MM", "D0 mass / [MeV/c*c]", 1810, 1910)
 
@@ -144,30 +261,21 @@ frac_D0bar_up = RooRealVar("frac_D0bar_up", "frac_D0bar_up", 0.56, 0, 1)
 frac_D0bar_down = RooRealVar("frac_D0bar_down", "frac_D0bar_down", 0.56, 0, 1)
 
 # Generate normalization variables
-Nsig_D0_up = ROOT.RooRealVar("Nsig_D0_up", "Nsig_D0_up", 0.95*ttree_D0_up.GetEntries(), 0, ttree_D0_up.GetEntries())
-Nsig_D0bar_up = ROOT.RooRealVar("Nsig_D0bar_up", "Nsig_D0bar_up", 0.95*ttree_D0bar_up.GetEntries(), 0, ttree_D0bar_up.GetEntries())
-Nbkg_D0_up = ROOT.RooRealVar("Nbkg_D0_up", "Nbkg_D0_up", 0.05*ttree_D0_up.GetEntries(), 0, ttree_D0_up.GetEntries())
-Nbkg_D0bar_up = ROOT.RooRealVar("Nbkg_D0bar_up", "Nbkg_D0bar_up", 0.05*ttree_D0bar_up.GetEntries(), 0, ttree_D0bar_up.GetEntries())
-Nsig_D0_down = ROOT.RooRealVar("Nsig_D0_down", "Nsig_D0_down", 0.95*ttree_D0_down.GetEntries(), 0, ttree_D0_down.GetEntries())
-Nsig_D0bar_down = ROOT.RooRealVar("Nsig_D0bar_down", "Nsig_D0bar_down", 0.95*ttree_D0bar_down.GetEntries(), 0, ttree_D0bar_down.GetEntries())
-Nbkg_D0_down = ROOT.RooRealVar("Nbkg_D0_down", "Nbkg_D0_down", 0.05*ttree_D0_down.GetEntries(), 0, ttree_D0_down.GetEntries())
-Nbkg_D0bar_down = ROOT.RooRealVar("Nbkg_D0bar_down", "Nbkg_D0bar_down", 0.05*ttree_D0bar_down.GetEntries(), 0, ttree_D0bar_down.GetEntries())
+Nsig_D0_up = ROOT.RooRealVar("Nsig_D0_up", "Nsig_D0_up", 0.95*entries["D0_up"], 0, entries["D0_up"])
+Nsig_D0bar_up = ROOT.RooRealVar("Nsig_D0bar_up", "Nsig_D0bar_up", 0.95*entries["D0bar_up"], 0, entries["D0bar_up"])
+Nbkg_D0_up = ROOT.RooRealVar("Nbkg_D0_up", "Nbkg_D0_up", 0.05*entries["D0_up"], 0, entries["D0_up"])
+Nbkg_D0bar_up = ROOT.RooRealVar("Nbkg_D0bar_up", "Nbkg_D0bar_up", 0.05*entries["D0bar_up"], 0, entries["D0bar_up"])
+Nsig_D0_down = ROOT.RooRealVar("Nsig_D0_down", "Nsig_D0_down", 0.95*entries["D0_down"], 0, entries["D0_down"])
+Nsig_D0bar_down = ROOT.RooRealVar("Nsig_D0bar_down", "Nsig_D0bar_down", 0.95*entries["D0bar_down"], 0, entries["D0bar_down"])
+Nbkg_D0_down = ROOT.RooRealVar("Nbkg_D0_down", "Nbkg_D0_down", 0.05*entries["D0_down"], 0, entries["D0_down"])
+Nbkg_D0bar_down = ROOT.RooRealVar("Nbkg_D0bar_down", "Nbkg_D0bar_down", 0.05*entries["D0bar_down"], 0, entries["D0bar_down"])
 
 if binned:
-    # Creating the histograms for both polarities for D0 and D0bar by converting the TTree D0_MM data inside the TChain to a TH1(base class of ROOT histograms)
-    # TTree.Draw plots a histogram with name D0_Up_Hist and given bin parameters and saves it to memory using: >>
-    ttree_D0_up.Draw(f"D0_MM>>D0_Up_Hist({numbins},{lower_boundary},{upper_boundary})")
-    # D0_Up_Hist recalled from memory and saved to the local variable
-    D0_Up_Hist = ROOT.gPad.GetPrimitive("D0_Up_Hist")
-
-    ttree_D0_down.Draw(f"D0_MM>>D0_Down_Hist({numbins},{lower_boundary},{upper_boundary})")
-    D0_Down_Hist = ROOT.gPad.GetPrimitive("D0_Down_Hist")
-
-    ttree_D0bar_up.Draw(f"D0_MM>>D0bar_Up_Hist({numbins},{lower_boundary},{upper_boundary})")
-    D0bar_Up_Hist = ROOT.gPad.GetPrimitive("D0bar_Up_Hist")
-
-    ttree_D0bar_down.Draw(f"D0_MM>>D0bar_Down_Hist({numbins},{lower_boundary},{upper_boundary})")
-    D0bar_Down_Hist = ROOT.gPad.GetPrimitive("D0bar_Down_Hist")
+    # Converting the arrays to TH1s (base class of ROOT histograms)
+    D0_Up_Hist = histogram("D0_Up_Hist", "D0_MM", D0_Up_Counts, lower_boundary, upper_boundary)
+    D0_Down_Hist = histogram("D0_Down_Hist", "D0_MM", D0_Down_Counts, lower_boundary, upper_boundary)
+    D0bar_Up_Hist = histogram("D0bar_Up_Hist", "D0_MM", D0bar_Up_Counts, lower_boundary, upper_boundary)
+    D0bar_Down_Hist = histogram("D0bar_Down_Hist", "D0_MM", D0bar_Down_Counts, lower_boundary, upper_boundary)
 
 
     # Creating Binned container sets using RooDataHist
@@ -225,8 +333,14 @@ if binned:
     simultaneous_data = RooDataHist("simultaneous_data", "simultaneous data", RooArgList(D0_M), ROOT.RooFit.Index(binned_sample), *imports)
 
     # Performs the simultaneous fit
-    fitResult = simultaneous_pdf.fitTo(simultaneous_data, Save=True, Extended=True)
+    fitResult, fit_runs = fit_pdf(simultaneous_pdf, simultaneous_data, reference=compare_gradient, **backend_settings)
 else:
+    # Selects invariant mass (D0_MM) of DO and D0bar for MagUp and MagDown
+    chain_D0_up, ttree_D0_up = flavour_tree("up", "D0")
+    chain_D0_down, ttree_D0_down = flavour_tree("down", "D0")
+    chain_D0bar_up, ttree_D0bar_up = flavour_tree("up", "D0bar")
+    chain_D0bar_down, ttree_D0bar_down = flavour_tree("down", "D0bar")
+
     # Creates unbinned data containers for all the meson/polarity combinations
     data_D0_up = RooDataSet("data_D0_up", "Data_D0_up", ttree_D0_up, RooArgSet(D0_M))
     data_D0bar_up = RooDataSet("data_D0bar_up", "Data_D0bar_up", ttree_D0bar_up, RooArgSet(D0_M))
@@ -271,7 +385,7 @@ else:
     
     # Performs the simultaneous fit
     simPdf = ROOT.RooSimultaneous("simPdf", "simultaneous pdf", {"D0_up": model_D0_up, "D0_down": model_D0_down, "D0bar_up": model_D0bar_up, "D0bar_down": model_D0bar_down}, sample)
-    fitResult = simPdf.fitTo(combData, PrintLevel=-1, Save=True, Extended=True)
+    fitResult, fit_runs = fit_pdf(simPdf, combData, print_level=-1, reference=compare_gradient, **backend_settings)
 
 # Prints the simultaneous fit parameters
 fitResult.Print()
@@ -279,4 +393,9 @@ fitResult.Print()
 # Get results
 parameters = np.array([mean.getValV(), sigma.getValV(), Csig.getValV(), aL.getValV(), nL.getValV(), aR.getValV(), nR.getValV(), a0.getValV(), frac_D0_down.getValV(), frac_D0_up.getValV(), frac_D0bar_down.getValV(), frac_D0bar_up.getValV(), Nsig_D0_down.getValV(), Nbkg_D0_down.getValV(), Nsig_D0_up.getValV(), Nbkg_D0_up.getValV(), Nsig_D0bar_down.getValV(), Nbkg_D0bar_down.getValV(), Nsig_D0bar_up.getValV(), Nbkg_D0bar_up.getValV()])
 np.savetxt(f"{args.path}/fit_parameters.txt", parameters, delimiter=',')
+# Log of the backend used, the gradient, the number of evaluations of the likelihood and the time taken by each run of the fit
+write_fit_log(f"{args.path}/fit_log.txt", fit_runs)
+if args.cache is not None:
+    fit_result = {parameter.GetName(): [parameter.getValV(), parameter.getError()] for parameter in fitResult.floatParsFinal()}
+    store_result(args.cache, key, {"parameters": parameters.tolist(), "fit_result": fit_result}, args.cache_entries)
 print("My program took", time.time() - start_time, "to run")
\ No newline at end of file
@@ -0,0 +1,98 @@
+"""
+input_manifest.py
+
+This code keeps the manifest of the input files that have already been selected by selection_of_events.py for a given output file. For each input file the manifest stores its size, modification time and checksum, together with the number of events read from it and the number of events that passed the selection.
+When the selection is run incrementally, the manifest is used to find the input files that are new, so that only those need to be selected and appended to the existing output. Input files that have changed or disappeared since they were selected are also found, as the existing output can then no longer be trusted.
+The checksum of a file is only computed again when its size or modification time have changed, so checking a large number of files that have already been selected does not require reading them.
+It is not meant to be run on its own, but imported by the scripts that select the input ntuples.
+
+Author: Marc Oriol Pérez (marc.oriolperez@student.manchester.ac.uk)
+Last edited: 17th October 2026
+"""
+
+# - - - - - - IMPORT STATEMENTS - - - - - - #
+
+import os
+import json
+import zlib
+
+# - - - - - - - FUNCTIONS - - - - - - - #
+
+def file_checksum(path, block_size=16*1024*1024):
+    '''
+    Computes the adler32 checksum of the file in path, reading it in blocks of block_size bytes.
+
+    Returns the checksum as a hexadecimal string.
+    '''
+    checksum = 1
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            checksum = zlib.adler32(block, checksum)
+    return f"{checksum:08x}"
+
+def file_record(path, previous=None):
+    '''
+    Builds the manifest entry describing the current state of the file in path. If previous (the entry of
+    the file in the manifest) has the same size and modification time, its checksum is reused instead of
+    reading the file again.
+
+    Returns a dictionary with the size, modification time and checksum of the file.
+    '''
+    stat = os.stat(path)
+    record = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if previous is not None and previous["size"] == record["size"] and previous["mtime_ns"] == record["mtime_ns"]:
+        record["checksum"] = previous["checksum"]
+    else:
+        record["checksum"] = file_checksum(path)
+    return record
+
+def empty_manifest():
+    '''
+    Returns the manifest of an output to which no input file has been added yet.
+    '''
+    return {"files": {}, "cutflow": None, "selection": None, "branches": None}
+
+def load_manifest(filename):
+    '''
+    Reads the manifest in filename.json. If it does not exist, an empty manifest is returned.
+    '''
+    if not os.path.exists(f"{filename}.json"):
+        return empty_manifest()
+    with open(f"{filename}.json") as f:
+        return json.load(f)
+
+def save_manifest(filename, manifest):
+    '''
+    Writes the manifest to filename.json. It is first written to a temporary file, so that an interrupted
+    run never leaves a partially written manifest behind.
+    '''
+    temporary = f"{filename}.json.{os.getpid()}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(manifest, f, indent=4, default=lambda value: value.item()) # numpy scalars are written as numbers
+    os.replace(temporary, f"{filename}.json")
+
+    return print(f"Saved manifest {filename}.json")
+
+def compare_inputs(manifest, files):
+    '''
+    Compares the input files (given as "path:tree") with the ones already in the manifest.
+
+    Returns the list of files that are not in the manifest yet, in the order in which they were given, the
+    list of files in the manifest that have changed or can no longer be found, and a dictionary with the
+    current record of each of the given files.
+    '''
+    paths = [file.rsplit(":", 1)[0] for file in files]
+    records = {}
+    new_files = []
+    changed = []
+    for file, path in zip(files, paths):
+        previous = manifest["files"].get(path)
+        records[path] = file_record(path, previous)
+        if previous is None:
+            new_files.append(file)
+        elif previous["checksum"] != records[path]["checksum"]:
+            changed.append(path)
+    for path in manifest["files"]:
+        if path not in paths and not os.path.exists(path):
+            changed.append(path)
+    return new_files, changed, records
@@ -0,0 +1,220 @@
+"""
+input_reader.py
+
+This code reads the input ntuples of D0 decays into two hadrons and selects their events while they are being read, as done by selection_of_events.py and select_and_clean.py. It builds the list of input files for the year and size requested, splits the maximum number of events to be read between them, and reads each file in chunks, applying the cheap cuts first and reading the rest of the branches only for the events that pass them (see selection_cuts.py). The input files can be read through a local cache (see ntuple_cache.py), and several files can be selected in parallel worker processes.
+It is not meant to be run on its own, but imported by the scripts that select the events.
+
+Author: Marc Oriol Pérez (marc.oriolperez@student.manchester.ac.uk)
+Last edited: 17th October 2026
+"""
+
+# - - - - - - IMPORT STATEMENTS - - - - - - #
+
+import glob
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import uproot
+import awkward as ak
+from selection_cuts import EARLY_SELECTION, LATE_SELECTION, evaluate_selection, selection_branches, chain_cutflows, empty_cutflow, merge_cutflows
+from branches import pipeline_branches
+from ntuple_cache import cached_path
+
+# - - - - - - - FUNCTIONS - - - - - - - #
+
+def input_files(year, size):
+    '''
+    Builds the paths to the root files containing the LHCb data of D0 decays into two hadrons. It takes into
+    account the year and size requested, and handles the different scenarios appropiately.
+
+    Returns the list of files (with the tree name appended) using the up polarity, the list of files using
+    the down polarity and the maximum number of events to be read from each polarity (None if all of them).
+    '''
+    tree_name = "D02Kpi_Tuple/DecayTree"
+
+    # Data from different years have different codes in their path
+    if year==16:
+        code_up = "00172206"
+        code_down = "00172204"
+    elif year==17:
+        code_up = "00172214"
+        code_down = "00172212"
+    elif year==18:
+        code_up = "00172210"
+        code_down = "00172208"
+
+    # get path to directories of the requested year
+    directory_up = f"/eos/lhcb/grid/prod/lhcb/LHCb/Collision{year}/CHARM_D02HH_DVNTUPLE.ROOT/{code_up}/0000/"
+    directory_down = f"/eos/lhcb/grid/prod/lhcb/LHCb/Collision{year}/CHARM_D02HH_DVNTUPLE.ROOT/{code_down}/0000/"
+
+    # set the number of files to concatenate depending on the size requested
+    max_events = None
+    if size=="all":
+        files_up = [f"{path}:{tree_name}" for path in sorted(glob.glob(f"{directory_up}/{code_up}_*_1.charm_d02hh_dvntuple.root"))]
+        files_down = [f"{path}:{tree_name}" for path in sorted(glob.glob(f"{directory_down}/{code_down}_*_1.charm_d02hh_dvntuple.root"))]
+        return files_up, files_down, max_events
+    elif size=="small":
+        data_to_concatenate = np.arange(1, 2, 1)
+        max_events = 200000
+    elif size=="medium":
+        data_to_concatenate = np.arange(1, 5, 1)
+    elif size=="large":
+        data_to_concatenate = np.arange(1, 9, 1)
+    elif 0<int(size)<9:
+        data_to_concatenate = np.arange(1, int(size)+1, 1)
+
+    files_up = [f"{directory_up}/{code_up}_0000000{i}_1.charm_d02hh_dvntuple.root:{tree_name}" for i in data_to_concatenate]
+    files_down = [f"{directory_down}/{code_down}_0000000{i}_1.charm_d02hh_dvntuple.root:{tree_name}" for i in (data_to_concatenate+1)]
+
+    return files_up, files_down, max_events
+
+def entry_stops(files, max_events):
+    '''
+    Splits the maximum number of events to be read from a polarity across its files, reading them one
+    after another.
+
+    Returns a list with the number of events to be read from each file (None meaning all of them).
+    '''
+    if max_events is None:
+        return [None for file in files]
+
+    stops = []
+    remaining = max_events
+    for file in files:
+        path, tree_name = file.rsplit(":", 1)
+        with uproot.open(path) as infile:
+            entries = infile[tree_name].num_entries
+        stops.append(min(entries, remaining))
+        remaining -= stops[-1]
+
+    return stops
+
+def read_variables(variables):
+    '''
+    Returns the branches that must be read from the input files to write out the given variables, which are
+    the variables themselves plus the ones used by the selection.
+    '''
+    return variables + [branch for branch in selection_branches() if branch not in variables]
+
+def selected_chunks(file, entry_stop=None, step_size=None, variables=None):
+    '''
+    Reads a single input file (given as "path:tree") and selects the events that meet a set of requirements
+    while it is being read. The file is read in chunks of step_size (either a number of events or a memory
+    size, 100 MB if it is None), and for each chunk:
+    - the branches used by the cheap cuts listed in EARLY_SELECTION are read and these cuts are applied
+    - the rest of the branches used by the selection are read, only the events that passed the previous cuts
+      are kept, and the cuts listed in LATE_SELECTION are applied to them
+    - the given variables (by default the ones used by the later stages of the analysis, see branches.py)
+      are read and only the selected events are kept
+    so only the selected events are held in memory once a chunk has been processed, and the later steps are
+    skipped for chunks where no events are left. Only the first entry_stop events are read (all of them if it
+    is None). If no events are read, a single empty chunk is given.
+
+    The requirements are:
+    - Particle must not be muons
+    - P1_PIDK > 5
+    - P2_PIDK < 0
+    - Both hadrons must have a positive momentum in the z direction
+    - Pseudorapidity must be between 0 and 6
+    - Transverse momentum must be between 0 GeV and 10 GeV
+    - D0_IPCHI2_OWNPV < 1
+
+    Yields the selected events of each chunk, together with the cut-flow of the selection in that chunk.
+    '''
+    if variables is None:
+        variables = pipeline_branches()
+    early_variables = selection_branches(EARLY_SELECTION)
+    late_variables = [branch for branch in selection_branches(LATE_SELECTION) if branch not in early_variables]
+
+    path, tree_name = file.rsplit(":", 1)
+    with uproot.open(path) as infile:
+        tree = infile[tree_name]
+        entries = tree.num_entries if entry_stop is None else min(entry_stop, tree.num_entries)
+        if entries == 0:
+            # an empty chunk is given, so that the selected events of the file have the right branches
+            yield tree.arrays(variables, entry_start=0, entry_stop=0), empty_cutflow(0)
+            return
+        if isinstance(step_size, int):
+            step = step_size
+        else:
+            step = tree.num_entries_for("100 MB" if step_size is None else step_size, read_variables(variables))
+
+        for start in range(0, entries, step):
+            stop = min(start + step, entries)
+            early_mask, cutflow = evaluate_selection(tree.arrays(early_variables, entry_start=start, entry_stop=stop), EARLY_SELECTION)
+            survivors = np.flatnonzero(early_mask)
+            if len(survivors) == 0:
+                yield tree.arrays(variables, entry_start=start, entry_stop=start), chain_cutflows(cutflow, empty_cutflow(0, LATE_SELECTION))
+                continue
+
+            # only the range of entries containing survivors needs to be read from now on
+            first, last = survivors[0], survivors[-1] + 1
+            late_data = tree.arrays(late_variables, entry_start=start+first, entry_stop=start+last)[early_mask[first:last]]
+            late_mask, late_cutflow = evaluate_selection(late_data, LATE_SELECTION)
+            cutflow = chain_cutflows(cutflow, late_cutflow)
+
+            selected = survivors[late_mask] - first
+            yield tree.arrays(variables, entry_start=start+first, entry_stop=start+last)[selected], cutflow
+
+def cached_chunks(file, copy, entry_stop=None, step_size=None, variables=None):
+    '''
+    Selects the events of an input file (given as "path:tree") using selected_chunks on its cached copy. The cache
+    is shared by all the workers, so the copy can be removed by another worker making room for its own files
+    before it is opened, in which case the original file is read instead. Once opened, the copy can be read to
+    the end even if it is removed, as it is memory-mapped.
+
+    Yields the selected events of each chunk, together with the cut-flow of the selection in that chunk.
+    '''
+    chunks = selected_chunks(copy, entry_stop, step_size, variables)
+    try:
+        first = next(chunks)
+    except FileNotFoundError:
+        print(f"WARNING: the cached copy of {file} has been removed from the cache, the original file will be read")
+        yield from selected_chunks(file, entry_stop, step_size, variables)
+        return
+    yield first
+    yield from chunks
+
+def read_selected(file, entry_stop=None, step_size=None, variables=None, cache=None, cache_size=50):
+    '''
+    Reads a single input file (given as "path:tree") in chunks and selects its events using selected_chunks.
+    If a cache directory is given, the file is read through the cache (see ntuple_cache.py and cached_chunks),
+    which can hold up to cache_size GB.
+
+    Yields the selected events of each chunk, together with the cut-flow of the selection in that chunk.
+    '''
+    if variables is None:
+        variables = pipeline_branches()
+    if cache is not None:
+        copy = cached_path(file, read_variables(variables), cache, cache_size*1e9)
+        if copy != file:
+            return cached_chunks(file, copy, entry_stop, step_size, variables)
+    return selected_chunks(file, entry_stop, step_size, variables)
+
+def select_file(file, entry_stop=None, step_size=None, variables=None, cache=None, cache_size=50):
+    '''
+    Reads and selects all the events in a single input file (given as "path:tree") using read_selected.
+
+    Returns the selected events and the cut-flow of the selection.
+    '''
+    chunks = list(read_selected(file, entry_stop, step_size, variables, cache, cache_size))
+    print(f"checkpoint: {file} has been read and masked")
+
+    return ak.concatenate([chunk[0] for chunk in chunks]), merge_cutflows([chunk[1] for chunk in chunks])
+
+def select_files(files, stops=None, step_size=None, variables=None, cache=None, cache_size=50, workers=1):
+    '''
+    Reads and selects the given input files (given as "path:tree") using select_file. Only the first stops[i]
+    events of the ith file are read (all of them if stops is None). If workers is larger than 1, each file is
+    selected in its own worker process.
+
+    Returns a list with the selected events and the cut-flow of each file, in the order in which they were given.
+    '''
+    if stops is None:
+        stops = [None for file in files]
+    arguments = [files, stops, [step_size]*len(files), [variables]*len(files), [cache]*len(files), [cache_size]*len(files)]
+    if workers > 1:
+        # the workers are forked, so they inherit everything defined by the script that started them
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork")) as executor:
+            return list(executor.map(select_file, *arguments))
+    return list(map(select_file, *arguments))
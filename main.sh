@@ -1,12 +1,18 @@
 # Runs the complete analysis on a set of raw data of D0 meson decays to obtain the asymmetry in local regions of the phase space. The output is stored in the specified directory, and is organized in several directories generated by this same script. Take into account that if a directory with the same name already exists this code might not work as intended. Note that making changes to any of the individual scripts while this code is running can lead to a malfunction.
-# When running the code the output directory, the year the data to be analysed was taken, the size of the data to be analysed and whether or not the data should be binned when fitting must be given as arguments, in that order. The year must be one of: 16, 17 or 18. The size must be one of: small, medium, large, 1, 2, 3, 4, 5, 6, 7 or 8. The binned fitting argument must either be y/Y or n/N.
+# When running the code the output directory, the year the data to be analysed was taken, the size of the data to be analysed and whether or not the data should be binned when fitting must be given as arguments, in that order. The year must be one of: 16, 17 or 18. The size must be one of: small, medium, large, all, 1, 2, 3, 4, 5, 6, 7 or 8. The binned fitting argument must either be y/Y or n/N.
+# Optionally, a fifth argument y/Y can be given to process the up and down polarities at the same time, each in its own process. The output is the same as when they are processed one after another. If it is not given, or it is n/N, the polarities are processed one after another.
+# Optionally, a sixth argument can be given with the minimum number of signal candidates of each meson and polarity in each bin, in which case the binning scheme is adapted to the data (see create_binning_scheme.py). If it is not given, a uniform 10x10 binning scheme is used.
+# Optionally, a seventh argument can be given with a directory in which the results of the global and local fits are cached (see fit_cache.py). Running the analysis again with the same cache directory then only repeats the fits whose data, model or options have changed.
 # Author: Marc Oriol Pérez (marc.oriolperez@student.manchester.ac.uk)
-# Last modified: 16th September 2023
+# Last modified: 17th October 2026
 
 directory=$1
 year=$2
 size=$3
 binned=$4
+parallel=${5:-n}
+min_signal=$6
+fit_cache=$7
 
 if [[ "$binned" != "y" ]]; then
     if [[ "$binned" != "Y" ]]; then
@@ -21,6 +27,29 @@ if [[ "$binned" != "y" ]]; then
     fi
 fi
 
+if [[ "$parallel" != "y" && "$parallel" != "Y" && "$parallel" != "n" && "$parallel" != "N" ]]; then
+    echo "WARNING: You did not select a valid option for the parallel processing of the polarities"
+    echo
+    echo "The polarities will be processed one after another"
+    parallel="n"
+fi
+
+# Runs the given command in the background if the polarities are processed in parallel
+run_polarity () {
+    if [[ "$parallel" == "y" || "$parallel" == "Y" ]]; then
+        "$@" &
+    else
+        "$@"
+    fi
+}
+
+# Flags given to the fits to cache their results, if a cache directory is given
+cache_flags=()
+if [[ -n "$fit_cache" ]]; then
+    mkdir -p $fit_cache
+    cache_flags=(--cache $fit_cache)
+fi
+
 # Create necessary directories to store output
 
 mkdir $directory
@@ -30,11 +59,6 @@ mkdir $directory"/binned_data/binning_scheme"
 mkdir $directory"/model_fitting"
 mkdir $directory"/model_fitting/global"
 mkdir $directory"/model_fitting/local"
-for ind in {0..99}
-do
-    index=$( printf '%02d' $ind)
-    mkdir $directory"/model_fitting/local/"$index
-done
 mkdir $directory"/raw_asymmetry_outcome"
 mkdir $directory"/raw_asymmetry_outcome/chi_squared"
 mkdir $directory"/raw_asymmetry_outcome/raw_asymmetry"
@@ -46,30 +70,46 @@ echo
 
 # Run the code
 
-python selection_of_events.py --year $year --size $size --path $directory"/selected_data"
-
-echo
+# select the events, remove the multiple candidates and split them by flavour in a single pass
 for polar in up down
 do
-
-    python multiple_candidates.py --year $year --size $size --polarity $polar --path $directory"/selected_data"
+    run_polarity python select_and_clean.py --year $year --size $size --polarity $polar --path $directory"/selected_data"
 done
-echo "Multiple candidates have been removed"
+wait
+echo
+echo "The events have been selected and multiple candidates have been removed"
 
 
-python fit_global.py --year $year --size $size --path $directory"/model_fitting/global" --binned_fit $binned
+python fit_global.py --year $year --size $size --path $directory"/model_fitting/global" --input $directory"/selected_data" --binned_fit $binned "${cache_flags[@]}"
 
 echo "The global fit has been completed"
 echo
 
-python create_binning_scheme.py --year $year --size $size --path $directory"/binned_data/binning_scheme" --input $directory"/selected_data"
+if [[ -n "$min_signal" ]]; then
+    python create_binning_scheme.py --year $year --size $size --path $directory"/binned_data/binning_scheme" --input $directory"/selected_data" --min_signal $min_signal
+else
+    python create_binning_scheme.py --year $year --size $size --path $directory"/binned_data/binning_scheme" --input $directory"/selected_data"
+fi
+# the names of the bins are read from the binning scheme, as their number depends on the data
+bins=$(python binning_scheme.py --year $year --size $size --bin_path $directory"/binned_data/binning_scheme")
+for index in $bins
+do
+    mkdir $directory"/model_fitting/local/"$index
+done
+# both mesons and polarities are binned in a single run, which reads the binning scheme and each polarity once
+if [[ "$parallel" == "y" || "$parallel" == "Y" ]]; then
+    workers=2
+else
+    workers=1
+fi
+python apply_binning_scheme.py --year $year --size $size --meson D0 D0bar --polarity up down --path $directory"/binned_data" --input $directory"/selected_data" --bin_path $directory"/binned_data/binning_scheme" --workers $workers
 for meson in D0 D0bar
 do 
     for polar in up down 
     do    
-        python apply_binning_scheme.py --year $year --size $size --meson $meson --polarity $polar --path $directory"/binned_data" --input $directory"/selected_data" --bin_path $directory"/binned_data/binning_scheme"
-        python plot_phase_space.py --year $year --size $size --meson $meson --polarity $polar --path $directory"/binned_data/binning_scheme" --input $directory"/selected_data" --bin_path $directory"/binned_data/binning_scheme"
+        run_polarity python plot_phase_space.py --year $year --size $size --meson $meson --polarity $polar --path $directory"/binned_data/binning_scheme" --input $directory"/selected_data" --bin_path $directory"/binned_data/binning_scheme"
     done
+    wait
 done
 
 echo "The data has been binned"
@@ -79,10 +119,9 @@ for meson in D0 D0bar
 do
    for polar in up down
    do 
-        for ind in {0..99}
+        for index in $bins
         do
-            index=$( printf '%02d' $ind)
-            python model_fitting.py --year $year --size $size --meson $meson --polarity $polar  --path $directory"/model_fitting/local/"$index --input $directory"/binned_data" --parameters_path $directory"/model_fitting/global" --bin $index --binned_fit $binned
+            python model_fitting.py --year $year --size $size --meson $meson --polarity $polar  --path $directory"/model_fitting/local/"$index --input $directory"/binned_data" --parameters_path $directory"/model_fitting/global" --bin $index --binned_fit $binned "${cache_flags[@]}"
         done
     done
 done
@@ -90,8 +129,8 @@ done
 echo "Local fitting completed"
 echo
 
-python analyse_chisquared.py --year $year --size $size --path $directory"/raw_asymmetry_outcome/chi_squared" --input $directory"/model_fitting/local"
+python analyse_chisquared.py --year $year --size $size --path $directory"/raw_asymmetry_outcome/chi_squared" --input $directory"/model_fitting/local" --bin_path $directory"/binned_data/binning_scheme"
 
-python calculate_raw_asymmetry.py --year $year --size $size --path $directory"/raw_asymmetry_outcome/raw_asymmetry" --input $directory"/model_fitting/local"
+python calculate_raw_asymmetry.py --year $year --size $size --path $directory"/raw_asymmetry_outcome/raw_asymmetry" --input $directory"/model_fitting/local" --bin_path $directory"/binned_data/binning_scheme"
 
-python analyse_asymmetry.py --year $year --size $size --path $directory"/raw_asymmetry_outcome/raw_asymmetry" --input $directory"/raw_asymmetry_outcome/raw_asymmetry" --raw "y"
\ No newline at end of file
+python analyse_asymmetry.py --year $year --size $size --path $directory"/raw_asymmetry_outcome/raw_asymmetry" --input $directory"/raw_asymmetry_outcome/raw_asymmetry" --raw "y" --bin_path $directory"/binned_data/binning_scheme"
\ No newline at end of file
@@ -0,0 +1,228 @@
+"""
+mass_fit.py
+
+This code fits the invariant mass (D0_MM) with the same model used with RooFit in fit_global.py and model_fitting.py, without using ROOT: a Gaussian and a double-sided Crystal Ball (RooGaussian and RooCrystalBall) sharing their mean, added with a fraction, as the signal, and an exponential (RooExponential) as the background. The densities are evaluated with NumPy for all the events at once, and normalised over the fit range in closed form, so no numerical integration is needed.
+The extended likelihood is the same as the one built by RooFit: the number of expected events minus the sum over the events of the logarithm of the expected density, Nsig*signal + Nbkg*background. In the binned fit, as done by RooFit with a RooDataHist, each bin counts as its number of events placed at its centre. It is minimised with MIGRAD, and the errors are then computed with HESSE, as done by fitTo, using iminuit (Minuit2, the same minimiser used by RooFit).
+The goodness of fit is measured as in the plot function in utils.py: the pull of each bin of a histogram is the difference between the number of events and the number of events expected by the model in that bin, divided by the Poisson error of the number of events (the lower or upper one, depending on the sign of the difference).
+It is not meant to be run on its own, but imported by the scripts that perform fits.
+
+Author: Marc Oriol Pérez (marc.oriolperez@student.manchester.ac.uk)
+Last edited: 17th October 2026
+"""
+
+# - - - - - - IMPORT STATEMENTS - - - - - - #
+
+import math
+import numpy as np
+
+try:
+    from iminuit import Minuit
+    from scipy.special import gammaincinv
+except ImportError:
+    Minuit = None
+
+# - - - - - - - PARAMETERS - - - - - - - #
+
+# parameters of the model, in the order in which they are given to the likelihood
+PARAMETERS = ["mu", "sigma", "Csig", "aL", "nL", "aR", "nR", "a0", "frac", "Nsig", "Nbkg"]
+
+# one standard deviation, as probability outside the interval
+ONE_SIGMA = 1 - math.erf(1/math.sqrt(2))
+
+# - - - - - - - FUNCTIONS - - - - - - - #
+
+def gaussian_integral(lower_boundary, upper_boundary, mu, sigma):
+    '''
+    Returns the integral of the (not normalised) Gaussian exp(-(x-mu)^2/(2 sigma^2)) between the boundaries.
+    '''
+    scale = math.sqrt(2)*sigma
+    return math.sqrt(math.pi/2)*sigma*(math.erf((upper_boundary - mu)/scale) - math.erf((lower_boundary - mu)/scale))
+
+def tail_integral(low, high, alpha, n):
+    '''
+    Returns the integral of the power-law tail of the Crystal Ball, A*(B + u)^-n with u the distance to the mean
+    in units of the width, between low and high (both larger than alpha).
+    '''
+    with np.errstate(invalid="ignore", divide="ignore"):
+        A = np.power(n/alpha, n)*np.exp(-0.5*alpha*alpha)
+        B = n/alpha - alpha
+        if n == 1:
+            return A*(np.log(B + high) - np.log(B + low))
+        return A/(1 - n)*(np.power(B + high, 1 - n) - np.power(B + low, 1 - n))
+
+def crystal_ball(masses, mu, sigma, aL, nL, aR, nR):
+    '''
+    Evaluates the (not normalised) double-sided Crystal Ball at the given masses, as defined by RooCrystalBall
+    with the same width on both sides: a Gaussian core between -|aL| and |aR| widths from the mean, continued
+    by a power-law tail of exponent nL on the left and nR on the right.
+
+    Returns the array of values.
+    '''
+    t = (np.asarray(masses, dtype=np.float64) - mu)/sigma
+    aL, aR = abs(aL), abs(aR)
+    values = np.exp(-0.5*t*t)
+    left = t < -aL
+    right = t > aR
+    # negative powers of negative numbers are not defined, as in RooCrystalBall they give NaN
+    with np.errstate(invalid="ignore"):
+        values[left] = np.power(nL/aL, nL)*np.exp(-0.5*aL*aL)/np.power(nL/aL - aL - t[left], nL)
+        values[right] = np.power(nR/aR, nR)*np.exp(-0.5*aR*aR)/np.power(nR/aR - aR + t[right], nR)
+    return values
+
+def crystal_ball_integral(lower_boundary, upper_boundary, mu, sigma, aL, nL, aR, nR):
+    '''
+    Returns the integral of the (not normalised) double-sided Crystal Ball between the boundaries, adding the
+    parts of the range in each tail and in the core.
+    '''
+    aL, aR = abs(aL), abs(aR)
+    t1, t2 = (lower_boundary - mu)/sigma, (upper_boundary - mu)/sigma
+    total = 0
+    if t1 < -aL:
+        total += tail_integral(-min(t2, -aL), -t1, aL, nL)
+    if max(t1, -aL) < min(t2, aR):
+        low, high = max(t1, -aL), min(t2, aR)
+        total += math.sqrt(math.pi/2)*(math.erf(high/math.sqrt(2)) - math.erf(low/math.sqrt(2)))
+    if t2 > aR:
+        total += tail_integral(max(t1, aR), t2, aR, nR)
+    return sigma*total
+
+def exponential_integral(lower_boundary, upper_boundary, a0):
+    '''
+    Returns the integral of the exponential exp(a0*x) between the boundaries.
+    '''
+    if a0 == 0:
+        return upper_boundary - lower_boundary
+    return (math.exp(a0*upper_boundary) - math.exp(a0*lower_boundary))/a0
+
+def densities(masses, values, lower_boundary, upper_boundary):
+    '''
+    Evaluates the signal and background densities of the model at the given masses, each normalised to one
+    over the fit range, for the given values of the parameters (in the order of PARAMETERS, the yields are not
+    used).
+
+    Returns the arrays of signal and background densities.
+    '''
+    mu, sigma, Csig, aL, nL, aR, nR, a0, frac = values[:9]
+    masses = np.asarray(masses, dtype=np.float64)
+    gauss = np.exp(-0.5*((masses - mu)/sigma)**2)/gaussian_integral(lower_boundary, upper_boundary, mu, sigma)
+    crystal = crystal_ball(masses, mu, Csig, aL, nL, aR, nR)/crystal_ball_integral(lower_boundary, upper_boundary, mu, Csig, aL, nL, aR, nR)
+    # exp(a0*(x - lower_boundary)) avoids overflows, and is normalised in the same way
+    background = np.exp(a0*(masses - lower_boundary))/exponential_integral(0, upper_boundary - lower_boundary, a0)
+    return frac*gauss + (1 - frac)*crystal, background
+
+def bin_expectation(edges, values, lower_boundary, upper_boundary):
+    '''
+    Integrates the model over each bin with the given edges (inside the fit range), for the given values of
+    the parameters.
+
+    Returns the array of the number of events expected in each bin.
+    '''
+    mu, sigma, Csig, aL, nL, aR, nR, a0, frac, Nsig, Nbkg = values
+    gauss = gaussian_integral(lower_boundary, upper_boundary, mu, sigma)
+    crystal = crystal_ball_integral(lower_boundary, upper_boundary, mu, Csig, aL, nL, aR, nR)
+    background = exponential_integral(0, upper_boundary - lower_boundary, a0)
+    expected = []
+    for low, high in zip(edges[:-1], edges[1:]):
+        signal = frac*gaussian_integral(low, high, mu, sigma)/gauss + (1 - frac)*crystal_ball_integral(low, high, mu, Csig, aL, nL, aR, nR)/crystal
+        expected.append(Nsig*signal + Nbkg*exponential_integral(low - lower_boundary, high - lower_boundary, a0)/background)
+    return np.array(expected)
+
+class ExtendedNLL:
+    '''
+    Extended negative log-likelihood of the model (see the description of this file) for a set of masses, each
+    with a weight: one for each event in an unbinned fit, or the number of events of each bin placed at its
+    centre in a binned fit. It is called with the values of the parameters, in the order of PARAMETERS. As it is
+    a negative log-likelihood, the errors are given by a change of 0.5 (errordef, read by Minuit).
+    '''
+    errordef = 0.5
+
+    def __init__(self, masses, weights, lower_boundary, upper_boundary):
+        self.masses = np.asarray(masses, dtype=np.float64)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.lower_boundary = lower_boundary
+        self.upper_boundary = upper_boundary
+
+    def __call__(self, *values):
+        Nsig, Nbkg = values[9:]
+        signal, background = densities(self.masses, values, self.lower_boundary, self.upper_boundary)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            nll = Nsig + Nbkg - np.dot(self.weights, np.log(Nsig*signal + Nbkg*background))
+        return nll if np.isfinite(nll) else np.inf
+
+def unbinned_nll(masses, lower_boundary, upper_boundary):
+    '''
+    Builds the likelihood of an unbinned fit of the given masses. As done by RooFit, the events outside the fit
+    range are not used.
+
+    Returns the likelihood.
+    '''
+    masses = np.asarray(masses, dtype=np.float64)
+    masses = masses[(masses >= lower_boundary) & (masses <= upper_boundary)]
+    return ExtendedNLL(masses, np.ones(len(masses)), lower_boundary, upper_boundary)
+
+def binned_nll(counts, lower_boundary, upper_boundary):
+    '''
+    Builds the likelihood of a binned fit of a histogram between the boundaries, given the number of events in
+    each bin including the underflow and overflow bins (as given by fill_histograms in mass_histograms.py),
+    which are not used.
+
+    Returns the likelihood.
+    '''
+    counts = np.asarray(counts, dtype=np.float64)[1:-1]
+    edges = np.linspace(lower_boundary, upper_boundary, len(counts)+1)
+    return ExtendedNLL(0.5*(edges[:-1] + edges[1:]), counts, lower_boundary, upper_boundary)
+
+def fit(nll, start, limits=None, fixed=()):
+    '''
+    Minimises the given likelihood starting from the given values of the parameters (in the order of
+    PARAMETERS), with MIGRAD followed by HESSE. Limits can be given as a dictionary of (lower, upper) for any of
+    the parameters, and the parameters in fixed are kept constant.
+
+    Returns the dictionaries of the values and errors of the parameters, and the Minuit object used.
+    '''
+    if Minuit is None:
+        raise ImportError("iminuit and scipy are needed to fit without ROOT")
+    minuit = Minuit(nll, *start, name=PARAMETERS)
+    for name, limit in (limits or {}).items():
+        minuit.limits[name] = limit
+    for name in fixed:
+        minuit.fixed[name] = True
+    minuit.migrad()
+    minuit.hesse()
+    return dict(zip(PARAMETERS, minuit.values)), dict(zip(PARAMETERS, minuit.errors)), minuit
+
+def poisson_errors(counts):
+    '''
+    Computes the lower and upper errors of the given numbers of events, as done by RooFit when plotting them: a
+    central interval of one standard deviation, exact for up to 100 events and approximated above that.
+
+    Returns the arrays of lower and upper errors.
+    '''
+    counts = np.asarray(counts, dtype=np.float64)
+    lower = counts - np.where(counts > 0, gammaincinv(np.maximum(counts, 1), ONE_SIGMA/2), 0)
+    upper = gammaincinv(counts + 1, 1 - ONE_SIGMA/2) - counts
+    large = counts > 100
+    lower[large] = np.sqrt(counts[large] + 0.25) - 0.5
+    upper[large] = np.sqrt(counts[large] + 0.25) + 0.5
+    return lower, upper
+
+def goodness_of_fit(counts, values, lower_boundary, upper_boundary):
+    '''
+    Computes the pulls of a histogram of the masses between the boundaries (given the number of events in each
+    bin, including the underflow and overflow bins) with respect to the model with the given values of the
+    parameters, as done by the plot function in utils.py. Bins without events are not used in the chi squared.
+
+    Returns the reduced chi squared and the mean and standard deviation of the pulls.
+    '''
+    counts = np.asarray(counts, dtype=np.float64)[1:-1]
+    edges = np.linspace(lower_boundary, upper_boundary, len(counts)+1)
+    expected = bin_expectation(edges, values, lower_boundary, upper_boundary)
+    lower, upper = poisson_errors(counts)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pulls = np.where(counts > expected, (counts - expected)/lower, (counts - expected)/upper)
+    used = counts > 0
+    # as in utils.py, where no number of fit parameters is given to RooFit, which then takes it as -1
+    red_chi2 = np.sum(pulls[used]**2)/(np.count_nonzero(used) + 1)
+    # as in utils.py, the pulls are taken from a histogram between -5 and 5
+    shown = pulls[(pulls >= -5) & (pulls < 5)]
+    return red_chi2, np.mean(shown), np.std(shown)
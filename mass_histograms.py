@@ -0,0 +1,100 @@
+"""
+mass_histograms.py
+
+This code fills the histograms of the invariant mass (D0_MM) used in the binned fits. The invariant mass is read as a single column (see read_data in data_io.py), so the histograms can be filled from root, Arrow or Parquet files, and the histograms of all the groups of events in a file (e.g. both mesons of a polarity, using its offsets index) are filled in a single pass, finding the bin of every event at once. The histograms are then turned into ROOT histograms from the arrays, so that neither TTree.Draw nor the graphics system are needed.
+The bins are found in the same way as in ROOT: the lower edge of each bin is included and the upper one is not, and the events outside the range are kept in the underflow and overflow bins. As with TTree.Draw, events whose mass is not a finite number are not counted in any bin.
+ROOT is only imported when a ROOT histogram is created, as it takes a few seconds, so the histograms can be filled by the fits done without ROOT (see mass_fit.py).
+It is not meant to be run on its own, but imported by the scripts that perform binned fits.
+
+Author: Marc Oriol Pérez (marc.oriolperez@student.manchester.ac.uk)
+Last edited: 17th October 2026
+"""
+
+# - - - - - - IMPORT STATEMENTS - - - - - - #
+
+import numpy as np
+from data_io import read_data, read_offsets
+
+# - - - - - - - FUNCTIONS - - - - - - - #
+
+def bin_index(masses, numbins, lower_boundary, upper_boundary):
+    '''
+    Finds the bin of each mass in a histogram with numbins bins between lower_boundary and upper_boundary, as
+    done by ROOT, where 0 is the underflow bin and numbins+1 the overflow bin. The masses that are not finite
+    numbers are given the index numbins+2, which is not a bin of the histogram, so that they are skipped by
+    count_bins.
+
+    Returns the array of bin indices.
+    '''
+    masses = np.asarray(masses, dtype=np.float64)
+    finite = np.isfinite(masses)
+    index = np.full(len(masses), numbins + 2, dtype=np.intp)
+    position = np.floor(numbins*(masses[finite] - lower_boundary)/(upper_boundary - lower_boundary))
+    index[finite] = np.clip(position, -1, numbins) + 1
+    return index
+
+def count_bins(index, numbins):
+    '''
+    Counts the number of events in each bin given the bin index of each of them (see bin_index), skipping the
+    events that are not in any bin.
+
+    Returns the number of events in each bin, including the underflow (first) and overflow (last) bins.
+    '''
+    return np.bincount(index, minlength=numbins+3)[:numbins+2].astype(np.float64)
+
+def read_masses(filename, group=None, index="flavour"):
+    '''
+    Reads the invariant mass of the given group of events (the name of a flavour or bin in the given offsets
+    index, see data_io.py) of the dataset with the given name (without extension), or of all its events if the
+    group is None.
+
+    Returns the array of masses.
+    '''
+    selection = {} if group is None else {index: group}
+    return np.asarray(read_data(filename, expressions=["D0_MM"], **selection)["D0_MM"], dtype=np.float64)
+
+def count_masses(masses, numbins, lower_boundary, upper_boundary):
+    '''
+    Fills the histogram of the given masses, with numbins bins between lower_boundary and upper_boundary.
+
+    Returns the number of events in each bin, including the underflow (first) and overflow (last) bins.
+    '''
+    return count_bins(bin_index(masses, numbins, lower_boundary, upper_boundary), numbins)
+
+def fill_histograms(filename, groups, numbins, lower_boundary, upper_boundary, index="flavour"):
+    '''
+    Fills the histograms of the invariant mass of the given groups of events of the dataset with the given name
+    (without extension), with numbins bins between lower_boundary and upper_boundary. The groups are the names
+    of the flavours or bins in the given offsets index of the file (see data_io.py), or None for all its events.
+    If a single group is given, only its events are read. Otherwise the whole column is read once and the bins of
+    all its events are found together.
+
+    Returns an array with one row per group with the number of events in each bin, including the underflow
+    (first) and overflow (last) bins, so that the sum of each row is the number of events in the group with a
+    finite mass.
+    '''
+    if len(groups) == 1:
+        return count_masses(read_masses(filename, groups[0], index), numbins, lower_boundary, upper_boundary)[np.newaxis]
+
+    masses = read_data(filename, expressions=["D0_MM"])["D0_MM"]
+    offsets = read_offsets(filename, index=index)
+    if offsets is None:
+        raise ValueError(f"{filename} has no {index} offsets index, so the events of each {index} cannot be found")
+    # the bins are found once for all the events, and the events of each group are a contiguous range of them
+    bins = bin_index(masses, numbins, lower_boundary, upper_boundary)
+    ranges = [(0, len(bins)) if name is None else offsets[name] for name in groups]
+    return np.array([count_bins(bins[start:stop], numbins) for start, stop in ranges])
+
+def histogram(name, title, counts, lower_boundary, upper_boundary):
+    '''
+    Creates a ROOT histogram from the number of events in each bin, as given by fill_histograms. As with the
+    histograms filled by TTree.Draw, the error of each bin is the square root of its content.
+
+    Returns the histogram.
+    '''
+    import ROOT
+    hist = ROOT.TH1D(name, title, len(counts)-2, lower_boundary, upper_boundary)
+    hist.SetDirectory(0)
+    hist.SetContent(np.ascontiguousarray(counts, dtype=np.float64))
+    hist.SetEntries(counts.sum())
+    return hist
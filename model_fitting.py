@@ -3,22 +3,33 @@ model_fitting.py
 
 This code us used to plot the signal Gaussian and Crystal Ball model and Exponential background model using the best fit parameters generated from fit_global.py. The code allows for a binned or unbinned fit depending on the --binned_fit parser, if the unbinned fit is requested then the plot function is called from utils.py.
 It then returns the relevant plots of the best fit to the data and a .txt file containing the values and errors on the normalization constant of both signal and background, the mean and standard deviation of the pull distribution and the reduced chi squared value.
-The year of interest, size of the data, meson of interest and polarity to be analysed must be specified using the required flags --year --size --meson --polarity. It is also required to specify if the fit should be done on the binned data or the unbinned data using the flag --binned_fit. There also are the flags --input --parameteers_path and --path, which are not required. These are used to specify the directory where the input data is located, where the global best-fit parameters can be found and where the output should be written, respectively. By default it is set to be the current working directory.
+The year of interest, size of the data, meson of interest and polarity to be analysed must be specified using the required flags --year --size --meson --polarity. It is also required to specify if the fit should be done on the binned data or the unbinned data using the flag --binned_fit. The optional flags --fit_backend --num_cpu --offset set how the likelihood is evaluated (see fit_backends.py). The optional flag --engine sets whether the fit is performed with RooFit or with NumPy and iminuit (see mass_fit.py), in which case ROOT is not imported at all and no plots are made. In both cases the shape of the signal and background is fixed to the result of the global fit, and the yields are fitted. As the global fit gives the signal fraction of each meson separately, the mesons cannot be fitted together (--meson both). The optional flag --cache sets a directory in which the results of the fits are kept (see fit_cache.py), identified by the masses or histogram fitted, the parameters taken from the global fit, the source of the model, of the histograms and of the fit backends and the options of the fit. Both binned and unbinned fits write out their yields, and so are cached. If the same fit has already been done, its yields are written out at once without fitting, and no plots are made. There also are the flags --input --parameteers_path and --path, which are not required. These are used to specify the directory where the input data is located, where the global best-fit parameters can be found and where the output should be written, respectively. By default it is set to be the current working directory.
+The flag --bin, which is not required, is used to fit the events of a single bin of the binning scheme. These are read from the bin-sorted file written by apply_binning_scheme.py, using its bin offsets index to read only the range of entries of that bin. If it is not given, the events of the meson are read from the clean data written by select_and_clean.py. In the binned fit, the histogram of the invariant mass is filled from its column (see mass_histograms.py), without drawing it, so the input data can be in any of the formats written by apply_binning_scheme.py and select_and_clean.py.
 This code is heavily inspired by Marc Oriol Pérez, however it has been adapted to correctly plot a binned fit.
 
 Author: Sam Taylor (samuel.taylor-9@student.manchester.ac.uk) and Laxman Seelan (laxman.seelan@student.manchester.ac.uk)
-Last edited: 5th November 2023
+Last edited: 17th October 2026
 """
 
 # - - - - - - IMPORT STATEMENTS - - - - - - #
 
-import ROOT
 import argparse
 import os
-from utils import plot
+import sys
 import numpy as np
-from ROOT import TChain, RooRealVar, RooDataSet, RooGaussian, RooCrystalBall, RooChebychev, RooAddPdf, RooArgList, RooFit, RooArgSet, RooDataHist, RooExponential
-from lhcbstyle import LHCbStyle
+from data_io import read_offsets
+from mass_histograms import read_masses, count_masses, histogram
+from fit_backends import FIT_BACKENDS, fit_pdf
+from mass_fit import PARAMETERS, unbinned_nll, binned_nll, fit, goodness_of_fit
+from fit_cache import fit_key, load_result, store_result
+
+# Position of the fraction of the Gaussian in the signal of each meson and polarity in the global fit parameters
+FRACTIONS = {
+    "D0_down": 8,
+    "D0_up": 9,
+    "D0bar_down": 10,
+    "D0bar_up": 11,
+}
 
 # - - - - - - - FUNCTIONS - - - - - - - #
 def dir_path(string):
@@ -30,7 +41,58 @@ def dir_path(string):
         return string
     else:
         raise NotADirectoryError(string)
-        
+
+def input_events():
+    '''
+    Finds the events to be fitted. If a bin is given, they are the events of that bin in the bin-sorted file
+    written by apply_binning_scheme.py, otherwise they are the events of the meson in the clean data.
+
+    Returns the name of the file (without extension), the offsets index in which the events are found and their
+    name in it, which is None if all the events in the file are fitted.
+    '''
+    if options.bin is not None:
+        if options.meson == "both":
+            return f"{options.input}/{options.polarity}_{options.year}_{options.size}_binned", "bin", options.bin
+        return f"{options.input}/{options.meson}_{options.polarity}_{options.year}_{options.size}_binned", "bin", options.bin
+    filename = f"{options.input}/{options.polarity}_data_{options.year}_{options.size}_clean"
+    return filename, "flavour", None if options.meson == "both" else options.meson
+
+def events_tree(filename, index, group):
+    '''
+    Reads the invariant mass (D0_MM) of the events to be fitted (see input_events). They are stored together in
+    the file, so only their range of entries (as given by the offsets index, see data_io.py) is copied into the
+    tree.
+
+    Returns the chain reading the file, which must be kept alive while the tree is used, and the tree.
+    '''
+    if group is None:
+        start, stop = 0, ROOT.TTree.kMaxEntries
+    else:
+        start, stop = read_offsets(filename, "root", index)[group]
+
+    chain = TChain("D02Kpi_Tuple/DecayTree")
+    chain.Add(f"{filename}.root")
+    chain.SetBranchStatus("*", 0)
+    chain.SetBranchStatus("D0_MM", 1)
+
+    return chain, chain.CopyTree("", "", stop - start, start)
+
+def write_yields(Nsig, Nsig_error, Nbkg, Nbkg_error, chi2, pull_mean, pull_std, cached=False):
+    '''
+    Writes the fitted yields and their errors, and the goodness of the fit, to the txt file read by
+    calculate_raw_asymmetry.py and analyse_chisquared.py. If a cache directory is given and the fit has been
+    performed, they are also stored in it under the key of the fit.
+    '''
+    if options.bin is not None:
+        file = open(f"{options.path}/yields_{options.meson}_{options.polarity}_{options.year}_{options.size}_bin{options.bin}.txt", "w")
+    else:
+        file = open(f"{options.path}/yields_{options.meson}_{options.polarity}_{options.year}_{options.size}.txt", "w")
+    text = str(Nsig) + ', ' + str(Nsig_error) + ', ' + str(Nbkg) + ', ' + str(Nbkg_error) + ', ' + str(chi2) + ', ' + str(pull_mean) + ', ' + str(pull_std)
+    file.write(text)
+    file.close()
+    if options.cache is not None and not cached:
+        store_result(options.cache, key, [Nsig, Nsig_error, Nbkg, Nbkg_error, chi2, pull_mean, pull_std], options.cache_entries)
+
 def parse_arguments():
     '''
     Parses the arguments needed along the code. Arguments:
@@ -38,8 +100,9 @@ def parse_arguments():
     --year      Used to specify the year at which the data was taken the user is interested in.
                 The argument must be one of: [16, 17, 18]. These referr to 2016, 2017 & 2018, respectively.
     --size      Used to specify the amount of events the user is interested in analysing.
-                The argument must be one of: [large, small, medium, 1-8]. The integers specify the number of root
+                The argument must be one of: [large, small, medium, all, 1-8]. The integers specify the number of root
                 files to be read in. Large is equivalent to 8. Medium is equivalent to 4. Small takes 200000 events.
+                All takes every file available in the production directories.
     --polarity  Used to specify the polarity of the magnet the user is interested in.
                 The argument must be one of: [up, down].
     --meson     Used to specify the meson the user is interested in.
@@ -54,6 +117,24 @@ def parse_arguments():
     --binned_fit
                 Used to specify if the data should be binned before performing the fit or an unbinned fit should be performed.
                 Type either y or Y for a binned fit. Type n or N for an unbinned fit.
+    --bin       Used to specify the name of the bin of the binning scheme to be fitted (see binning_scheme.py). It is not
+                required, in the case it is not specified, all the events of the meson are fitted.
+    --fit_backend
+                Used to specify how the likelihood is evaluated in the fit. The argument must be one of: [default, legacy,
+                cpu, numcpu, codegen] (see fit_backends.py). It is not required, in the case it is not specified, the default
+                evaluation of RooFit is used.
+    --num_cpu   Used to specify the number of processes used to evaluate the likelihood with the numcpu backend. It is
+                not required, in the case it is not specified, the number of cores available is used.
+    --offset    Used to specify if the likelihood should be offset. Type either y or Y to offset it. Type n or N not to
+                offset it. It is not required, in the case it is not specified, the likelihood is not offset.
+    --engine    Used to specify how the fit is performed. The argument must be one of: [roofit, numpy]. It is not
+                required, in the case it is not specified, the fit is performed with RooFit.
+    --cache     Used to specify a directory in which the results of the fits are kept. If the same fit has already been
+                done, its results are taken from it. It is not required, in the case it is not specified, the fit is
+                always performed.
+    --cache_entries
+                Used to specify the maximum number of results kept in the cache. When it is exceeded, the least
+                recently used results are removed. It is not required, in the case it is not specified, it is 10000.
                 
     Returns the parsed arguments.
     '''
@@ -68,7 +149,7 @@ def parse_arguments():
     parser.add_argument(
         "--size",
         type=str,
-        choices=["large", "medium", "small", "1", "2", "3", "4", "5", "6", "7", "8"],
+        choices=["large", "medium", "small", "all", "1", "2", "3", "4", "5", "6", "7", "8"],
         required=True,
         help="flag to set the data taking year."
     )
@@ -114,6 +195,58 @@ def parse_arguments():
         required=True,
         help="flag to set whether a binned or an unbinned should be performed (y/n)"
     )
+    parser.add_argument(
+        "--bin",
+        type=str,
+        required=False,
+        default=None,
+        help="flag to set the bin of the binning scheme to be fitted"
+    )
+    parser.add_argument(
+        "--fit_backend",
+        type=str,
+        choices=FIT_BACKENDS,
+        required=False,
+        default="default",
+        help="flag to set how the likelihood is evaluated in the fit"
+    )
+    parser.add_argument(
+        "--num_cpu",
+        type=int,
+        required=False,
+        default=None,
+        help="flag to set the number of processes used by the numcpu fit backend"
+    )
+    parser.add_argument(
+        "--offset",
+        type=str,
+        choices=["y", "Y", "n", "N"],
+        required=False,
+        default="n",
+        help="flag to set whether the likelihood should be offset (y/n)"
+    )
+    parser.add_argument(
+        "--engine",
+        type=str,
+        choices=["roofit", "numpy"],
+        required=False,
+        default="roofit",
+        help="flag to set whether the fit is performed with RooFit or with NumPy and iminuit"
+    )
+    parser.add_argument(
+        "--cache",
+        type=dir_path,
+        required=False,
+        default=None,
+        help="flag to set the directory where the results of the fits are cached"
+    )
+    parser.add_argument(
+        "--cache_entries",
+        type=int,
+        required=False,
+        default=10000,
+        help="flag to set the maximum number of results in the cache"
+    )
     
     return parser.parse_args()
 
@@ -133,12 +266,60 @@ else:
 # Reads in the fit parameters generated by fit_global.py, these will be either for a binned/unbinned fit depending on if fit_global.py was ran as a binned fit or not
 parameters = np.loadtxt(f"{options.parameters_path}/fit_parameters.txt", delimiter=',')
 
-# Read data
-ttree = TChain("D02Kpi_Tuple/DecayTree")
-ttree.Add(f"{options.input}/{options.meson}_{options.polarity}_data_{options.year}_{options.size}_clean.root")
+# The signal fraction is only given by the global fit for each meson
+if options.meson == "both":
+    raise ValueError("The fit of both mesons together is not supported, as the global fit gives the signal fraction of each meson")
+sample = f"{options.meson}_{options.polarity}"
+
+# Events to be fitted
+filename, index, group = input_events()
+masses = read_masses(filename, group, index)
+entries = len(masses)
+counts = count_masses(masses, numbins, lower_boundary, upper_boundary)
+
+# Takes the results from the cache if the same fit has already been done
+if options.cache is not None:
+    configuration = {
+        "engine": options.engine,
+        "binned": binned,
+        "sample": sample,
+        "range": [numbins, lower_boundary, upper_boundary],
+        "fit_backend": options.fit_backend,
+        "num_cpu": options.num_cpu,
+        "offset": options.offset in ["y", "Y"],
+    }
+    sources = [os.path.abspath(__file__)] + [f"{os.path.dirname(os.path.abspath(__file__))}/{source}" for source in ["mass_fit.py", "mass_histograms.py", "fit_backends.py"]]
+    key = fit_key(sources, [counts if binned else masses, parameters], configuration)
+    cached = load_result(options.cache, key)
+    if cached is not None:
+        print("The results of the fit have been taken from the cache")
+        write_yields(*cached, cached=True)
+        print(entries)
+        sys.exit()
+
+if options.engine == "numpy":
+    # Fit data without ROOT, with the shape fixed to the global fit and the yields free
+    if binned:
+        nll = binned_nll(counts, lower_boundary, upper_boundary)
+    else:
+        nll = unbinned_nll(masses, lower_boundary, upper_boundary)
+    start = list(parameters[:8]) + [parameters[FRACTIONS[sample]], 0.95*entries, 0.05*entries]
+    values, errors, minuit = fit(nll, start, {"Nsig": (0, entries), "Nbkg": (0, entries)}, PARAMETERS[:9])
+    chi2, pull_mean, pull_std = goodness_of_fit(counts, list(values.values()), lower_boundary, upper_boundary)
+    # Write out results
+    write_yields(values["Nsig"], errors["Nsig"], values["Nbkg"], errors["Nbkg"], chi2, pull_mean, pull_std)
+    print(entries)
+    sys.exit()
+
+# The fit is performed with RooFit, which is only imported here as it takes a few seconds
+import ROOT
+from ROOT import TChain, RooRealVar, RooDataSet, RooGaussian, RooCrystalBall, RooChebychev, RooAddPdf, RooArgList, RooFit, RooArgSet, RooDataHist, RooExponential
+from utils import plot
+from lhcbstyle import LHCbStyle
+
+# Options setting how the likelihood is evaluated
+backend_settings = {"backend": options.fit_backend, "num_cpu": options.num_cpu, "offset": options.offset in ["y", "Y"]}
 
-ttree.SetBranchStatus("*", 0)
-ttree.SetBranchStatus("D0_MM", 1)
 D0_M = RooRealVar("D0_MM", r"D0 mass / [MeVc^{-2}]", lower_boundary, upper_boundary) # D0_MM - invariant mass
 
 # Define variables for signal model, using the best fit parameters generated from fit_global.py
@@ -157,28 +338,11 @@ Crystal = RooCrystalBall("Crystal", "Crystal Ball", D0_M, mu, Csig, aL, nL, aR,
 a = RooRealVar("a0", "a0", parameters[7])
 background = RooExponential("Exponential", "Exponential", D0_M, a)
 
-if options.meson == "D0":
-    # D0 MagDown
-    if options.polarity == "down":
-        frac = RooRealVar("frac_D0_down", "frac_D0_down", parameters[8])
-        Nsig = RooRealVar("Nbkg_D0_up", "Nbkg_D0_up", parameters[12])
-        Nbkg = RooRealVar("Nbkg_D0_down", "Nbkg_D0_down", parameters[13])
-    # D0 MagUp
-    elif options.polarity == "up":
-        frac = RooRealVar("frac_D0_up", "frac_D0_up", parameters[9])
-        Nsig = RooRealVar("Nbkg_D0_up", "Nbkg_D0_up", parameters[14])
-        Nbkg = RooRealVar("Nbkg_D0_down", "Nbkg_D0_down", parameters[15])
-elif options.meson == "D0bar":
-    # D0bar MagDown
-    if options.polarity == "down":
-        frac = RooRealVar("frac_D0bar_down", "frac_D0bar_down", parameters[10])
-        Nsig = RooRealVar("Nbkg_D0_up", "Nbkg_D0_up", parameters[16])
-        Nbkg = RooRealVar("Nbkg_D0_down", "Nbkg_D0_down", parameters[17])
-    # D0bar MagUp
-    elif options.polarity == "up":
-        frac = RooRealVar("frac_D0bar_up", "frac_D0bar_up", parameters[11])
-        Nsig = RooRealVar("Nbkg_D0_up", "Nbkg_D0_up", parameters[18])
-        Nbkg = RooRealVar("Nbkg_D0_down", "Nbkg_D0_down", parameters[19])
+# Signal fraction of the meson and polarity, from the global fit
+frac = RooRealVar(f"frac_{sample}", f"frac_{sample}", parameters[FRACTIONS[sample]])
+# The yields are fitted, starting from the same fractions of the events as in the global fit
+Nsig = RooRealVar(f"Nsig_{sample}", f"Nsig_{sample}", 0.95*entries, 0, entries)
+Nbkg = RooRealVar(f"Nbkg_{sample}", f"Nbkg_{sample}", 0.05*entries, 0, entries)
 
 # Create model
 signal = RooAddPdf("signal", "signal", RooArgList(Gauss, Crystal), RooArgList(frac))
@@ -196,15 +360,15 @@ model = {
 # Fit data
 if binned:
     with LHCbStyle():
-        # Creates the histogram for the meson by converting the TTree D0_MM data inside the TChain to a TH1(base class of ROOT histograms)
-        # TTree.Draw plots a histogram with name D0_Hist and given bin parameters and saves it to memory using: >>
-        ttree.Draw(f"D0_MM>>D0_Hist({numbins},{lower_boundary},{upper_boundary})")
-        # D0_Hist recalled from memory and saved to the local variable
-        D0_Hist = ROOT.gPad.GetPrimitive("D0_Hist")
+        # Creates the histogram for the meson from its D0_MM column, and converts it to a TH1(base class of ROOT histograms)
+        D0_Hist = histogram("D0_Hist", "D0_MM", counts, lower_boundary, upper_boundary)
         # Creating Binned container sets using RooDataHist
         Binned_data = RooDataHist("Binned_data", "Binned Data Set", RooArgList(D0_M), D0_Hist)
 
-        result = model["total"].fitTo(Binned_data, RooFit.Save(True), RooFit.Extended(True))
+        result, fit_runs = fit_pdf(model["total"], Binned_data, **backend_settings)
+        # Write out results, with the goodness of the fit computed from the histogram as in the NumPy engine
+        chi2, pull_mean, pull_std = goodness_of_fit(counts, list(parameters[:8]) + [frac.getValV(), Nsig.getValV(), Nbkg.getValV()], lower_boundary, upper_boundary)
+        write_yields(Nsig.getValV(), Nsig.getError(), Nbkg.getValV(), Nbkg.getError(), chi2, pull_mean, pull_std)
 
         mD0 = 1864.84
         mD0_range = (mD0-44.84, mD0+45.16)
@@ -354,15 +518,14 @@ if binned:
     c.SaveAs(f"{options.path}/{options.meson}_{options.polarity}_{options.year}_{options.size}/D0_fit_ANA.jpg")
 
 else:
+    # Read data
+    chain, ttree = events_tree(filename, index, group)
     unbinned_data = RooDataSet("data", "Data", ttree, RooArgSet(D0_M))
-    model["total"].fitTo(unbinned_data, RooFit.Save(), RooFit.Extended(1), RooFit.Minos(0))
+    result, fit_runs = fit_pdf(model["total"], unbinned_data, options=[RooFit.Minos(0)], **backend_settings)
     # Generate plots from the plot function in utils.py
     chi2, pull_mean, pull_std = plot(D0_M, unbinned_data, model, nbins=numbins, setlogy=False, save_to=f'{options.path}/{options.meson}_{options.polarity}_{options.year}_{options.size}', plot_type=f"20{options.year} Mag{(options.polarity).title()}", meson=options.meson)
     # Write out results
-    file = open(f"{options.path}/yields_{options.meson}_{options.polarity}_{options.year}_{options.size}.txt", "w")
-    text = str(Nsig.getValV()) + ', ' + str(Nsig.getError()) + ', ' + str(Nbkg.getValV()) + ', ' + str(Nbkg.getError()) + ', ' + str(chi2) + ', ' + str(pull_mean) + ', ' + str(pull_std)
-    file.write(text)
-    file.close
+    write_yields(Nsig.getValV(), Nsig.getError(), Nbkg.getValV(), Nbkg.getError(), chi2, pull_mean, pull_std)
 
 
-print(ttree.GetEntries())
\ No newline at end of file
+print(entries)
\ No newline at end of file
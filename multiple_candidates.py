@@ -1,63 +1,39 @@
 """
 multiple_candidates.py
 
-This code is used to chech which events have multiple candidates, and for those that do one of the candidates is selected at random, while the others are removed.
+This code is used to chech which events have multiple candidates, and for those that do one of the candidates is selected at random, while the others are removed. The candidate kept is chosen using a hash of the run and event numbers and a seed, which can be set with the optional flag --seed, so the choice is reproducible. Alternatively, the optional flag --policy can be used to keep the best candidate of each event according to a ranking policy instead (see POLICIES in candidate_selection.py).
 The year of interest, size of the data and polarity to be analysed must be specified using the required flags --year --size --polarity. There is a fourth flag --path, which is not required. This one is used to specify the directory where the input data is located, and where the output file should be written. By default it is set to be the current working directory.
-It outputs the data for each into 3 seperate root files, one containing only D0 events, another containing only D0bar, and the third containing all events.
+It outputs the data into a single root file, with the D0 events first followed by the D0bar events, and an offsets index with the entries of each meson, so that the D0, D0bar or all events can be read from it (see read_data in data_io.py). The optional flags --format and --compression can be used to write Arrow or Parquet files instead (see data_io.py). For datasets that do not fit in memory, the optional flag --partitions runs in out-of-core mode, where the candidates are split into partitions on local disk by their run and event numbers and each partition is processed on its own, in parallel if the optional flag --workers is given. The optional flags --step_size and --scratch set the size of the chunks read and the directory where the partitions are written.
 This code is heavily inspired on the work of Camille Jarvis-Stiggants and Michael England. The minor modifications to the original code have simply added flexibility to it.
 
 Author: Marc Oriol Pérez (marc.oriolperez@student.manchester.ac.uk)
-Last edited: 15th September 2023
+Last edited: 17th October 2026
 """
 
 # - - - - - - IMPORT STATEMENTS - - - - - - #
 
 import os
+import shutil
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import uproot as ur
-import pandas as pd
-import awkward as ak
 import numpy as np
 import argparse
+from data_io import EXTENSIONS, FLAVOURS, DataWriter, check_format, write_data, split_by_flavour, sort_by_flavour
+from candidate_selection import POLICIES, choose_candidates, choose_keys, policy_scores, event_keys, partition_keys
 
 # - - - - - - - FUNCTIONS - - - - - - - #
 
-def get_multiple_candidate_selection(data_frame):
+def get_multiple_candidate_selection(data):
     """
-    Add a boolean column of whether to reject a multiple candidate based on run & event number
-    Note we randomly shuffle the columns, then the "duplicates" function returns false for the
-    first occurence, then true for subsequent. So we return this as the "should we reject the event"
-    decision
+    Returns a boolean array of whether to reject each candidate as a multiple candidate, based on its run &
+    event number. In each event with multiple candidates, one of them is kept at random using a hash of the
+    run & event numbers and the seed given by the user (see candidate_selection.py), and the rest are rejected.
+    The choice only depends on the order of the candidates within each event, so no shuffling or resorting
+    is needed. If a ranking policy is given by the user, the best candidate of each event is kept instead.
     """
-    internal_clone = data_frame
-    # get the old index so we can resort after sampling
-    
-    columns = ["eventNumber", "runNumber"]
-    test = pd.DataFrame(data=ak.to_numpy(internal_clone[columns]),columns=columns) # for checking that the order of events is the same before shuffling and after resorting
-    print("Original dataframe:\n", test.head(), "\n")
-    
-    # make a shuffled dataset
-    # df_shuffle = internal_clone.sample(frac=1).reset_index() # frac=x means sample 100*x % of the dataset randomly, hence frac=1 means shuffle all of it
-    df_shuffle = test.sample(frac=1).reset_index() # frac=x means sample 100*x % of the dataset randomly, hence frac=1 means shuffle all of it
-    
-    # the .duplicated() function returns a list of booleans
-    # in this case it compares the eventNumber and runNumber of all entries in the tree
-    df_shuffle["is_mult_cand"] = df_shuffle.duplicated(columns)
-    # whatever is inside the [""] is the name of the new branch in the output file
-    # the first instance of any combination of eventNumber and runNumber will have is_mult_cand=False
-    # this is because it hasn"t come across this combination yet
-    # all subsequent instances of the same combination of numbers will have is_mult_cand=True
-    # shuffling first ensures that the first instance (that which gets False) is random
-    # which is what we want (randomly pick a candidate to keep)
-    # then when reading the output file for analysis, only keep events if(is_mult_cand==false)
-
-    # resort
-    df_shuffle = df_shuffle.sort_values(by=["index"]).reset_index()
-    
-    # shorten to only contain the following three columns (will add this new file as a friend)
-    df_shuffle = df_shuffle[["eventNumber","runNumber","is_mult_cand"]]
-    
-    # should now put this in the original dataframe
-    return df_shuffle
+    return ~choose_candidates(data, args.seed, args.policy)
 
 def dir_path(string):
     '''
@@ -69,6 +45,16 @@ def dir_path(string):
     else:
         raise NotADirectoryError(string)
         
+def step_size(string):
+    '''
+    Checks if a given string is a valid step size for uproot.iterate.
+    If it is an integer, returns it as a number of events. Otherwise it is returned as a memory size (e.g. "100 MB").
+    '''
+    if string.isdigit():
+        return int(string)
+    else:
+        return string
+
 def parse_arguments():
     '''
     Parses the arguments needed along the code. Arguments:
@@ -76,12 +62,42 @@ def parse_arguments():
     --year      Used to specify the year at which the data was taken the user is interested in.
                 The argument must be one of: [16, 17, 18]. These referr to 2016, 2017 & 2018, respectively.
     --size      Used to specify the amount of events the user is interested in analysing.
-                The argument must be one of: [large, small, medium, 1-8]. The integers specify the number of root
+                The argument must be one of: [large, small, medium, all, 1-8]. The integers specify the number of root
                 files to be read in. Large is equivalent to 8. Medium is equivalent to 4. Small takes 200000 events.
+                All takes every file available in the production directories.
     --polarity  Used to specify the polarity of the magnet the user is interested in.
                 The argument must be one of: [up, down].
     --path      Used to specify the directory in which the output files should be written. It is not required,
                 in the case it is not specified, the default path is the current working directory.
+    --format    Used to specify the format of the output files. The argument must be one of: [root, arrow, parquet].
+                It is not required, in the case it is not specified, root files are written. Note that fit_global.py
+                and model_fitting.py can only read root files.
+    --compression
+                Used to specify the compression of the output files. It is not required, in the case it is not
+                specified, the default compression of the format is used. See COMPRESSIONS in data_io.py for the
+                compressions available in each format.
+    --seed      Used to specify the seed used to choose at random the candidate kept in events with multiple
+                candidates. It is not required, in the case it is not specified, it is 482022.
+    --policy    Used to specify how the candidate kept in events with multiple candidates is chosen. The argument
+                must be one of: [random, probnn, ipchi2, mass]. Random keeps a candidate chosen at random (see
+                --seed), probnn the one with the highest P1_ProbNNk*P2_ProbNNpi, ipchi2 the one with the smallest
+                D0_IPCHI2_OWNPV and mass the one with D0_MM closest to the mass of the D0. It is not required, in
+                the case it is not specified, it is random.
+    --partitions
+                Used to run in out-of-core mode, for datasets that do not fit in memory. The run and event
+                numbers of the candidates are split into the given number of partitions on local disk, so that
+                all the candidates of an event are in the same partition, and each partition is processed on
+                its own. The output is the same as when all the data is held in memory. It is not required, in
+                the case it is not specified, all the data is held in memory.
+    --workers   Used to specify the number of worker processes used to process the partitions in out-of-core
+                mode. It is not required, in the case it is not specified, the partitions are processed one after
+                another.
+    --step_size Used to specify the size of the chunks in which the input file is read in out-of-core mode
+                (either a number of events, e.g. 500000, or a memory size, e.g. "100 MB"). It is not required, in
+                the case it is not specified, it is 100 MB.
+    --scratch   Used to specify the local directory in which the partitions are written in out-of-core mode. They
+                are removed at the end. It is not required, in the case it is not specified, the partitions are
+                written in the directory given by --path.
     
     Returns the parsed arguments.
     '''
@@ -96,7 +112,7 @@ def parse_arguments():
     parser.add_argument(
         "--size",
         type=str,
-        choices=["large", "medium", "small", "1", "2", "3", "4", "5", "6", "7", "8"],
+        choices=["large", "medium", "small", "all", "1", "2", "3", "4", "5", "6", "7", "8"],
         required=True,
         help="flag to set the data taking year."
     )
@@ -114,85 +130,253 @@ def parse_arguments():
         default=os.getcwd(),
         help="flag to set the path where the output files should be written to"
     )
+    parser.add_argument(
+        "--format",
+        type=str,
+        choices=list(EXTENSIONS),
+        required=False,
+        default="root",
+        help="flag to set the format of the output files (root/arrow/parquet)"
+    )
+    parser.add_argument(
+        "--compression",
+        type=str,
+        required=False,
+        default=None,
+        help="flag to set the compression of the output files"
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        required=False,
+        default=482022,
+        help="flag to set the seed used to choose the candidate kept in each event"
+    )
+    parser.add_argument(
+        "--policy",
+        type=str,
+        choices=list(POLICIES),
+        required=False,
+        default="random",
+        help="flag to set the policy used to choose the candidate kept in each event"
+    )
+    parser.add_argument(
+        "--partitions",
+        type=int,
+        required=False,
+        default=1,
+        help="flag to set the number of partitions used in out-of-core mode"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        required=False,
+        default=1,
+        help="flag to set the number of worker processes used in out-of-core mode"
+    )
+    parser.add_argument(
+        "--step_size",
+        type=step_size,
+        required=False,
+        default="100 MB",
+        help="flag to set the size of the chunks read in out-of-core mode"
+    )
+    parser.add_argument(
+        "--scratch",
+        type=dir_path,
+        required=False,
+        default=None,
+        help="flag to set the local directory where the partitions are written in out-of-core mode"
+    )
     
     return parser.parse_args()
         
-def save_file(filename, cut_data):
+def save_file(filename, cut_data, offsets=None):
     '''
-    Saves a .root file containing the data in cut_data. It is written to the path specified
-    by the user, and has the name given by filename.
+    Saves a file containing the data in cut_data. It is written to the path specified
+    by the user, in the format requested, and has the name given by filename. If offsets
+    is given, the offsets index of each flavour is stored in the file.
     '''
-    tree = "D02Kpi_Tuple/DecayTree"
-
-    filename = f"{args.path}/{filename}.root" 
-    print(f"Writing to {filename}...")
-    outfile = ur.recreate(f"{filename}") # create the write file
-
-    branches = {column: ak.type(cut_data[column]) for column in cut_data.fields} # here we're defining the branches we want to save to file as a dictionary of name : data type
-    outfile.mktree(tree, branches)
-
-    # now write and close
-    outfile[tree].extend({branch: cut_data[branch] for branch in branches.keys()})
-    outfile.close()
+    filename = write_data(f"{args.path}/{filename}", cut_data, args.format, args.compression, offsets)
 
     return print(f'Saved file {filename}.')
 
 def save_all(year, size):
     '''
-    Iterates through the save_file function in order to write out all the data in different
-    files, based on the origin of the decay (D0, D0bar or any).
+    Writes out all the data in a single file, with the events ordered by the origin of the decay (D0 or D0bar)
+    and an offsets index, so that the D0, the D0bar or all the events can be read from it without needing
+    separate files (see read_data in data_io.py).
     '''
-    names = ["D0_", "D0bar_", ""]
-    for index, dataset in enumerate([D0_DATA, D0BAR_DATA, DATA]):
-        save_file(f'{names[index]}{args.polarity}_data_{year}_{size}_clean', dataset)
+    save_file(f'{args.polarity}_data_{year}_{size}_clean', DATA, OFFSETS)
     
     return print(f'Saved {size} data for year 20{year}')
 
 def split_meson(data):
     '''
-    It takes data from events and splits them in 3 datasets, depending on the origin meson
-    of the decay (D0, D0bar, any).
+    It takes data from events and orders them depending on the origin meson of the decay (first D0, then
+    D0bar), keeping the order of the events of each meson (see sort_by_flavour in data_io.py).
+    
+    Returns the ordered data and the offsets index with the entries of each meson.
     '''
-    # select positive z-momentum and remove muons
     length = len(data)
     print(f"The number of events to be analysed is {length}")
-    mask = np.ones(length)
     
-    # split the reconstructed particles into mesons and antimesons
+    data, offsets = sort_by_flavour(data)
+    print(f"D0 events: {offsets['D0'][1] - offsets['D0'][0]}, D0bar events: {offsets['D0bar'][1] - offsets['D0bar'][0]}")
     
-    mask_D0 = np.logical_and(mask, data["D0_ID"]==421)
-    mask_D0bar = np.logical_and(mask, data["D0_ID"]==-421)
+    print('checkpoint: data has been masked')
+        
+    return data, offsets
+
+def write_partitions(filename, scratch):
+    '''
+    First pass of the out-of-core mode. Reads the run and event numbers of the candidates in filename in chunks,
+    and appends the key of each candidate to the file of its partition in scratch. If a ranking policy is used,
+    the score of each candidate is appended to a second file of its partition. Within each partition the
+    candidates keep their original order.
     
-    D0_data = data[mask_D0]
-    D0bar_data = data[mask_D0bar]
+    Returns the number of candidates read.
+    '''
+    ranked = POLICIES[args.policy]["score"] is not None
+    shards = [open(f"{scratch}/{partition}.keys", "wb") for partition in range(args.partitions)]
+    if ranked:
+        score_shards = [open(f"{scratch}/{partition}.score", "wb") for partition in range(args.partitions)]
+    length = 0
+    for chunk in ur.iterate(filename, expressions=["runNumber", "eventNumber"] + POLICIES[args.policy]["branches"], step_size=args.step_size):
+        keys = event_keys(chunk["runNumber"], chunk["eventNumber"])
+        partitions = partition_keys(keys, args.partitions)
+        order = np.argsort(partitions, kind="stable")
+        bounds = np.cumsum(np.bincount(partitions, minlength=args.partitions))
+        for partition, shard_keys in enumerate(np.split(keys[order], bounds[:-1])):
+            shard_keys.tofile(shards[partition])
+        if ranked:
+            for partition, shard_scores in enumerate(np.split(policy_scores(chunk, args.policy)[order], bounds[:-1])):
+                shard_scores.tofile(score_shards[partition])
+        length += len(keys)
+    for shard in shards + (score_shards if ranked else []):
+        shard.close()
     
-    print('checkpoint: data has been masked')
+    return length
+
+def select_partition(shard):
+    '''
+    Second pass of the out-of-core mode. Reads the keys (and scores, if a ranking policy is used) of a single
+    partition, chooses the candidates kept (see candidate_selection.py) and writes whether each candidate is
+    kept next to the keys, which are removed.
+    
+    Returns the number of candidates kept.
+    '''
+    keys = np.fromfile(f"{shard}.keys", dtype=np.uint64)
+    scores = None
+    if POLICIES[args.policy]["score"] is not None:
+        scores = np.fromfile(f"{shard}.score", dtype=np.float64)
+        os.remove(f"{shard}.score")
+    keep = choose_keys(keys, args.seed, args.policy, scores)
+    keep.tofile(f"{shard}.keep")
+    os.remove(f"{shard}.keys")
+    
+    return int(np.sum(keep))
+
+def stream_all(filename, scratch, year, size):
+    '''
+    Third pass of the out-of-core mode. Reads filename again in chunks, in the original order, and for each
+    chunk reads whether each candidate is kept from the files of their partitions. The candidates kept are
+    split based on the origin of the decay (D0, D0bar or other) in the same way as in memory (see
+    split_by_flavour in data_io.py) and appended to a temporary file for each in scratch, which are then copied
+    one after another in chunks to the output file, together with the offsets index. The candidates of other
+    origins are therefore kept after the D0bar ones, as in memory. Only one chunk is held in memory at any given
+    time.
+    '''
+    names = list(FLAVOURS) + ["other"]
+    writers = [DataWriter(f"{scratch}/{name}", "root") for name in names]
+    shards = [open(f"{scratch}/{partition}.keep", "rb") for partition in range(args.partitions)]
+    for chunk in ur.iterate(filename, step_size=args.step_size):
+        partitions = partition_keys(event_keys(chunk["runNumber"], chunk["eventNumber"]), args.partitions)
+        order = np.argsort(partitions, kind="stable")
+        counts = np.bincount(partitions, minlength=args.partitions)
+        keep = np.empty(len(chunk), dtype=bool)
+        keep[order] = np.concatenate([np.fromfile(shards[partition], dtype=bool, count=count) for partition, count in enumerate(counts)])
         
-    return D0_data, D0bar_data, data
+        for writer, part in zip(writers, split_by_flavour(chunk[keep])):
+            writer.extend(part)
+    for shard in shards:
+        shard.close()
+    paths = [writer.close() for writer in writers]
+    
+    # the offsets index is known once all the candidates kept have been split by flavour
+    offsets = {}
+    start = 0
+    for flavour, path in zip(FLAVOURS, paths):
+        length = 0
+        if path is not None:
+            with ur.open(path) as infile:
+                length = infile[tree_name].num_entries
+        offsets[flavour] = [start, start + length]
+        start += length
+    
+    writer = DataWriter(f"{args.path}/{args.polarity}_data_{year}_{size}_clean", args.format, args.compression, offsets)
+    for path in paths:
+        if path is None:
+            continue
+        for chunk in ur.iterate(f"{path}:{tree_name}", step_size=args.step_size):
+            writer.extend(chunk)
+    path = writer.close()
+    if path is not None:
+        print(f'Saved file {path}.')
+    
+    return print(f'Saved {size} data for year 20{year}')
+
+def remove_out_of_core(filename, year, size):
+    '''
+    Removes the multiple candidates without holding the whole dataset in memory. The keys of the candidates
+    are split into partitions on local disk (see write_partitions), the partitions are processed in parallel by
+    the number of workers given by the user (see select_partition), and the candidates kept are streamed into
+    the output files (see stream_all). The partitions are removed at the end.
+    '''
+    scratch = tempfile.mkdtemp(prefix="multiple_candidates_", dir=args.path if args.scratch is None else args.scratch)
+    try:
+        length = write_partitions(filename, scratch)
+        print(f"Number entries before multiple candidate cut = {length}")
+        if length == 0:
+            return print(f"WARNING: {filename} contains no events, no output has been written")
+        
+        shards = [f"{scratch}/{partition}" for partition in range(args.partitions)]
+        if args.workers > 1:
+            with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("fork")) as executor:
+                kept = sum(executor.map(select_partition, shards))
+        else:
+            kept = sum(map(select_partition, shards))
+        print(f"Number entries after multiple candidate cut = {kept}")
+        
+        stream_all(filename, scratch, year, size)
+    finally:
+        shutil.rmtree(scratch)
 
 # - - - - - - - MAIN BODY - - - - - - - #
 
 args=parse_arguments()
-
-np.random.seed(482022) # implemented 04/08/2022
+check_format(args.format, args.compression)
 
 # Import data
 tree_name = "D02Kpi_Tuple/DecayTree"
-data = ur.concatenate(f"{args.path}/{args.polarity}_data_{args.year}_{args.size}.root:{tree_name}")
-
-print(f"reading file for year 20{args.year}...")
-
-print(len(data))
-if len(data) > 0:
-    df = get_multiple_candidate_selection(data) # select at random candidates to remove
+input_file = f"{args.path}/{args.polarity}_data_{args.year}_{args.size}.root:{tree_name}"
 
-    print("Got dataframe:\n", df.head(), "\nCheck it matches with above!!")
-
-    print(f"Number entries before multiple candidate cut = {len(data)}")
-    is_a_multiple_candidate = df["is_mult_cand"].to_numpy()
-    data = data[~is_a_multiple_candidate] # remove candidates
-    print(f"Number entries after multiple candidate cut = {len(data)}")
+if args.partitions > 1:
+    # process the data one partition at a time
+    remove_out_of_core(input_file, args.year, args.size)
+else:
+    data = ur.concatenate(input_file)
     
-    D0_DATA, D0BAR_DATA, DATA = split_meson(data) # split data based on meson
+    print(f"reading file for year 20{args.year}...")
     
-    save_all(args.year, args.size) # output data
\ No newline at end of file
+    print(len(data))
+    if len(data) > 0:
+        is_a_multiple_candidate = get_multiple_candidate_selection(data) # select candidates to remove
+        
+        print(f"Number entries before multiple candidate cut = {len(data)}")
+        data = data[~is_a_multiple_candidate] # remove candidates
+        print(f"Number entries after multiple candidate cut = {len(data)}")
+        
+        DATA, OFFSETS = split_meson(data) # order data based on meson
+        
+        save_all(args.year, args.size) # output data
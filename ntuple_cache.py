@@ -0,0 +1,105 @@
+"""
+ntuple_cache.py
+
+This code implements a read-through cache for the input ntuples read by selection_of_events.py. The first time an input file is read, the branches requested are copied to a local root file in the cache directory. Later reads of the same file are then served from the local copy instead of the shared filesystem (e.g. EOS).
+Each copy is identified by the path, size and modification time of the original file, together with the tree and branches read, so a copy is never used once the original file has changed. When the total size of the cache goes over the given budget, the least recently used copies are removed. As the cache is shared by the workers selecting several files at once, a copy can be removed by one worker before another has opened it, so the readers fall back to the original file when their copy is missing (see read_selected in input_reader.py).
+It is not meant to be run on its own, but imported by the scripts that read the input ntuples.
+
+Author: Marc Oriol Pérez (marc.oriolperez@student.manchester.ac.uk)
+Last edited: 17th October 2026
+"""
+
+# - - - - - - IMPORT STATEMENTS - - - - - - #
+
+import os
+import hashlib
+import uproot
+import awkward as ak
+
+# - - - - - - - FUNCTIONS - - - - - - - #
+
+def cache_key(path, tree_name, expressions):
+    '''
+    Builds the name of the cached copy of a file from its path, size and modification time, the name
+    of the tree and the branches read.
+
+    Returns the key as a hexadecimal string.
+    '''
+    stat = os.stat(path)
+    description = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}|{tree_name}|{','.join(sorted(expressions))}"
+    return hashlib.sha1(description.encode()).hexdigest()
+
+def evict(cache_dir, budget, keep=None):
+    '''
+    Removes the least recently used files in cache_dir until their total size is below budget (in bytes).
+    The file named keep is never removed. The time of last use of each file is given by its modification
+    time, which is updated every time the file is used.
+    '''
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".root") or name == keep:
+            continue
+        try:
+            stat = os.stat(f"{cache_dir}/{name}")
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, name))
+
+    total = sum(size for last_used, size, name in entries)
+    if keep is not None and os.path.exists(f"{cache_dir}/{keep}"):
+        total += os.path.getsize(f"{cache_dir}/{keep}")
+
+    for last_used, size, name in sorted(entries):
+        if total <= budget:
+            break
+        try:
+            os.remove(f"{cache_dir}/{name}")
+            print(f"Removed {name} from the cache")
+        except FileNotFoundError:
+            pass
+        total -= size
+
+def cached_path(file, expressions, cache_dir, budget, step_size="100 MB"):
+    '''
+    Gets the local copy of file (given as "path:tree") containing the branches in expressions, creating it
+    if it does not exist yet. The copy is written in chunks of step_size, so the whole file is never held
+    in memory. If the original file cannot be found on the local filesystem, or its tree has no entries (so
+    there would be no chunks to write the tree with), it is not cached.
+
+    Returns the copy as "path:tree", which can be read in the same way as the original file.
+    '''
+    path, tree_name = file.rsplit(":", 1)
+    if not os.path.isfile(path):
+        print(f"WARNING: {path} is not a local file, it will be read without caching")
+        return file
+
+    expressions = list(dict.fromkeys(expressions))
+    name = f"{cache_key(path, tree_name, expressions)}.root"
+    cached = f"{cache_dir}/{name}"
+
+    if os.path.exists(cached):
+        os.utime(cached) # mark the copy as recently used
+        print(f"Reading {path} from the cache")
+        return f"{cached}:{tree_name}"
+
+    with uproot.open(path) as infile:
+        if infile[tree_name].num_entries == 0:
+            print(f"WARNING: {path} has no entries, it will be read without caching")
+            return file
+
+    print(f"Copying {path} to the cache...")
+    temporary = f"{cache_dir}/{name}.{os.getpid()}.tmp"
+    outfile = uproot.recreate(temporary)
+    tree_created = False
+    for chunk in uproot.iterate(file, expressions=expressions, step_size=step_size):
+        if not tree_created:
+            tree_created = True
+            outfile.mktree(tree_name, {column: ak.type(chunk[column]) for column in chunk.fields})
+        outfile[tree_name].extend({branch: chunk[branch] for branch in chunk.fields})
+    outfile.close()
+    # the copy only becomes visible once it is complete, so an interrupted copy is never used
+    os.replace(temporary, cached)
+
+    evict(cache_dir, budget, keep=name)
+
+    return f"{cached}:{tree_name}"
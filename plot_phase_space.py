@@ -6,7 +6,7 @@ The year of interest, size of the data, polarity and meson to be analysed must b
 It outputs several pdf files containing the relevant histograms.
 
 Author: Marc Oriol Pérez (marc.oriolperez@student.manchester.ac.uk)
-Last edited: 15th September 2023
+Last edited: 17th October 2026
 """
 # - - - - - - IMPORT STATEMENTS - - - - - - #
 import ROOT
@@ -14,10 +14,12 @@ import os
 import argparse
 import numpy as np
 from lhcbstyle import LHCbStyle
-import uproot
 import matplotlib.pyplot as plt
 import matplotlib.cm
 from matplotlib.colors import ListedColormap
+from branches import STAGE_BRANCHES
+from data_io import read_data
+from binning_scheme import load_scheme
 
 # - - - - - - - FUNCTIONS - - - - - - - #
 
@@ -28,8 +30,9 @@ def parse_arguments():
     --year      Used to specify the year at which the data was taken the user is interested in.
                 The argument must be one of: [16, 17, 18]. These referr to 2016, 2017 & 2018, respectively.
     --size      Used to specify the amount of events the user is interested in analysing.
-                The argument must be one of: [large, small, medium, 1-8]. The integers specify the number of root
+                The argument must be one of: [large, small, medium, all, 1-8]. The integers specify the number of root
                 files to be read in. Large is equivalent to 8. Medium is equivalent to 4. Small takes 200000 events.
+                All takes every file available in the production directories.
     --polarity  Used to specify the polarity of the magnet the user is interested in.
                 The argument must be one of: [up, down].
     --meson     Used to specify the meson the user is interested in.
@@ -54,7 +57,7 @@ def parse_arguments():
     parser.add_argument(
         "--size",
         type=str,
-        choices=["large", "medium", "small", "1", "2", "3", "4", "5", "6", "7", "8"],
+        choices=["large", "medium", "small", "all", "1", "2", "3", "4", "5", "6", "7", "8"],
         required=True,
         help="flag to set the data taking year."
     )
@@ -111,11 +114,10 @@ args = parse_arguments()
 
 # Import data
 
-tree_name = "D02Kpi_Tuple/DecayTree"
-data = uproot.concatenate(f"{args.input}/{args.polarity}_data_{args.year}_{args.size}_clean.root:{tree_name}")
+data = read_data(f"{args.input}/{args.polarity}_data_{args.year}_{args.size}_clean", expressions=STAGE_BRANCHES["plot_phase_space"])
 
-bins = np.loadtxt(f"{args.bin_path}/{args.year}_{args.size}_bins.txt", delimiter=',')
-bins[0] = bins[0]/1000
+scheme = load_scheme(args.bin_path, args.year, args.size)
+pT_edges = np.asarray(scheme["pT_edges"])/1000
 viridis = matplotlib.cm.get_cmap('YlOrRd')
 newcolors = viridis(np.linspace(0, 1, 25))
 newcmp = ListedColormap(newcolors)
@@ -164,11 +166,10 @@ ax.set_xlim(2, 10)
 ax.set_ylim(2, 5)
 fig.colorbar(h2d[3], ax=ax, label='Events')
 
-for index in np.arange(0,10):
+for index, eta_edges in enumerate(scheme["eta_edges"]):
     if index!=0:
-        ax.axvline(bins[0,index], ymin=0, ymax=1, color='blue')
-    for j in np.arange(0,10):
-        if j!=0:
-            ax.axhline(bins[index+1, j], xmin=(bins[0,index]-2)/8, xmax=(bins[0,index+1]-2)/8, color='blue')
+        ax.axvline(pT_edges[index], ymin=0, ymax=1, color='blue')
+    for j in np.arange(1, len(eta_edges)-1):
+        ax.axhline(eta_edges[j], xmin=(pT_edges[index]-2)/8, xmax=(pT_edges[index+1]-2)/8, color='blue')
     
 plt.savefig(f'{args.path}/2D_histogram_bins_{args.meson}_{args.polarity}_{args.year}_{args.size}.pdf')
\ No newline at end of file
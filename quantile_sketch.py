@@ -0,0 +1,122 @@
+"""
+quantile_sketch.py
+
+This code contains a mergeable quantile sketch, used to find the quantiles of a variable while reading the data in chunks, without holding all of it in memory. It is a deterministic version of the KLL sketch: the values are kept in levels, where each value in level h stands for 2^h of the original values. When a level holds more values than the capacity of the sketch, they are sorted and every other one is moved to the next level (a compaction).
+Error bound: a compaction of level h changes the rank of any value by at most 2^h, so the sketch keeps track of the sum of 2^h over all the compactions done, which is an upper bound on the rank error of any quantile it returns. A quantile q of n values is then guaranteed to be between the exact quantiles q - error/n and q + error/n. This is at most n*H/capacity, where H is the number of levels (about log2(n/capacity)), and in practice much lower as the half kept alternates between compactions. While no compaction has been done (fewer values than the capacity), the quantiles are exact and the same as the ones given by numpy and pandas.
+Two sketches of different chunks, files or polarities can be merged, and the bound of the merged sketch is the sum of the bounds of both, so the sketches can be filled in parallel and merged at the end.
+It is not meant to be run on its own, but imported by the scripts that compute quantiles.
+
+Author: Marc Oriol Pérez (marc.oriolperez@student.manchester.ac.uk)
+Last edited: 17th October 2026
+"""
+
+# - - - - - - IMPORT STATEMENTS - - - - - - #
+
+import numpy as np
+
+# - - - - - - - CLASSES - - - - - - - #
+
+class QuantileSketch:
+    '''
+    Mergeable quantile sketch with a guaranteed rank error bound (see the description of this file). The
+    capacity is the number of values held in each level before it is compacted, so a larger capacity gives a
+    smaller error at the cost of more memory (8*capacity bytes per level). Missing values (NaN) are ignored.
+    '''
+    def __init__(self, capacity=32768):
+        self.capacity = capacity
+        self.levels = []
+        self.count = 0
+        self.error = 0
+        self.minimum = np.inf
+        self.maximum = -np.inf
+        self.offset = 0
+
+    def add(self, level, values):
+        '''
+        Appends values to the given level, creating it if needed.
+        '''
+        while len(self.levels) <= level:
+            self.levels.append(np.empty(0, dtype=np.float64))
+        self.levels[level] = np.concatenate([self.levels[level], values])
+
+    def compress(self):
+        '''
+        Compacts every level holding more values than the capacity, starting from the lowest one. If a level
+        holds an odd number of values, its largest value is left in it, so that the total weight is unchanged.
+        '''
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) > self.capacity:
+                values = np.sort(self.levels[level])
+                even = len(values) - len(values)%2
+                self.levels[level] = values[even:]
+                self.add(level+1, values[self.offset:even:2])
+                self.offset ^= 1
+                self.error += 2**level
+            level += 1
+
+    def update(self, values):
+        '''
+        Adds the given values to the sketch.
+
+        Returns the sketch itself.
+        '''
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        self.count += len(values)
+        self.minimum = min(self.minimum, values.min())
+        self.maximum = max(self.maximum, values.max())
+        self.add(0, values)
+        self.compress()
+        return self
+
+    def merge(self, other):
+        '''
+        Adds all the values of another sketch to this one. The error bound of the result is the sum of the
+        bounds of both sketches.
+
+        Returns the sketch itself.
+        '''
+        for level, values in enumerate(other.levels):
+            self.add(level, values)
+        self.count += other.count
+        self.error += other.error
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self.compress()
+        return self
+
+    def quantiles(self, probabilities):
+        '''
+        Computes the quantiles of the values added for the given probabilities, interpolating linearly
+        between values (in the same way as numpy.quantile). The probabilities 0 and 1 give the exact minimum
+        and maximum.
+
+        Returns the array of quantiles.
+        '''
+        probabilities = np.asarray(probabilities, dtype=np.float64)
+        if self.count == 0:
+            return np.full(probabilities.shape, np.nan)
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2**h, dtype=np.int64) for h, level in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        values = values[order]
+        cumulative = np.cumsum(weights[order])
+
+        # a value of weight w fills w consecutive positions of the sorted original values
+        positions = probabilities*(self.count - 1)
+        below = np.searchsorted(cumulative, np.floor(positions), side="right")
+        above = np.searchsorted(cumulative, np.ceil(positions), side="right")
+        fraction = positions - np.floor(positions)
+        result = values[below]*(1 - fraction) + values[above]*fraction
+        result = np.where(probabilities <= 0, self.minimum, result)
+        return np.where(probabilities >= 1, self.maximum, result)
+
+    def relative_error(self):
+        '''
+        Returns the upper bound on the rank error of the quantiles, as a fraction of the number of values
+        added.
+        '''
+        return self.error/max(self.count, 1)
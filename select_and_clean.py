@@ -0,0 +1,233 @@
+"""
+select_and_clean.py
+
+This code runs the selection of events (see selection_of_events.py and input_reader.py), the removal of multiple candidates (see multiple_candidates.py) and the split by the flavour of the D0 meson in a single pass over the data. Only the final clean datasets are written, so the selected data does not need to be written to disk and read back in between.
+The year of interest and size of the data to be analysed must be specified using the required flags --year --size. The flag --polarity is not required, and can be used to process only one of the polarities, by default both are processed. There is a fourth flag --path, which is not required. This one is used to specify the directory where the output files should be written. By default it is set to save the files in the current working directory.
+For each polarity it outputs a single file with the D0 events followed by the D0bar events and an offsets index, which is the same as the one written by multiple_candidates.py after selection_of_events.py. A cut-flow report of the selection is written next to them. The optional flags --seed --policy --workers --step_size --cache --cache_size --format --compression have the same meaning as in selection_of_events.py and multiple_candidates.py.
+The functions in this file can also be imported and used directly, e.g. select_and_clean() returns the clean events of a list of input files without writing anything to disk.
+
+Author: Marc Oriol Pérez (marc.oriolperez@student.manchester.ac.uk)
+Last edited: 17th October 2026
+"""
+
+# - - - - - - IMPORT STATEMENTS - - - - - - #
+
+import os
+import argparse
+import awkward as ak
+from selection_cuts import merge_cutflows, save_cutflow
+from branches import pipeline_branches
+from input_reader import input_files, entry_stops, select_files
+from candidate_selection import POLICIES, choose_candidates
+from data_io import EXTENSIONS, check_format, write_data, sort_by_flavour
+
+# - - - - - - - FUNCTIONS - - - - - - - #
+
+def clean_events(data, seed=482022, policy="random"):
+    '''
+    Removes the multiple candidates in data, keeping one candidate per event chosen at random with the given
+    seed, or the best one according to the given ranking policy (see candidate_selection.py), and orders the candidates kept depending on the origin meson of the
+    decay (first D0, then D0bar, see sort_by_flavour in data_io.py).
+
+    Returns the candidates kept and the offsets index with the entries of each meson. The D0 candidates are
+    then data[slice(*offsets["D0"])], and the D0bar ones data[slice(*offsets["D0bar"])].
+    '''
+    return sort_by_flavour(data[choose_candidates(data, seed, policy)])
+
+def select_and_clean(files, stops=None, seed=482022, step_size=None, workers=1, cache=None, cache_size=50, policy="random"):
+    '''
+    Selects the events in the given input files (given as "path:tree"), removes the multiple candidates and
+    splits them by flavour, without writing anything to disk. Only the first stops[i] events of the ith file
+    are read (all of them if stops is None). If workers is larger than 1, each file is selected in its own
+    worker process, and the results are merged in the original file order.
+
+    Returns the clean events ordered by flavour, the offsets index with the entries of each flavour (see
+    clean_events), the cut-flow of the selection and the number of selected events before removing the
+    multiple candidates.
+    '''
+    selected = select_files(files, stops, step_size, pipeline_branches(), cache, cache_size, workers)
+
+    data = ak.concatenate([result[0] for result in selected])
+
+    clean, offsets = clean_events(data, seed, policy)
+
+    return clean, offsets, merge_cutflows([result[1] for result in selected]), len(data)
+
+def write_clean(path, polarity, year, size, data, offsets, fmt="root", compression=None):
+    '''
+    Writes the clean events ordered by flavour, together with their offsets index, to the file read by the
+    later stages of the analysis, in the given format and compression.
+    '''
+    filename = write_data(f"{path}/{polarity}_data_{year}_{size}_clean", data, fmt, compression, offsets)
+    print(f'Saved file {filename}.')
+
+def dir_path(string):
+    '''
+    Checks if a given string is the path to a directory.
+    If affirmative, returns the string. If negative, gives an error.
+    '''
+    if os.path.isdir(string):
+        return string
+    else:
+        raise NotADirectoryError(string)
+
+def step_size(string):
+    '''
+    Checks if a given string is a valid step size for uproot.iterate.
+    If it is an integer, returns it as a number of events. Otherwise it is returned as a memory size (e.g. "100 MB").
+    '''
+    if string.isdigit():
+        return int(string)
+    else:
+        return string
+
+def parse_arguments():
+    '''
+    Parses the arguments needed along the code. Arguments:
+
+    --year      Used to specify the year at which the data was taken the user is interested in.
+                The argument must be one of: [16, 17, 18]. These referr to 2016, 2017 & 2018, respectively.
+    --size      Used to specify the amount of events the user is interested in analysing.
+                The argument must be one of: [large, small, medium, all, 1-8]. The integers specify the number of root
+                files to be read in. Large is equivalent to 8. Medium is equivalent to 4. Small takes 200000 events.
+                All takes every file available in the production directories.
+    --polarity  Used to specify the polarity of the magnet the user is interested in.
+                The argument must be one of: [up, down]. It is not required, in the case it is not specified,
+                both polarities are processed.
+    --path      Used to specify the directory in which the output files should be written. It is not required,
+                in the case it is not specified, the default path is the current working directory.
+    --seed      Used to specify the seed used to choose at random the candidate kept in events with multiple
+                candidates. It is not required, in the case it is not specified, it is 482022.
+    --policy    Used to specify how the candidate kept in events with multiple candidates is chosen. The argument
+                must be one of: [random, probnn, ipchi2, mass] (see POLICIES in candidate_selection.py). It is not
+                required, in the case it is not specified, it is random.
+    --workers   Used to specify the number of worker processes. If it is larger than 1, each input file is read and
+                selected in a separate process. It is not required, in the case it is not specified, all the files
+                are processed one after another.
+    --step_size Used to specify the size of the chunks in which the input files are read (either a number of
+                events, e.g. 500000, or a memory size, e.g. "100 MB"). It is not required, in the case it is not
+                specified, it is 100 MB.
+    --cache     Used to specify a local directory in which the variables read from each input file are cached.
+                It is not required, in the case it is not specified, the original files are always read.
+    --cache_size
+                Used to specify the maximum size of the cache in GB. It is not required, in the case it is not
+                specified, it is 50 GB.
+    --format    Used to specify the format of the output files. The argument must be one of: [root, arrow, parquet].
+                It is not required, in the case it is not specified, root files are written.
+    --compression
+                Used to specify the compression of the output files. It is not required, in the case it is not
+                specified, the default compression of the format is used. See COMPRESSIONS in data_io.py for the
+                compressions available in each format.
+
+    Returns the parsed arguments.
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--year",
+        type=int,
+        choices=[16,17,18],
+        required=True,
+        help="flag to set the data taking year."
+    )
+    parser.add_argument(
+        "--size",
+        type=str,
+        choices=["large", "medium", "small", "all", "1", "2", "3", "4", "5", "6", "7", "8"],
+        required=True,
+        help="flag to set the data taking year."
+    )
+    parser.add_argument(
+        "--polarity",
+        type=str,
+        choices=["up","down"],
+        required=False,
+        default=None,
+        help="flag to set the data taking polarity."
+    )
+    parser.add_argument(
+        "--path",
+        type=dir_path,
+        required=False,
+        default=os.getcwd(),
+        help="flag to set the path where the output files should be written to"
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        required=False,
+        default=482022,
+        help="flag to set the seed used to choose the candidate kept in each event"
+    )
+    parser.add_argument(
+        "--policy",
+        type=str,
+        choices=list(POLICIES),
+        required=False,
+        default="random",
+        help="flag to set the policy used to choose the candidate kept in each event"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        required=False,
+        default=1,
+        help="flag to set the number of worker processes"
+    )
+    parser.add_argument(
+        "--step_size",
+        type=step_size,
+        required=False,
+        default=None,
+        help="flag to set the size of the chunks read from the input files"
+    )
+    parser.add_argument(
+        "--cache",
+        type=dir_path,
+        required=False,
+        default=None,
+        help="flag to set the directory where the input files are cached"
+    )
+    parser.add_argument(
+        "--cache_size",
+        type=float,
+        required=False,
+        default=50,
+        help="flag to set the maximum size of the cache in GB"
+    )
+    parser.add_argument(
+        "--format",
+        type=str,
+        choices=list(EXTENSIONS),
+        required=False,
+        default="root",
+        help="flag to set the format of the output files (root/arrow/parquet)"
+    )
+    parser.add_argument(
+        "--compression",
+        type=str,
+        required=False,
+        default=None,
+        help="flag to set the compression of the output files"
+    )
+
+    return parser.parse_args()
+
+# - - - - - - - MAIN BODY - - - - - - - #
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    check_format(args.format, args.compression)
+
+    FILES_UP, FILES_DOWN, MAX_EVENTS = input_files(args.year, args.size)
+    polarities = {"up": FILES_UP, "down": FILES_DOWN}
+    if args.polarity is not None:
+        polarities = {args.polarity: polarities[args.polarity]}
+
+    for polarity, files in polarities.items():
+        data, offsets, cutflow, length = select_and_clean(files, entry_stops(files, MAX_EVENTS), args.seed, args.step_size, args.workers, args.cache, args.cache_size, args.policy)
+        print(f"Number entries before multiple candidate cut = {length}")
+        print(f"Number entries after multiple candidate cut = {len(data)}")
+        write_clean(args.path, polarity, args.year, args.size, data, offsets, args.format, args.compression)
+        save_cutflow(f"{args.path}/{polarity}_data_{args.year}_{args.size}_cutflow", cutflow)
+
+    print(f'Saved {args.size} data for year 20{args.year}')
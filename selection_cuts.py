@@ -0,0 +1,315 @@
+"""
+selection_cuts.py
+
+This code contains the selection applied by selection_of_events.py, written as a declarative list of cuts. Each cut is given as (branch, operator, threshold), where the branch can be wrapped in a function (e.g. log(D0_IPCHI2_OWNPV)).
+The list of cuts is compiled into a numba kernel which evaluates all of them in one fused pass over the data, instead of building the mask with one np.logical_and per cut. If numba is not installed, the mask is built with numpy, reusing the same two boolean arrays for all the cuts.
+The number of events passing each cut is counted during the same evaluation, and can be written out as a cut-flow report together with the efficiency of each cut and the time taken by it.
+It is not meant to be run on its own, but imported by the scripts that need to apply the selection.
+
+Author: Marc Oriol Pérez (marc.oriolperez@student.manchester.ac.uk)
+Last edited: 17th October 2026
+"""
+
+# - - - - - - IMPORT STATEMENTS - - - - - - #
+
+import re
+import csv
+import json
+import time
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# - - - - - - - SELECTION - - - - - - - #
+
+# The requirements are:
+# - Particle must not be muons
+# - P1_PIDK > 5
+# - P2_PIDK < 0
+# - Both hadrons must have a positive momentum in the z direction
+# - Pseudorapidity must be between 0 and 6
+# - Transverse momentum must be between 0 GeV and 10 GeV
+# - D0_IPCHI2_OWNPV < 1
+# The cuts in EARLY_SELECTION only need a few branches and reject most of the events, so when reading the
+# data they are applied first and the rest of the branches are only kept for the events that pass them.
+EARLY_SELECTION = [
+    ("P1_isMuon", "==", 0),
+    ("P2_isMuon", "==", 0),
+    ("P1_PIDK", ">", 5),
+    ("P2_PIDK", "<", 0),
+]
+
+LATE_SELECTION = [
+    ("P1_PZ", ">", 0),
+    ("P2_PZ", ">", 0),
+    ("P1_ETA", ">", 0),
+    ("P2_ETA", ">", 0),
+    ("P1_ETA", "<", 6),
+    ("P2_ETA", "<", 6),
+    ("P1_PT", ">", 0),
+    ("P2_PT", ">", 0),
+    ("P1_PT", "<", 10000),
+    ("P2_PT", "<", 10000),
+    ("log(D0_IPCHI2_OWNPV)", "<", 1),
+]
+
+SELECTION = EARLY_SELECTION + LATE_SELECTION
+
+OPERATORS = {
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+    "==": np.equal,
+    "!=": np.not_equal,
+}
+
+FUNCTIONS = {
+    "log": np.log,
+    "abs": np.abs,
+}
+
+# selections that have already been compiled by compile_selection
+KERNELS = {}
+
+# share of the time of the fused evaluation taken by each cut, for the selections already timed by cut_shares
+CUT_SHARES = {}
+
+# - - - - - - - FUNCTIONS - - - - - - - #
+
+def parse_branch(branch):
+    '''
+    Splits a branch of the selection into the name of the function applied to it and the name of the
+    branch itself. For example "log(D0_IPCHI2_OWNPV)" gives ("log", "D0_IPCHI2_OWNPV").
+
+    Returns the function name (None if there is no function) and the branch name.
+    '''
+    match = re.fullmatch(r"(\w+)\((\w+)\)", branch)
+    if match is None:
+        return None, branch
+    if match.group(1) not in FUNCTIONS:
+        raise ValueError(f"Unsupported function in selection: {branch}")
+    return match.group(1), match.group(2)
+
+def selection_branches(selection=SELECTION):
+    '''
+    Returns the names of the branches needed to apply the selection, without repetitions and in the
+    order in which they first appear.
+    '''
+    branches = []
+    for branch, operator, threshold in selection:
+        name = parse_branch(branch)[1]
+        if name not in branches:
+            branches.append(name)
+    return branches
+
+def get_columns(data, selection=SELECTION):
+    '''
+    Gets the branches needed by the selection from data (an awkward array or any mapping of branch
+    names to arrays) as numpy arrays.
+
+    Returns a dictionary of branch name : numpy array.
+    '''
+    return {name: np.asarray(data[name]) for name in selection_branches(selection)}
+
+def cut_name(cut):
+    '''
+    Returns a cut of the selection written as a string, e.g. "P1_PIDK > 5".
+    '''
+    branch, operator, threshold = cut
+    return f"{branch} {operator} {threshold}"
+
+def compile_selection(selection=SELECTION):
+    '''
+    Compiles the selection into a numba kernel. The kernel loops once over the events and evaluates all
+    the cuts for each of them, joined with & rather than "and" so that the loop has no branches and can be
+    vectorised by the compiler. While doing so it counts the number of events that pass each cut together
+    with all the previous ones, which costs almost nothing as the counters are kept in registers.
+    The compiled kernels are stored, so each selection is only compiled once.
+
+    Returns the kernel, which takes the branches in the order given by selection_branches followed by the
+    output mask, and returns the number of events passing after each cut.
+    '''
+    key = tuple(selection)
+    if key in KERNELS:
+        return KERNELS[key]
+
+    branches = selection_branches(selection)
+    lines = [f"def kernel({', '.join(branches + ['mask'])}):"]
+    lines += [f"    n{index} = 0" for index in range(len(selection))]
+    lines.append("    passed = True")
+    lines.append("    for i in range(mask.shape[0]):")
+    lines.append("        passed = True")
+    for index, (branch, operator, threshold) in enumerate(selection):
+        function, name = parse_branch(branch)
+        value = f"{name}[i]" if function is None else f"np.{function}({name}[i])"
+        lines.append(f"        passed = passed & ({value} {operator} {threshold!r})")
+        lines.append(f"        n{index} += passed")
+    lines.append("        mask[i] = passed")
+    lines.append(f"    return ({''.join(f'n{index}, ' for index in range(len(selection)))})")
+
+    namespace = {"np": np}
+    exec("\n".join(lines) + "\n", namespace)
+    # the kernel releases the GIL, so that the polarities can be selected in parallel threads
+    KERNELS[key] = numba.njit(nogil=True)(namespace["kernel"])
+    return KERNELS[key]
+
+def cut_shares(columns, selection, sample_size=100000):
+    '''
+    The fused kernel evaluates all the cuts at once, so the time taken by each of them cannot be measured
+    directly. Instead, the first time a selection is evaluated each cut is timed on its own on the first
+    sample_size events, and the share of the total time taken by each cut is stored, so that the data is not
+    read again for every chunk.
+
+    Returns a list with the share of the time taken by each cut.
+    '''
+    key = tuple(selection)
+    if key in CUT_SHARES:
+        return CUT_SHARES[key]
+    # the shares can only be measured on some events, until then the time is shared equally
+    if len(next(iter(columns.values()))) == 0:
+        return [1/len(selection) for cut in selection]
+
+    sample_times = []
+    for branch, operator, threshold in selection:
+        function, name = parse_branch(branch)
+        start = time.perf_counter()
+        values = columns[name][:sample_size]
+        if function is not None:
+            values = FUNCTIONS[function](values)
+        OPERATORS[operator](values, threshold)
+        sample_times.append(time.perf_counter() - start)
+
+    sample_total = sum(sample_times)
+    if sample_total == 0:
+        return [1/len(selection) for cut in selection]
+    CUT_SHARES[key] = [sample_time/sample_total for sample_time in sample_times]
+    return CUT_SHARES[key]
+
+def estimate_cut_times(columns, selection, total_time):
+    '''
+    Shares the total time of the fused evaluation between the cuts, in proportion to the time taken by each of
+    them on its own (see cut_shares).
+
+    Returns a list with the estimated time taken by each cut, in seconds.
+    '''
+    return [total_time*share for share in cut_shares(columns, selection)]
+
+def evaluate_selection(data, selection=SELECTION):
+    '''
+    Evaluates the selection on data (an awkward array or any mapping of branch names to arrays) in a
+    single fused pass, keeping track of the cut-flow at the same time.
+
+    Returns a boolean numpy array which is True for the events that meet all the requirements, and the
+    cut-flow as a dictionary with the number of events evaluated ("events"), the number of events passing
+    after each cut ("passed"), the time taken by each cut ("times") and whether these times have been
+    estimated as described in estimate_cut_times ("estimated").
+    '''
+    columns = get_columns(data, selection)
+    length = len(next(iter(columns.values()))) if columns else len(data)
+    mask = np.ones(length, dtype=bool)
+    if numba is not None:
+        kernel = compile_selection(selection)
+        # numba compiles the kernel for the types of the columns on its first call, which is made on no events
+        # so that the compilation is not included in the time taken by the cuts
+        kernel(*(column[:0] for column in columns.values()), mask[:0])
+        start = time.perf_counter()
+        passed = kernel(*columns.values(), mask)
+        total_time = time.perf_counter() - start
+        times = estimate_cut_times(columns, selection, total_time)
+        return mask, {"events": length, "passed": list(passed), "times": times, "estimated": True}
+
+    # without numba, reuse the same two arrays for every cut instead of allocating new ones
+    passed = np.empty(length, dtype=bool)
+    counts = []
+    times = []
+    for branch, operator, threshold in selection:
+        start = time.perf_counter()
+        function, name = parse_branch(branch)
+        values = columns[name] if function is None else FUNCTIONS[function](columns[name])
+        OPERATORS[operator](values, threshold, out=passed)
+        np.logical_and(mask, passed, out=mask)
+        counts.append(int(np.count_nonzero(mask)))
+        times.append(time.perf_counter() - start)
+    return mask, {"events": length, "passed": counts, "times": times, "estimated": False}
+
+def selection_mask(data, selection=SELECTION):
+    '''
+    Evaluates the selection on data (an awkward array or any mapping of branch names to arrays) in a
+    single fused pass.
+
+    Returns a boolean numpy array which is True for the events that meet all the requirements.
+    '''
+    return evaluate_selection(data, selection)[0]
+
+def merge_cutflows(cutflows):
+    '''
+    Adds up the cut-flows obtained on different chunks or files of the same dataset.
+
+    Returns the merged cut-flow.
+    '''
+    return {
+        "events": sum(cutflow["events"] for cutflow in cutflows),
+        "passed": [sum(passed) for passed in zip(*(cutflow["passed"] for cutflow in cutflows))],
+        "times": [sum(times) for times in zip(*(cutflow["times"] for cutflow in cutflows))],
+        "estimated": any(cutflow["estimated"] for cutflow in cutflows),
+    }
+
+def chain_cutflows(first, second):
+    '''
+    Joins the cut-flow of a selection with the cut-flow of a second selection applied to the events that
+    passed the first one (e.g. EARLY_SELECTION followed by LATE_SELECTION).
+
+    Returns the cut-flow of both selections together.
+    '''
+    return {
+        "events": first["events"],
+        "passed": first["passed"] + second["passed"],
+        "times": first["times"] + second["times"],
+        "estimated": first["estimated"] or second["estimated"],
+    }
+
+def empty_cutflow(events, selection=SELECTION):
+    '''
+    Returns the cut-flow of a selection applied to no events, e.g. when all of them were removed by a
+    previous selection.
+    '''
+    return {"events": events, "passed": [0 for cut in selection], "times": [0.0 for cut in selection], "estimated": False}
+
+def cutflow_table(cutflow, selection=SELECTION):
+    '''
+    Builds the cut-flow report. For each cut it gives the number of events passing the cut and all the
+    previous ones, the efficiency of the cut with respect to the previous one, the cumulative efficiency
+    with respect to all the events and the time taken by the cut.
+
+    Returns a list with one dictionary per cut.
+    '''
+    rows = []
+    before = cutflow["events"]
+    for cut, passed, cut_time in zip(selection, cutflow["passed"], cutflow["times"]):
+        rows.append({
+            "cut": cut_name(cut),
+            "events": int(passed),
+            "efficiency": passed/before if before > 0 else 0.0,
+            "cumulative_efficiency": passed/cutflow["events"] if cutflow["events"] > 0 else 0.0,
+            "time": cut_time,
+        })
+        before = passed
+    return rows
+
+def save_cutflow(filename, cutflow, selection=SELECTION):
+    '''
+    Writes the cut-flow report to filename.json and filename.csv.
+    '''
+    rows = cutflow_table(cutflow, selection)
+    with open(f"{filename}.json", "w") as f:
+        json.dump({"events": cutflow["events"], "estimated_times": cutflow["estimated"], "cuts": rows}, f, indent=4)
+    with open(f"{filename}.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["cut", "events", "efficiency", "cumulative_efficiency", "time"])
+        writer.writeheader()
+        writer.writerows(rows)
+
+    return print(f"Saved cut-flow {filename}.json")
@@ -2,20 +2,25 @@
 selection_of_events.py
 
 This code is used to read in data from D0/D0bar decays to two hadrons in LHCb in the years 2016, 2017, 2018. It then proceeds to select the events that meet a set of given requirements. Finally it outputs the selected events in 2 root files. One contain data using the up polarity of the magnet, and the other the down polarity.
-The year of interest and size of the data to be analysed must be specified using the required flags --year --size. There is a third flag --path, which is not required. This one is used to specify the directory where the output files should be written. By default it is set to save the files in the current working directory.
+The year of interest and size of the data to be analysed must be specified using the required flags --year --size. There is a third flag --path, which is not required. This one is used to specify the directory where the output files should be written. By default it is set to save the files in the current working directory. The optional flag --step_size runs the selection in streaming mode, where the data is read, selected and written in chunks so that the memory used depends on the chunk size rather than on the size of the dataset. The optional flag --workers selects the input files in parallel using the given number of processes, and the optional flag --parallel_polarities processes the up and down polarities at the same time. The optional flag --incremental only selects the input files that have not been selected yet, as recorded in a manifest kept next to each output file, and appends them to the existing output. A cut-flow report with the number of events passing each requirement, its efficiency and the time taken by it is written next to each output file. The optional flag --cache keeps a local copy of the variables read from each input file, so that repeated selections do not read the original files again.
 This code is heavily inspired on the work of Camille Jarvis-Stiggants and Michael England. Here the original code has been reorganized, some comments have been added, as well as minor features to add flexibility to the code.
 
 Author: Marc Oriol Pérez (marc.oriolperez@student.manchester.ac.uk)
-Last edited: 15th September 2023
+Last edited: 17th October 2026
 """
 
 # - - - - - - - IMPORT STATEMENTS - - - - - - - #
 
 import argparse
 import uproot
-import numpy as np
 import awkward as ak
 import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from selection_cuts import SELECTION, cut_name, empty_cutflow, merge_cutflows, save_cutflow
+from branches import pipeline_branches
+from input_reader import input_files, entry_stops, read_selected, select_files
+from input_manifest import empty_manifest, load_manifest, save_manifest, compare_inputs
 
 # - - - - - - - FUNCTIONS - - - - - - - #
 
@@ -26,10 +31,39 @@ def parse_arguments():
     --year  Used to specify the year at which the data was taken the user is interested in.
             The argument must be one of: [16, 17, 18]. These referr to 2016, 2017 & 2018, respectively.
     --size  Used to specify the amount of events the user is interested in analysing.
-            The argument must be one of: [large, small, medium, 1-8]. The integers specify the number of root
+            The argument must be one of: [large, small, medium, all, 1-8]. The integers specify the number of root
             files to be read in. Large is equivalent to 8. Medium is equivalent to 4. Small takes 200000 events.
+            All takes every file available in the production directories.
     --path  Used to specify the directory in which the output files should be written. It is not required,
             in the case it is not specified, the default path is the current working directory.
+    --step_size
+            Used to run the selection in streaming mode. The input files are read in chunks of the given size
+            (either a number of events, e.g. 500000, or a memory size, e.g. "100 MB"), each chunk is selected and
+            appended to the output file. It is not required, in the case it is not specified, the files are read in
+            chunks of 100 MB and the selected events of each polarity are held in memory until they are written.
+    --workers
+            Used to specify the number of worker processes. If it is larger than 1, each input file is read and
+            selected in a separate process, and the results are merged in the original file order. It cannot be
+            used together with --step_size, as the selected events of each file are held in memory until they are
+            merged. It is not required, in the case it is not specified, all the files are processed one after another.
+    --cache Used to specify a local directory in which the variables read from each input file are cached.
+            Later runs read the cached copies instead of the original files, as long as these have not changed.
+            It is not required, in the case it is not specified, the original files are always read.
+    --cache_size
+            Used to specify the maximum size of the cache in GB. When it is exceeded, the least recently used
+            files are removed from the cache. It is not required, in the case it is not specified, it is 50 GB.
+    --parallel_polarities
+            Used to specify whether the up and down polarities should be processed at the same time. Type either
+            y or Y to do so, n or N otherwise. The selection of each polarity is run in its own process, or in its
+            own thread in streaming mode, and the output files are written in parallel threads. It is not
+            required, in the case it is not specified, the polarities are processed one after another.
+    --incremental
+            Used to specify whether the selection should be run incrementally. Type either y or Y to do so, n or
+            N otherwise. A manifest of the input files already selected is kept next to each output file, and
+            only the input files that are not in it are selected and appended to the existing output. If an
+            input file in the manifest has changed or disappeared, everything is selected again. It cannot be
+            used with the small size. It is not required, in the case it is not specified, all the input files
+            are always selected.
     
     Returns the parsed arguments.
     '''
@@ -44,7 +78,7 @@ def parse_arguments():
     parser.add_argument(
         "--size",
         type=str,
-        choices=["large", "medium", "small", "1", "2", "3", "4", "5", "6", "7", "8"],
+        choices=["large", "medium", "small", "all", "1", "2", "3", "4", "5", "6", "7", "8"],
         required=True,
         help="flag to set the data taking year."
     )
@@ -55,103 +89,134 @@ def parse_arguments():
         default=os.getcwd(),
         help="flag to set the path where the output files should be written to"
     )
+    parser.add_argument(
+        "--step_size",
+        type=step_size,
+        required=False,
+        default=None,
+        help="flag to set the chunk size used to stream the data (number of events or memory size, e.g. '100 MB')"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        required=False,
+        default=1,
+        help="flag to set the number of worker processes used to select the input files in parallel"
+    )
+    parser.add_argument(
+        "--cache",
+        type=dir_path,
+        required=False,
+        default=None,
+        help="flag to set the directory where the input files should be cached"
+    )
+    parser.add_argument(
+        "--cache_size",
+        type=float,
+        required=False,
+        default=50,
+        help="flag to set the maximum size of the cache in GB"
+    )
+    parser.add_argument(
+        "--parallel_polarities",
+        type=str,
+        choices=["y", "Y", "n", "N"],
+        required=False,
+        default="n",
+        help="flag to set whether the up and down polarities should be processed in parallel (y/n)"
+    )
+    parser.add_argument(
+        "--incremental",
+        type=str,
+        choices=["y", "Y", "n", "N"],
+        required=False,
+        default="n",
+        help="flag to set whether only the input files not selected yet should be selected (y/n)"
+    )
     
     return parser.parse_args()
 
+def select_polarity(files, entry_stops):
+    '''
+    Reads and selects all the input files of one polarity one after another (see select_files in
+    input_reader.py). Only the first entry_stops[i] events of the ith file are read (all of them if it is None).
+    
+    This is the function run by each process when the polarities are processed in parallel. Returns the
+    selected events and the cut-flow of the selection.
+    '''
+    selected = select_files(files, entry_stops, options.step_size, save_only_these_variables, options.cache, options.cache_size)
+    
+    return ak.concatenate([result[0] for result in selected]), merge_cutflows([result[1] for result in selected])
+
 def get_data():
     '''
-    Reads in the root files containing the LHCb data of D0 decays into two hadrons. It takes into
-    account the year and size requested by the user, and handles the different scenarios appropiately.
-    
-    It only reads a set of specified variables given in the main body of the code.
-    
-    Returns an array of size 2 with the data using the up polarity as the first argument, and the
-    down polarity as the second argument.
-    '''
-    tree_name = "D02Kpi_Tuple/DecayTree"
-
-    # Data from different years have different codes in their path 
-    if options.year==16:
-        code_up = "00172206"
-        code_down = "00172204"
-    elif options.year==17:
-        code_up = "00172214"
-        code_down = "00172212"
-    elif options.year==18:
-        code_up = "00172210"
-        code_down = "00172208"
-
-    # get path to directories of the requested year
-    directory_up = f"/eos/lhcb/grid/prod/lhcb/LHCb/Collision{options.year}/CHARM_D02HH_DVNTUPLE.ROOT/{code_up}/0000/"
-    directory_down = f"/eos/lhcb/grid/prod/lhcb/LHCb/Collision{options.year}/CHARM_D02HH_DVNTUPLE.ROOT/{code_down}/0000/"
-    
-    # set the number of files to concatenate depending on the size requested
-    max_events = None
-    if options.size=="small":
-        data_to_concatenate = np.arange(1, 2, 1)
-        max_events = 200000
-    elif options.size=="medium":
-        data_to_concatenate = np.arange(1, 5, 1)
-    elif options.size=="large":
-        data_to_concatenate = np.arange(1, 9, 1)
-    elif 0<int(options.size)<9:
-        data_to_concatenate = np.arange(1, int(options.size)+1, 1)
-    
-    # reads the data from the files requested by the user and concatanates it
-    data_up = uproot.concatenate((f"{directory_up}/{code_up}_0000000{i}_1.charm_d02hh_dvntuple.root:{tree_name}" for i in data_to_concatenate), expressions=read_only_these_variables, max_num_elements=max_events)
-    data_down = uproot.concatenate((f"{directory_down}/{code_down}_0000000{i}_1.charm_d02hh_dvntuple.root:{tree_name}" for i in (data_to_concatenate+1)), expressions=read_only_these_variables, max_num_elements=max_events)
-    
-    print('checkpoint: data has been read')
-    
-    return data_up, data_down
-    
-def cut_data(data):
-    '''
-    It takes data from events and makes a selection based on a set of requirements.
-    
-    The requirements are:
-    - Both hadrons must have a positive momentum in the z direction
-    - Pseudorapidity must be between 0 and 6
-    - Transverse momentum must be between 0 GeV and 10 GeV
-    - Particle must not be muons
-    - P1_PIDK > 5
-    - P2_PIDK < 0
-    - D0_IPCHI2_OWNPV < 1
-    
-    Returns the data of the events that met the requirements. It does so in an array of size 3.
-    The first argument contains events with the decay of the D0 meson, the second one contains events
-    with the decay of the D0bar meson, and the third one contains all events that met the selection
-    criteria.
-    '''
-    # select positive z-momentum and remove muons
-    length = len(data)
-    print(f"The number of events to be analysed is {length}")
-    mask = np.ones(length)
-    mask = np.logical_and(mask, data["P1_PZ"]>0)
-    mask = np.logical_and(mask, data["P2_PZ"]>0)
-    mask = np.logical_and(mask, data["P1_ETA"]>0)
-    mask = np.logical_and(mask, data["P2_ETA"]>0)
-    mask = np.logical_and(mask, data["P1_ETA"]<6)
-    mask = np.logical_and(mask, data["P2_ETA"]<6)
-    mask = np.logical_and(mask, data["P1_PT"]>0)
-    mask = np.logical_and(mask, data["P2_PT"]>0)
-    mask = np.logical_and(mask, data["P1_PT"]<10000)
-    mask = np.logical_and(mask, data["P2_PT"]<10000)
-    mask = np.logical_and(mask, data["P1_isMuon"]==0)
-    mask = np.logical_and(mask, data["P2_isMuon"]==0)
-    
-    # apply selection criteria for PID and remove secondary decays
-    
-    mask = np.logical_and(mask, data["P1_PIDK"] > 5)
-    mask = np.logical_and(mask, data["P2_PIDK"] < 0)
-    mask = np.logical_and(mask, np.log(data["D0_IPCHI2_OWNPV"]) < 1)
-    
-    # split the reconstructed particles into mesons and antimesons
-    
-    data = data[mask]
-    print('checkpoint: data has been masked')
-    
-    return data
+    Reads in the root files containing the LHCb data of D0 decays into two hadrons, as given by input_files in
+    input_reader.py, and selects the events while reading them (see select_files in input_reader.py). If more
+    than one worker has been requested by the user, every input file of both polarities is selected in its own
+    worker process. Otherwise, if the polarities are to be processed in parallel, each polarity is selected in
+    its own process. The selected events
+    are merged in the original file order, so the output does not depend on the number of processes used.
+    
+    Returns an array of size 4 with the selected data using the up polarity, the selected data using the
+    down polarity, and the cut-flows of the up and down polarities, in that order.
+    '''
+    files_up, files_down, max_events = input_files(options.year, options.size)
+    files = files_up + files_down
+    stops = entry_stops(files_up, max_events) + entry_stops(files_down, max_events)
+    
+    if options.workers == 1 and parallel_polarities:
+        # the processes are forked so that they inherit the parsed arguments and the list of variables to be read
+        with ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("fork")) as executor:
+            (data_up, cutflow_up), (data_down, cutflow_down) = executor.map(select_polarity, [files_up, files_down], [stops[:len(files_up)], stops[len(files_up):]])
+        print('checkpoint: data has been read and masked')
+        return data_up, data_down, cutflow_up, cutflow_down
+    
+    selected = select_files(files, stops, options.step_size, save_only_these_variables, options.cache, options.cache_size, options.workers)
+    
+    print('checkpoint: data has been read and masked')
+    
+    selected_up = selected[:len(files_up)]
+    selected_down = selected[len(files_up):]
+    data_up = ak.concatenate([result[0] for result in selected_up])
+    data_down = ak.concatenate([result[0] for result in selected_down])
+    
+    return data_up, data_down, merge_cutflows([result[1] for result in selected_up]), merge_cutflows([result[1] for result in selected_down])
+
+def stream_data(files, filename, max_events):
+    '''
+    Streaming version of get_data and save_file. The files are read and selected in chunks of the size given
+    by the user (see read_selected in input_reader.py) and the events that pass the selection are appended to the output file,
+    so only one chunk is held in memory at any given time. The cut-flows of all the chunks are added up and
+    written next to the output file. If no events pass the selection, the output file is written with an
+    empty tree.
+    
+    At most max_events events are read (all of them if it is None).
+    '''
+    tree = "D02Kpi_Tuple/DecayTree"
+    
+    cutflow_name = f"{options.path}/{filename}_cutflow"
+    filename = f"{options.path}/{filename}.root"
+    print(f"Streaming to {filename}...")
+    outfile = None
+    cutflows = []
+    for file, entry_stop in zip(files, entry_stops(files, max_events)):
+        for selected, cutflow in read_selected(file, entry_stop, options.step_size, save_only_these_variables, options.cache, options.cache_size):
+            cutflows.append(cutflow)
+            # the tree is created from the first chunk, even if it is empty, so that it has the right branches
+            if outfile is None:
+                outfile = uproot.recreate(filename)
+                outfile.mktree(tree, {column: ak.type(selected[column]) for column in selected.fields})
+            if len(selected) > 0:
+                outfile[tree].extend({branch: selected[branch] for branch in selected.fields})
+    
+    if outfile is None:
+        print(f"WARNING: there are no input files, {filename} has not been written")
+    else:
+        outfile.close()
+    cutflow = merge_cutflows(cutflows) if len(cutflows) > 0 else empty_cutflow(0)
+    save_cutflow(cutflow_name, cutflow)
+    
+    return print(f'Saved file {filename}. {cutflow["passed"][-1]} out of {cutflow["events"]} events were selected.')
 
 def save_file(filename, cut_data):
     '''
@@ -176,14 +241,100 @@ def save_file(filename, cut_data):
 def save_all(year, size):
     '''
     Iterates through the save_file function in order to write out all the data in two different
-    files, based on the magnet polarity..
+    files, based on the magnet polarity. The cut-flow of each polarity is written next to its data. If the
+    polarities are processed in parallel, both files are written at the same time in separate threads.
     '''
     names = ["up", "down"]
-    for index, dataset in enumerate([DATA_UP, DATA_DOWN]):
-        save_file(f'{names[index]}_data_{year}_{size}', dataset)
+    filenames = [f'{name}_data_{year}_{size}' for name in names]
+    if parallel_polarities:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(save_file, filenames, [DATA_UP, DATA_DOWN]))
+    else:
+        for index, dataset in enumerate([DATA_UP, DATA_DOWN]):
+            save_file(filenames[index], dataset)
+    for index, cutflow in enumerate([CUTFLOW_UP, CUTFLOW_DOWN]):
+        save_cutflow(f'{options.path}/{names[index]}_data_{year}_{size}_cutflow', cutflow)
     
     return print(f'Saved {size} data for year 20{year}')
 
+def append_file(filename, cut_data, existing):
+    '''
+    Appends the data in cut_data to the .root file with the name given by filename in the path specified by
+    the user. If existing is False, the file is written from scratch instead.
+    
+    As uproot cannot extend a tree that has already been written, the existing events are copied in chunks
+    to a new file, followed by the new ones. The new file only replaces the existing one once it is complete.
+    '''
+    tree = "D02Kpi_Tuple/DecayTree"
+    
+    filename = f"{options.path}/{filename}.root"
+    temporary = f"{filename}.{os.getpid()}.tmp"
+    print(f"Appending {len(cut_data)} events to {filename}...")
+    outfile = uproot.recreate(temporary)
+    outfile.mktree(tree, {column: ak.type(cut_data[column]) for column in cut_data.fields})
+    if existing:
+        for chunk in uproot.iterate(f"{filename}:{tree}", expressions=cut_data.fields, step_size="100 MB"):
+            outfile[tree].extend({branch: chunk[branch] for branch in cut_data.fields})
+    if len(cut_data) > 0:
+        outfile[tree].extend({branch: cut_data[branch] for branch in cut_data.fields})
+    outfile.close()
+    os.replace(temporary, filename)
+    
+    return print(f'Saved file {filename}.')
+
+def update_file(files, filename):
+    '''
+    Incremental version of get_data and save_file for a single polarity. The input files are compared with
+    the manifest of the output file with the name given by filename (see input_manifest.py), and only the
+    ones that are not in it are selected. The selected events are appended to the output file, in the order
+    in which the files were given, and the manifest and the cut-flow are updated.
+    
+    Everything is selected again if an input file in the manifest has changed or disappeared, if the
+    selection or the variables written out have changed, or if the output file is missing.
+    '''
+    manifest_name = f"{options.path}/{filename}_manifest"
+    manifest = load_manifest(manifest_name)
+    new_files, changed, records = compare_inputs(manifest, files)
+    
+    if len(manifest["files"]) > 0:
+        reason = None
+        if len(changed) > 0:
+            reason = f"the input files {changed} have changed since they were selected"
+        elif manifest["selection"] != [cut_name(cut) for cut in SELECTION] or manifest["branches"] != save_only_these_variables:
+            reason = "the selection or the variables written out have changed"
+        elif not os.path.exists(f"{options.path}/{filename}.root"):
+            reason = f"{options.path}/{filename}.root cannot be found"
+        if reason is not None:
+            print(f"WARNING: {reason}, all the input files will be selected again")
+            manifest = empty_manifest()
+            new_files = files
+    
+    if len(new_files) == 0:
+        return print(f"{options.path}/{filename}.root is up to date, no new input files were found")
+    
+    print(f"Selecting {len(new_files)} new input files out of {len(files)}...")
+    selected = select_files(new_files, None, options.step_size, save_only_these_variables, options.cache, options.cache_size, options.workers)
+    
+    append_file(filename, ak.concatenate([result[0] for result in selected]), existing=len(manifest["files"]) > 0)
+    
+    cutflows = [result[1] for result in selected]
+    if manifest["cutflow"] is not None:
+        cutflows = [manifest["cutflow"]] + cutflows
+    manifest["cutflow"] = merge_cutflows(cutflows)
+    manifest["selection"] = [cut_name(cut) for cut in SELECTION]
+    manifest["branches"] = save_only_these_variables
+    for file, (data, cutflow) in zip(new_files, selected):
+        path = file.rsplit(":", 1)[0]
+        manifest["files"][path] = {**records[path], "events": cutflow["events"], "selected": len(data)}
+    # files whose modification time changed without changing their contents are kept with their new state
+    for path, record in records.items():
+        manifest["files"][path].update(record)
+    
+    save_cutflow(f"{options.path}/{filename}_cutflow", manifest["cutflow"])
+    save_manifest(manifest_name, manifest)
+    
+    return print(f'{manifest["cutflow"]["passed"][-1]} out of {manifest["cutflow"]["events"]} events have been selected from {len(manifest["files"])} input files.')
+
 def dir_path(string):
     '''
     Checks if a given string is the path to a directory.
@@ -193,51 +344,56 @@ def dir_path(string):
         return string
     else:
         raise NotADirectoryError(string)
+
+def step_size(string):
+    '''
+    Checks if a given string is a valid step size for uproot.iterate.
+    If it is an integer, returns it as a number of events. Otherwise it is returned as a memory size (e.g. "100 MB").
+    '''
+    if string.isdigit():
+        return int(string)
+    else:
+        return string
         
 # - - - - - - - MAIN CODE - - - - - - - #
 
 # Create the necessary flags
 options = parse_arguments()
 
-#Variables to be read from the original root file
-read_only_these_variables = [
-    'P1_PX',
-    'P2_PX',
-    'P1_PY',
-    'P2_PY',
-    'P1_PZ',
-    'P2_PZ',
-    'P1_ETA',
-    'P2_ETA',
-    'P1_PT',
-    'P2_PT',
-    'P1_PHI',
-    'P2_PHI',
-    'D0_ETA',
-    'P1_ProbNNk',
-    'P2_ProbNNpi',
-    'P1_isMuon',
-    'P2_isMuon',
-    'P1_PIDK',
-    'P2_PIDK',
-    'P1_ID',
-    'P2_ID', 
-    'D0_MM',
-    'D0_M',
-    'D0_ID',
-    'D0_PT',
-    'D0_ETA',
-    'D0_IPCHI2_OWNPV',
-    'eventNumber',
-    'runNumber'
-]
-
-# read data in
-raw_data = get_data()
-
-# selection of events
-DATA_UP = cut_data(raw_data[0])
-DATA_DOWN = cut_data(raw_data[1])
-
-# save cut data 
-save_all(str(options.year), options.size)
+# Variables used by the later stages of the analysis, which are the only ones written out
+save_only_these_variables = pipeline_branches()
+
+parallel_polarities = options.parallel_polarities in ["y", "Y"]
+
+if options.step_size is not None and options.workers > 1:
+    raise ValueError("The streaming mode (--step_size) cannot be used with more than one worker, as the selected events of each worker are held in memory")
+
+if options.incremental in ["y", "Y"]:
+    if options.size == "small":
+        raise ValueError("The incremental selection cannot be used with the small size, as it does not read whole input files")
+    # select only the input files that have not been selected yet
+    FILES_UP, FILES_DOWN, MAX_EVENTS = input_files(options.year, options.size)
+    if parallel_polarities:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(update_file, [FILES_UP, FILES_DOWN], [f'up_data_{options.year}_{options.size}', f'down_data_{options.year}_{options.size}']))
+    else:
+        update_file(FILES_UP, f'up_data_{options.year}_{options.size}')
+        update_file(FILES_DOWN, f'down_data_{options.year}_{options.size}')
+    print(f'Saved {options.size} data for year 20{options.year}')
+elif options.step_size is not None:
+    # read, select and save the data one chunk at a time
+    FILES_UP, FILES_DOWN, MAX_EVENTS = input_files(options.year, options.size)
+    if parallel_polarities:
+        # each polarity is streamed in its own thread, as most of the time is spent reading and writing files
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(stream_data, [FILES_UP, FILES_DOWN], [f'up_data_{options.year}_{options.size}', f'down_data_{options.year}_{options.size}'], [MAX_EVENTS, MAX_EVENTS]))
+    else:
+        stream_data(FILES_UP, f'up_data_{options.year}_{options.size}', MAX_EVENTS)
+        stream_data(FILES_DOWN, f'down_data_{options.year}_{options.size}', MAX_EVENTS)
+    print(f'Saved {options.size} data for year 20{options.year}')
+else:
+    # read and select the data
+    DATA_UP, DATA_DOWN, CUTFLOW_UP, CUTFLOW_DOWN = get_data()
+    
+    # save cut data
+    save_all(str(options.year), options.size)